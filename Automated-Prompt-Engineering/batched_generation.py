@@ -0,0 +1,164 @@
+"""
+Batched Generation
+==================
+Generate responses for a whole round of candidate prompts at once instead of
+one model.generate() per variant.
+
+Prompts are sorted by length and cut into batches, so each batch carries
+little padding. Batches are left-padded (decoder-only models continue from
+the last position) and decoded greedily with the KV cache and a fixed
+max_new_tokens, so no step recomputes attention over earlier tokens and no
+call runs to the model's default max_length. Only the generated
+continuation is decoded. Rewards for a round are computed as one array.
+
+Usage:
+    python batched_generation.py --batch-sizes 1 2 4 8 16 --prompts 32 --max-new-tokens 60
+"""
+
+import time
+import argparse
+import numpy as np
+
+MIN_WORDS = 50
+
+
+def batch_rewards(responses: list, min_words: int = MIN_WORDS) -> np.ndarray:
+    """The notebook's reward over a list of responses: word count, or -1 for min_words words or fewer"""
+    counts = np.fromiter((len(response.split()) for response in responses), dtype=np.int64, count=len(responses))
+    return np.where(counts > min_words, counts, -1)
+
+
+def load_model(name: str = "gpt2"):
+    """The notebook's model and tokenizer, set up for left-padded batches"""
+    try:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+    except ImportError:
+        raise ImportError("Generation needs transformers and torch: pip install transformers torch") from None
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = AutoModelForCausalLM.from_pretrained(name)
+    model.eval()
+    return model, tokenizer
+
+
+class BatchGenerator:
+    def __init__(self, model, tokenizer, max_new_tokens: int = 80, batch_size: int = 16,
+                 do_sample: bool = False, temperature: float = 1.0):
+        """
+        model, tokenizer: a Hugging Face causal LM and its tokenizer (e.g. GPT-2)
+        max_new_tokens: generated tokens per prompt; bounds the cost of every call
+        batch_size: prompts per generate() call
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.do_sample = do_sample
+        self.temperature = temperature
+        # GPT-2 has no pad token; padding on the left keeps every prompt's last token adjacent
+        # to its first generated token
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        self.calls = 0
+
+    def _generate_batch(self, prompts: list) -> list:
+        import torch
+
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        settings = {"max_new_tokens": self.max_new_tokens, "do_sample": self.do_sample,
+                    "use_cache": True, "pad_token_id": self.tokenizer.pad_token_id}
+        if self.do_sample:
+            settings["temperature"] = self.temperature
+        with torch.inference_mode():
+            outputs = self.model.generate(**inputs, **settings)
+        self.calls += 1
+        return self.tokenizer.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    def generate(self, prompts: list) -> list:
+        """Continuations for every prompt, in input order"""
+        lengths = [len(ids) for ids in self.tokenizer(list(prompts))["input_ids"]]
+        order = sorted(range(len(prompts)), key=lengths.__getitem__)
+        responses = [None] * len(prompts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for idx, response in zip(batch, self._generate_batch([prompts[idx] for idx in batch])):
+                responses[idx] = response
+        return responses
+
+    def score(self, prompts: list, reward=batch_rewards) -> np.ndarray:
+        """Generate for every prompt and return the rewards as one array"""
+        return np.asarray(reward(self.generate(prompts)))
+
+
+def optimize_prompt(query: str, select_exemplars, mutate, generator: BatchGenerator,
+                    variants: int = 5, k: int = 1) -> tuple:
+    """
+    The notebook's optimizer with one batched round: `variants` mutations of each selected
+    exemplar are generated and scored together. Returns (best prompt, its reward).
+    """
+    candidates = [mutate(exemplar) for exemplar in select_exemplars(query, k) for _ in range(variants)]
+    rewards = generator.score(candidates)
+    best = int(np.argmax(rewards))
+    return candidates[best], int(rewards[best])
+
+
+def optimize_prompt_on_inputs(query: str, select_exemplars, mutate, generator: BatchGenerator, inputs: list,
+                              variants: int = 5, k: int = 1, eta: int = 2, min_items: int = 1) -> dict:
+    """
+    optimize_prompt over a set of eval inputs, scheduled by successive halving: every candidate
+    is generated for min_items inputs, and only the best 1/eta go on to eta times as many.
+    Candidates whose responses all get the short-output reward (-1) are dropped early.
+    Returns the scheduler report (best candidate, calls saved, best score per stage).
+    """
+    from evaluation_scheduler import SuccessiveHalvingScheduler
+
+    candidates = [mutate(exemplar) for exemplar in select_exemplars(query, k) for _ in range(variants)]
+
+    def score_items(batch, indices):
+        rewards = generator.score([f"{candidate}\n\n{inputs[j]}" for candidate in batch for j in indices])
+        return rewards.reshape(len(batch), len(indices))
+
+    scheduler = SuccessiveHalvingScheduler(len(inputs), min_items=min_items, eta=eta, floor=-1)
+    return scheduler.run(candidates, score_items)
+
+
+def benchmark(generator: BatchGenerator, prompts: list, batch_sizes: list) -> list:
+    """Prompts per second for each batch size, after one warm-up call"""
+    generator.generate(prompts[:1])
+    rows = []
+    for batch_size in batch_sizes:
+        generator.batch_size = batch_size
+        start = time.perf_counter()
+        generator.generate(prompts)
+        elapsed = time.perf_counter() - start
+        rows.append({"batch_size": batch_size, "seconds": round(elapsed, 2),
+                     "prompts_per_sec": round(len(prompts) / elapsed, 2)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure batched generation speed by batch size")
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--prompts", type=int, default=32, help="candidate prompts per measurement")
+    parser.add_argument("--max-new-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    seeds = ["Summarize the text about climate change",
+             "Explain the economic impact of AI",
+             "Describe the role of blockchain in finance"]
+    prompts = [f"{seeds[i % len(seeds)]} ({i})" for i in range(args.prompts)]
+    model, tokenizer = load_model(args.model)
+    generator = BatchGenerator(model, tokenizer, max_new_tokens=args.max_new_tokens)
+
+    rows = benchmark(generator, prompts, args.batch_sizes)
+    baseline = rows[0]["prompts_per_sec"]
+    print(f"\n{args.prompts} prompts, {args.max_new_tokens} new tokens each, model {args.model}\n")
+    print(f"{'batch size':>10}{'seconds':>10}{'prompts/s':>12}{'speedup':>10}")
+    for row in rows:
+        print(f"{row['batch_size']:>10}{row['seconds']:>10.2f}{row['prompts_per_sec']:>12.2f}"
+              f"{row['prompts_per_sec'] / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
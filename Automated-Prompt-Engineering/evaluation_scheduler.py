@@ -0,0 +1,98 @@
+"""
+Evaluation Scheduler
+====================
+Successive halving for prompt candidate evaluation. Instead of scoring every
+candidate on every eval input, all candidates are first scored on a small
+sample of inputs. The best 1/eta survive, and only survivors are scored on
+eta times as many inputs, reusing the scores they already have. This repeats
+until the survivors have been scored on the full set.
+
+Candidates at or below a floor score (e.g. the notebook reward's -1 for short
+outputs) are dropped as soon as they are seen, unless every candidate is.
+Each run reports the model calls made against a full evaluation, and the
+best score at every stage.
+"""
+
+import math
+import numpy as np
+
+
+class SuccessiveHalvingScheduler:
+    def __init__(self, n_items: int, min_items: int = 2, eta: int = 2, floor: float = None,
+                 seed: int = None):
+        """
+        n_items: size of the eval set
+        min_items: inputs every candidate is scored on in the first stage
+        eta: keep the best 1/eta of the candidates and multiply the inputs by eta each stage
+        floor: drop candidates whose mean score is at or below this
+        seed: shuffle the order inputs are sampled in (default: eval set order)
+        """
+        if eta < 2:
+            raise ValueError(f"eta must be at least 2, got {eta}")
+        self.n_items = n_items
+        self.min_items = max(1, min(min_items, n_items))
+        self.eta = eta
+        self.floor = floor
+        self.order = list(range(n_items)) if seed is None else np.random.default_rng(seed).permutation(n_items).tolist()
+
+    def run(self, candidates: list, score_items, should_stop=None) -> dict:
+        """
+        score_items(candidates, item_indices) -> (len(candidates), len(item_indices)) scores
+        should_stop() -> True to end early (e.g. out of time); survivors keep partial scores
+        """
+        if not candidates:
+            return {"best_candidate": None, "best_score": None, "fully_evaluated": False, "survivors": [],
+                    "calls": 0, "full_calls": 0, "calls_saved": 0, "saved_fraction": 0.0, "stages": []}
+        alive = np.arange(len(candidates))
+        sums = np.zeros(len(candidates))
+        scored, budget = 0, self.min_items
+        calls = 0
+        stages = []
+        while len(alive):
+            indices = self.order[scored:budget]
+            block = np.asarray(score_items([candidates[i] for i in alive], indices), dtype=float)
+            sums[alive] += block.reshape(len(alive), len(indices)).sum(axis=1)
+            calls += len(alive) * len(indices)
+            means = sums[alive] / budget
+            ranked = np.argsort(-means, kind="stable")
+            stages.append({
+                "stage": len(stages),
+                "candidates": len(alive),
+                "items": budget,
+                "calls": len(alive) * len(indices),
+                "best_score": round(float(means[ranked[0]]), 4),
+                "best_candidate": candidates[alive[ranked[0]]],
+            })
+            if budget >= self.n_items or (should_stop is not None and should_stop()):
+                break
+
+            keep = ranked[:max(1, math.ceil(len(alive) / self.eta))]
+            if self.floor is not None and np.any(means[keep] > self.floor):
+                keep = keep[means[keep] > self.floor]
+            alive = alive[keep]
+            scored = budget
+            budget = self.n_items if len(alive) == 1 else min(self.n_items, budget * self.eta)
+
+        final = sums[alive] / budget
+        best = int(np.argmax(final))
+        full_calls = len(candidates) * self.n_items
+        return {
+            "best_candidate": candidates[alive[best]],
+            "best_score": float(final[best]),
+            "fully_evaluated": budget >= self.n_items,
+            "survivors": [candidates[i] for i in alive],
+            "calls": calls,
+            "full_calls": full_calls,
+            "calls_saved": full_calls - calls,
+            "saved_fraction": round(1 - calls / full_calls, 4) if full_calls else 0.0,
+            "stages": stages,
+        }
+
+
+def print_report(report: dict):
+    """Per-stage survivors and best score, then the calls saved"""
+    for stage in report["stages"]:
+        print(f"stage {stage['stage']}: {stage['candidates']:>4} candidates x {stage['items']:>4} inputs "
+              f"({stage['calls']} calls), best {stage['best_score']}")
+    print(f"{report['calls']} calls instead of {report['full_calls']} "
+          f"({report['calls_saved']} saved, {report['saved_fraction']:.0%})")
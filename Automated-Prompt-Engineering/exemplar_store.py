@@ -0,0 +1,383 @@
+"""
+Exemplar Store
+==============
+Disk-backed exemplar retrieval for select_exemplars.
+
+Exemplar embeddings are computed once, in batches, and appended to a raw
+float16 (or float32) file that is memory-mapped on open. Texts are keyed by
+hash, so adding an exemplar that is already stored costs nothing, and a
+restarted process reuses every embedding already on disk.
+
+Queries are deduplicated and encoded in one batched call, then scored as a
+matrix product against the store in fixed-size blocks, keeping a running
+top-k per query. For large stores, build_index() trains an inverted-file
+index (spherical k-means over the embeddings): each query then scans only
+the rows of its nprobe nearest clusters. Rows added after the index was built
+are still searched exactly.
+
+Usage:
+    python exemplar_store.py add exemplars.txt --store exemplar_store --index
+    python exemplar_store.py query "Explain the impact of AI in healthcare" --store exemplar_store -k 3
+    python exemplar_store.py bench --exemplars 1000000 --queries 10000
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+
+DEFAULT_EMBEDDER = "all-MiniLM-L6-v2"
+
+# Rows and queries scored per matrix product; bounds the score block to ~64 MB
+ROW_BLOCK = 16384
+QUERY_BLOCK = 1024
+
+
+def load_embedder(name: str = DEFAULT_EMBEDDER, device: str = "cpu"):
+    """The sentence-transformers model the notebook uses, loaded on first need"""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Encoding exemplars needs sentence-transformers: pip install sentence-transformers") from None
+    return SentenceTransformer(name, device=device)
+
+
+def text_hash(text: str) -> int:
+    """Stable 64-bit key for an exemplar text"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _block_top_k(scores: np.ndarray, row_ids: np.ndarray, k: int) -> tuple:
+    """The k best (unsorted) scores and row ids of each query's row of a score block"""
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, 1), row_ids[top]
+    return scores, np.broadcast_to(row_ids, scores.shape)
+
+
+def _merge_top_k(scores: np.ndarray, ids: np.ndarray, block: tuple, k: int) -> tuple:
+    """Fold a block's (scores, ids) candidates into the running top-k of the same queries"""
+    scores = np.concatenate([scores, block[0]], 1)
+    ids = np.concatenate([ids, block[1]], 1)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, top, 1), np.take_along_axis(ids, top, 1)
+
+
+class ExemplarStore:
+    def __init__(self, path: str, embedder=None, dtype: str = "float16"):
+        """
+        path: directory holding the store (created if missing)
+        embedder: object with encode(texts, batch_size=..., convert_to_numpy=True,
+            normalize_embeddings=True), e.g. a SentenceTransformer; only needed to add or query by text
+        dtype: float16 halves disk and memory; scores are always computed in float32
+        """
+        self.path = path
+        self.embedder = embedder
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_json("meta.json") or {"dim": None, "dtype": dtype, "count": 0, "embedder": None}
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.count = meta["count"]
+        self.embedder_name = meta["embedder"]
+        hashes = self._read_array("hashes.bin", np.uint64)
+        self._ids = dict(zip(hashes.tolist(), range(len(hashes))))
+        self._embeddings = None
+        self._ivf = self._load_index()
+
+    def __len__(self):
+        return self.count
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_json(self, name: str):
+        if not os.path.exists(self._file(name)):
+            return None
+        with open(self._file(name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, name: str, data: dict):
+        tmp = self._file(name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._file(name))
+
+    def _read_array(self, name: str, dtype) -> np.ndarray:
+        """First `count` entries of an append-only binary file (a crash may leave a longer tail)"""
+        if not self.count:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=(self.count,))
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """(count, dim) read-only memory map of the stored unit vectors"""
+        if self._embeddings is None and self.count:
+            self._embeddings = np.memmap(self._file("embeddings.bin"), dtype=self.dtype, mode="r",
+                                         shape=(self.count, self.dim))
+        return self._embeddings
+
+    def encode(self, texts: list, batch_size: int = 256) -> np.ndarray:
+        """Unit float32 embeddings for texts, in one batched call to the embedder"""
+        if self.embedder is None:
+            raise ValueError("This store was opened without an embedder; pass one to add or query by text")
+        vectors = self.embedder.encode(list(texts), batch_size=batch_size, convert_to_numpy=True,
+                                       normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def add(self, texts, batch_size: int = 256, chunk: int = 65536) -> list:
+        """Store new exemplars (texts already present are skipped) and return the id of every text"""
+        ids, fresh = [], {}
+        for text in texts:
+            key = text_hash(text)
+            if key not in self._ids and key not in fresh:
+                fresh[key] = (self.count + len(fresh), text)
+            ids.append(self._ids[key] if key in self._ids else fresh[key][0])
+
+        pending = list(fresh.items())
+        for start in range(0, len(pending), chunk):
+            block = pending[start:start + chunk]
+            vectors = self.encode([text for _, (_, text) in block], batch_size)
+            self._append([key for key, _ in block], [text for _, (_, text) in block], vectors)
+        return ids
+
+    def _append(self, keys: list, texts: list, vectors: np.ndarray):
+        """Append rows to the data files, then commit them by bumping the count in meta.json"""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.embedder_name = getattr(self.embedder, "name", None) or type(self.embedder).__name__
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match the store's {self.dim}")
+
+        end = self._text_end()
+        with open(self._file("texts.jsonl"), "ab") as f:
+            # Drop text lines a crash left past the committed count; in append mode tell() would
+            # still report the old end, so the starts are counted from `end`
+            f.truncate(end)
+            starts = []
+            for text in texts:
+                line = json.dumps(text, ensure_ascii=False).encode("utf-8") + b"\n"
+                starts.append(end)
+                f.write(line)
+                end += len(line)
+        for name, data in (("embeddings.bin", vectors.astype(self.dtype)),
+                           ("hashes.bin", np.array(keys, dtype=np.uint64)),
+                           ("offsets.bin", np.array(starts, dtype=np.uint64))):
+            with open(self._file(name), "ab") as f:
+                f.truncate(self.count * data.itemsize * (self.dim if name == "embeddings.bin" else 1))
+                data.tofile(f)
+
+        for row, key in enumerate(keys, self.count):
+            self._ids[key] = row
+        self.count += len(keys)
+        self._embeddings = None
+        self._write_json("meta.json", {"dim": self.dim, "dtype": self.dtype.name, "count": self.count,
+                                       "embedder": self.embedder_name})
+
+    def _text_end(self) -> int:
+        """Byte offset just past the last committed text"""
+        if not self.count:
+            return 0
+        last = int(self._read_array("offsets.bin", np.uint64)[-1])
+        with open(self._file("texts.jsonl"), "rb") as f:
+            f.seek(last)
+            return last + len(f.readline())
+
+    def texts(self, ids) -> list:
+        """Exemplar texts for row ids"""
+        offsets = self._read_array("offsets.bin", np.uint64)
+        with open(self._file("texts.jsonl"), "rb") as f:
+            result = []
+            for row in ids:
+                f.seek(int(offsets[row]))
+                result.append(json.loads(f.readline()))
+        return result
+
+    # Inverted-file index
+
+    def build_index(self, nlist: int = None, iterations: int = 10, sample: int = 64, seed: int = 0):
+        """
+        Cluster the stored embeddings into nlist lists (default sqrt(count)) with spherical
+        k-means trained on up to nlist*sample rows, and persist the centroids and row lists
+        """
+        if not self.count:
+            raise ValueError("Cannot index an empty store")
+        nlist = max(1, min(nlist or int(self.count ** 0.5), self.count))
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(rng.choice(self.count, min(self.count, nlist * sample), replace=False))
+        train = np.asarray(self.embeddings[train_rows], dtype=np.float32)
+        centroids = train[rng.choice(len(train), nlist, replace=False)]
+        for _ in range(iterations):
+            assign = self._assign(train, centroids)
+            by_cluster = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            filled = np.flatnonzero(counts)
+            sums = np.zeros_like(centroids)
+            sums[filled] = np.add.reduceat(train[by_cluster], (np.cumsum(counts) - counts)[filled])
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assign = np.concatenate([
+            self._assign(np.asarray(self.embeddings[start:start + ROW_BLOCK], dtype=np.float32), centroids)
+            for start in range(0, self.count, ROW_BLOCK)
+        ])
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        np.save(self._file("ivf_centroids.npy"), centroids.astype(np.float32))
+        np.save(self._file("ivf_order.npy"), order)
+        np.save(self._file("ivf_offsets.npy"), offsets)
+        self._write_json("ivf.json", {"nlist": nlist, "indexed": self.count})
+        self._ivf = self._load_index()
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    def _load_index(self):
+        info = self._read_json("ivf.json")
+        if info is None or info["indexed"] > self.count:
+            return None
+        return {
+            "indexed": info["indexed"],
+            "centroids": np.load(self._file("ivf_centroids.npy")),
+            "order": np.load(self._file("ivf_order.npy"), mmap_mode="r"),
+            "offsets": np.load(self._file("ivf_offsets.npy")),
+        }
+
+    # Search
+
+    def search_vectors(self, queries: np.ndarray, k: int = 1, nprobe: int = 8) -> tuple:
+        """
+        Top-k stored rows for each unit query vector.
+        Returns (scores, ids), both (len(queries), k), best first; ids are -1 past the store size.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if not self.count or not len(queries):
+            return scores, ids
+        exact_from = 0
+        if self._ivf is not None:
+            scores, ids = self._search_ivf(queries, k, nprobe, scores, ids)
+            exact_from = self._ivf["indexed"]
+        for q0 in range(0, len(queries), QUERY_BLOCK):
+            q1 = q0 + QUERY_BLOCK
+            for r0 in range(exact_from, self.count, ROW_BLOCK):
+                r1 = min(r0 + ROW_BLOCK, self.count)
+                block = np.asarray(self.embeddings[r0:r1], dtype=np.float32)
+                top = _block_top_k(queries[q0:q1] @ block.T, np.arange(r0, r1), k)
+                scores[q0:q1], ids[q0:q1] = _merge_top_k(scores[q0:q1], ids[q0:q1], top, k)
+        rank = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(scores, rank, 1), np.take_along_axis(ids, rank, 1)
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int, scores: np.ndarray,
+                    ids: np.ndarray) -> tuple:
+        """Scan each indexed cluster once for all the queries that probe it"""
+        centroids, order, offsets = self._ivf["centroids"], self._ivf["order"], self._ivf["offsets"]
+        nprobe = min(nprobe, len(centroids))
+        centroid_scores = queries @ centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe].ravel()
+        probing = np.repeat(np.arange(len(queries)), nprobe)
+        by_cluster = np.argsort(probes, kind="stable")
+        clusters, starts = np.unique(probes[by_cluster], return_index=True)
+        for cluster, start, end in zip(clusters, starts, list(starts[1:]) + [len(by_cluster)]):
+            rows = np.asarray(order[offsets[cluster]:offsets[cluster + 1]])
+            if not len(rows):
+                continue
+            members = probing[by_cluster[start:end]]
+            vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+            top = _block_top_k(queries[members] @ vectors.T, rows, k)
+            scores[members], ids[members] = _merge_top_k(scores[members], ids[members], top, k)
+        return scores, ids
+
+    def search(self, queries: list, k: int = 1, batch_size: int = 256, nprobe: int = 8) -> tuple:
+        """Encode the distinct queries in one batch and return (scores, ids) per query"""
+        distinct = list(dict.fromkeys(queries))
+        position = {query: idx for idx, query in enumerate(distinct)}
+        scores, ids = self.search_vectors(self.encode(distinct, batch_size), k, nprobe)
+        rows = [position[query] for query in queries]
+        return scores[rows], ids[rows]
+
+    def select(self, queries: list, k: int = 1, batch_size: int = 256, nprobe: int = 8) -> list:
+        """The k most similar exemplar texts for each query"""
+        _, ids = self.search(queries, k, batch_size, nprobe)
+        return [self.texts([row for row in query_ids if row >= 0]) for query_ids in ids.tolist()]
+
+
+def benchmark(exemplars: int, queries: int, dim: int, k: int, nprobe: int, seed: int = 0) -> dict:
+    """Time indexing and top-k search on random unit vectors (no embedder needed)"""
+    import tempfile
+
+    rng = np.random.default_rng(seed)
+
+    def unit(n):
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    with tempfile.TemporaryDirectory(prefix="exemplar-bench-") as path:
+        store = ExemplarStore(path)
+        start = time.perf_counter()
+        for chunk in range(0, exemplars, 262144):
+            n = min(262144, exemplars - chunk)
+            store._append(list(range(chunk, chunk + n)), [""] * n, unit(n))
+        added = time.perf_counter() - start
+        query_vectors = unit(queries)
+
+        start = time.perf_counter()
+        store.search_vectors(query_vectors[:min(queries, 1000)], k)
+        exact = (time.perf_counter() - start) * queries / min(queries, 1000)
+
+        start = time.perf_counter()
+        store.build_index()
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        store.search_vectors(query_vectors, k, nprobe)
+        searched = time.perf_counter() - start
+        return {"exemplars": exemplars, "queries": queries, "dim": dim, "store_seconds": round(added, 2),
+                "exact_search_seconds_est": round(exact, 2), "index_seconds": round(indexed, 2),
+                "ivf_search_seconds": round(searched, 2), "nlist": store._ivf["centroids"].shape[0],
+                "nprobe": nprobe}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Disk-backed exemplar store for exemplar selection")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add exemplars, one per line, from a text file")
+    add.add_argument("file")
+    add.add_argument("--index", action="store_true", help="rebuild the inverted-file index afterwards")
+    query = commands.add_parser("query", help="print the nearest exemplars for a query")
+    query.add_argument("query")
+    query.add_argument("-k", type=int, default=3)
+    for command in (add, query):
+        command.add_argument("--store", default="exemplar_store")
+        command.add_argument("--model", default=DEFAULT_EMBEDDER)
+    bench = commands.add_parser("bench", help="time search on random vectors")
+    bench.add_argument("--exemplars", type=int, default=1000000)
+    bench.add_argument("--queries", type=int, default=10000)
+    bench.add_argument("--dim", type=int, default=384)
+    bench.add_argument("-k", type=int, default=3)
+    bench.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print(json.dumps(benchmark(args.exemplars, args.queries, args.dim, args.k, args.nprobe), indent=2))
+        return
+    store = ExemplarStore(args.store, load_embedder(args.model))
+    if args.command == "add":
+        with open(args.file, encoding="utf-8") as f:
+            before = len(store)
+            store.add(line.strip() for line in f if line.strip())
+        print(f"Added {len(store) - before} new exemplars ({len(store)} stored)")
+        if args.index:
+            store.build_index()
+            print(f"Indexed {len(store)} exemplars")
+    else:
+        scores, ids = store.search([args.query], args.k)
+        for score, text in zip(scores[0], store.texts([row for row in ids[0] if row >= 0])):
+            print(f"{score:.3f}  {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+Prompt Search
+=============
+A reusable version of the notebook's mutate -> generate -> reward loop.
+
+The three parts are pluggable:
+    mutations   callables (words, rng) -> words, e.g. SynonymMutation, drop_word, swap_words
+    scorer      object with score(pairs) -> one score per (candidate, eval item) pair
+                (None for a pair whose model call failed),
+                e.g. GenerationScorer (local model + reward) or TechniqueScorer (a
+                ZeroShotPrompting / FewShotPrompting model call checked against a label)
+    strategy    BeamSearch, EvolutionarySearch or SuccessiveHalving
+
+Candidates are normalized and each (candidate, item) pair is scored at most
+once per search: repeats come from the cache. Missing pairs are cut into
+batches and scored concurrently on a thread pool. The search stops when the
+strategy finishes, the time budget runs out or the evaluation limit is
+reached. SuccessiveHalving runs through evaluation_scheduler and reports the
+(candidate, item) calls it saved against scoring every candidate on every
+item.
+
+A candidate is a str.format template over the eval item's fields (items that
+are not dicts are available as {input}). Words containing placeholders are
+never mutated.
+
+Usage:
+    python prompt_search.py --task few_shot_sentiment --strategy beam --time-budget 120
+    python prompt_search.py --task zero_shot_classification --strategy halving --candidates 32
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+TECHNIQUES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "prompt-techniques")
+EVAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval")
+
+DEFAULT_PHRASES = (
+    "Answer with the label only.",
+    "Be precise.",
+    "Think carefully before answering.",
+    "Use exactly one of the given options.",
+)
+
+
+def normalize(prompt: str) -> str:
+    """Collapse runs of spaces so trivially different candidates share a cache entry"""
+    return re.sub(r"[ \t]+", " ", prompt).strip()
+
+
+def render(candidate: str, item) -> str:
+    """Fill a candidate template with an eval item's fields"""
+    fields = item if isinstance(item, dict) else {"input": item}
+    return candidate.format(**fields)
+
+
+# Mutation operators
+
+def placeholders(prompt: str) -> set:
+    """The {field} names a candidate template uses"""
+    return set(re.findall(r"\{(\w+)\}", prompt))
+
+
+def _editable(word: str) -> bool:
+    return bool(word) and "{" not in word and "}" not in word
+
+
+def drop_word(words: list, rng: random.Random) -> list:
+    """Remove one editable word"""
+    positions = [i for i, word in enumerate(words) if _editable(word)]
+    if len(positions) < 2:
+        return words
+    drop = rng.choice(positions)
+    return words[:drop] + words[drop + 1:]
+
+
+def swap_words(words: list, rng: random.Random) -> list:
+    """Exchange two editable words"""
+    positions = [i for i, word in enumerate(words) if _editable(word)]
+    if len(positions) < 2:
+        return words
+    i, j = rng.sample(positions, 2)
+    words = list(words)
+    words[i], words[j] = words[j], words[i]
+    return words
+
+
+class PhraseMutation:
+    def __init__(self, phrases=DEFAULT_PHRASES):
+        """Append one instruction phrase the candidate doesn't already contain"""
+        self.phrases = list(phrases)
+
+    def __call__(self, words: list, rng: random.Random) -> list:
+        text = " ".join(words)
+        options = [phrase for phrase in self.phrases if phrase not in text]
+        return words + rng.choice(options).split(" ") if options else words
+
+
+@functools.lru_cache(maxsize=None)
+def wordnet_synonyms(word: str) -> tuple:
+    """
+    Single-word replacements for a word: the first lemma of each WordNet synset, as stored by
+    synonym_table, so live lookups and SynonymTable.synonyms offer the same choices
+    """
+    from synonym_table import wordnet_candidates, single_word_synonyms
+
+    try:
+        names = wordnet_candidates(word)
+    except (ImportError, LookupError):
+        # LookupError: nltk is installed but the wordnet corpus was never downloaded
+        raise ImportError("Synonym mutations need nltk with the wordnet corpus: "
+                          "pip install nltk && python -m nltk.downloader wordnet") from None
+    return single_word_synonyms(word, names)
+
+
+def match_case(word: str, like: str) -> str:
+    """word in the capitalization of `like` (UPPER, Capitalized or as is)"""
+    if len(like) > 1 and like.isupper():
+        return word.upper()
+    if like[:1].isupper():
+        return word[:1].upper() + word[1:]
+    return word
+
+
+class SynonymMutation:
+    def __init__(self, synonyms=wordnet_synonyms, rate: float = 0.3):
+        """
+        synonyms: callable word -> sequence of replacements
+        rate: chance of replacing each editable word (at least one is always tried)
+        """
+        self.synonyms = synonyms
+        self.rate = rate
+
+    def __call__(self, words: list, rng: random.Random) -> list:
+        words = list(words)
+        positions = [i for i, word in enumerate(words) if _editable(word)]
+        chosen = [i for i in positions if rng.random() < self.rate]
+        if not chosen and positions:
+            chosen = [rng.choice(positions)]
+        for i in chosen:
+            core = words[i].strip(".,;:!?\"'")
+            options = self.synonyms(core.lower()) if core else ()
+            if options:
+                words[i] = words[i].replace(core, match_case(rng.choice(options), core), 1)
+        return words
+
+
+# Scorers
+
+class GenerationScorer:
+    def __init__(self, generator, reward=None):
+        """Score rendered candidates by generating with a BatchGenerator and applying a batch reward"""
+        from batched_generation import batch_rewards
+
+        self.generator = generator
+        self.reward = reward or batch_rewards
+
+    def score(self, pairs: list) -> list:
+        prompts = [render(candidate, item) for candidate, item in pairs]
+        return [float(score) for score in self.generator.score(prompts, self.reward)]
+
+
+def label_match(output: str, item: dict) -> float:
+    """1.0 when the first line of the output names the item's expected label"""
+    first_line = (output or "").strip().splitlines()[:1]
+    found = first_line and re.search(rf"\b{re.escape(item['label'])}\b", first_line[0], re.IGNORECASE)
+    return 1.0 if found else 0.0
+
+
+class TechniqueScorer:
+    def __init__(self, technique, build_prompt, metric=label_match, temperature: float = 0.0,
+                 max_tokens: int = 64):
+        """
+        technique: a prompting class instance with acall_model (e.g. ZeroShotPrompting)
+        build_prompt(candidate, item) -> the full prompt sent to the model
+        metric(output, item) -> score for one item
+        """
+        self.technique = technique
+        self.build_prompt = build_prompt
+        self.metric = metric
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    async def _ascore(self, pairs: list) -> list:
+        LLMError = _technique_module("llm_client").LLMError
+        errors = []
+
+        async def one(candidate, item):
+            try:
+                output = await self.technique.acall_model(self.build_prompt(candidate, item),
+                                                          temperature=self.temperature, max_tokens=self.max_tokens)
+            except LLMError as e:
+                errors.append(e)
+                return None
+            return self.metric(output, item)
+
+        scores = await asyncio.gather(*(one(candidate, item) for candidate, item in pairs))
+        if pairs and len(errors) == len(pairs):
+            # Nothing got through (bad key, unreachable endpoint): stop the search instead of scoring it
+            raise errors[0]
+        return scores
+
+    def score(self, pairs: list) -> list:
+        """Metric per pair, or None where the model call failed; raises when every call failed"""
+        return asyncio.run(self._ascore(pairs))
+
+
+def _technique_module(name: str):
+    """Import a module from the sibling prompt-techniques directory"""
+    if TECHNIQUES_DIR not in sys.path:
+        sys.path.insert(0, TECHNIQUES_DIR)
+    return importlib.import_module(name)
+
+
+def zero_shot_classification_task() -> tuple:
+    """(scorer, seed candidates) tuning the ZeroShotPrompting topic classification instruction"""
+    zero_shot = _technique_module("zero_shot_prompting").ZeroShotPrompting()
+
+    def build_prompt(candidate, item):
+        return f'{render(candidate, item)}\n\nArticle: "{item["article"]}"\n\nCategory:'
+
+    seeds = ["Classify the following article into one of these categories: {categories}"]
+    return TechniqueScorer(zero_shot, build_prompt), seeds
+
+
+def few_shot_sentiment_task() -> tuple:
+    """(scorer, seed candidates) tuning the instruction in front of FewShotPrompting's sentiment examples"""
+    module = _technique_module("few_shot_prompting")
+    instruction, examples = module.SENTIMENT_TEMPLATE.prefix.split("\n\n", 1)
+
+    def build_prompt(candidate, item):
+        return f"{render(candidate, item)}\n\n{examples}{module.SENTIMENT_TEMPLATE.suffix.format(**item)}"
+
+    return TechniqueScorer(module.FewShotPrompting(), build_prompt), [instruction]
+
+
+TASKS = {
+    "zero_shot_classification": (zero_shot_classification_task, "topics.jsonl"),
+    "few_shot_sentiment": (few_shot_sentiment_task, "sentiment.jsonl"),
+}
+
+
+# Engine
+
+class PromptSearch:
+    def __init__(self, scorer, items: list, mutations: list = None, workers: int = 4,
+                 batch_size: int = 16, time_budget: float = None, max_evaluations: int = None,
+                 seed: int = 0):
+        """
+        items: eval items every candidate is scored on (use [""] for prompts scored on their own)
+        workers: threads scoring batches of (candidate, item) pairs concurrently
+        time_budget: seconds; strategies stop starting new rounds once it is spent
+        max_evaluations: cap on scored (candidate, item) pairs
+        """
+        self.scorer = scorer
+        self.items = list(items)
+        self.mutations = mutations or [SynonymMutation(), drop_word, swap_words, PhraseMutation()]
+        self.workers = workers
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.max_evaluations = max_evaluations
+        self.rng = random.Random(seed)
+        self.cache = {}
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.history = []
+        self.schedule = None
+        self.best_prompt = None
+        self.best_score = -float("inf")
+        self._deadline = None
+        self._started = None
+
+    def exhausted(self) -> bool:
+        """True once the time budget or evaluation cap is used up"""
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return True
+        return self.max_evaluations is not None and self.evaluations >= self.max_evaluations
+
+    def mutate(self, prompt: str) -> str:
+        """Apply one randomly chosen mutation operator"""
+        operator = self.rng.choice(self.mutations)
+        return normalize(" ".join(operator(prompt.split(" "), self.rng)))
+
+    def crossover(self, first: str, second: str) -> str:
+        """Head of one candidate joined to the tail of another; falls back to the first if a placeholder is lost"""
+        a, b = first.split(" "), second.split(" ")
+        child = normalize(" ".join(a[:self.rng.randint(1, len(a))] + b[self.rng.randint(0, len(b) - 1):]))
+        return child if placeholders(child) == placeholders(first) else first
+
+    @staticmethod
+    def unique(prompts, exclude=()) -> list:
+        """Normalized candidates without repeats, in first-seen order"""
+        seen = set(exclude)
+        result = []
+        for prompt in map(normalize, prompts):
+            if prompt not in seen:
+                seen.add(prompt)
+                result.append(prompt)
+        return result
+
+    def evaluate_items(self, prompts: list, indices: list) -> np.ndarray:
+        """
+        (len(prompts), len(indices)) scores of each candidate on the given eval items. Pairs the
+        scorer failed on are NaN and stay out of the cache, so a later evaluation retries them.
+        """
+        prompts = [normalize(prompt) for prompt in prompts]
+        wanted = [(prompt, j) for prompt in prompts for j in indices]
+        missing = list(dict.fromkeys(key for key in wanted if key not in self.cache))
+        self.cache_hits += len(wanted) - len(missing)
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        score_batch = lambda batch: self.scorer.score([(prompt, self.items[j]) for prompt, j in batch])
+        failed = set()
+        with ThreadPoolExecutor(self.workers) as pool:
+            for batch, scores in zip(batches, pool.map(score_batch, batches)):
+                for key, score in zip(batch, scores):
+                    if score is None:
+                        failed.add(key)
+                    else:
+                        self.cache[key] = float(score)
+        self.evaluations += len(missing) - len(failed)
+        self.failures += len(failed)
+        return np.array([[self.cache.get((prompt, j), np.nan) for j in indices] for prompt in prompts]).reshape(
+            len(prompts), len(indices))
+
+    def evaluate(self, prompts: list, n_items: int = None) -> np.ndarray:
+        """Mean score of each candidate over the first n_items eval items (default all); -inf if any failed"""
+        n_items = len(self.items) if n_items is None else min(n_items, len(self.items))
+        prompts = [normalize(prompt) for prompt in prompts]
+        means = self.evaluate_items(prompts, list(range(n_items))).mean(axis=1)
+        means[np.isnan(means)] = -np.inf
+        if n_items == len(self.items) and len(prompts):
+            best = int(np.argmax(means))
+            if means[best] > self.best_score:
+                self.best_score, self.best_prompt = float(means[best]), prompts[best]
+        return means
+
+    def log(self, strategy: str, round_number: int, candidates: int, n_items: int, scores: np.ndarray):
+        """Record one round's progress"""
+        self.history.append({
+            "strategy": strategy,
+            "round": round_number,
+            "candidates": candidates,
+            "items": n_items,
+            "round_best": round(float(np.max(scores)), 4) if len(scores) else None,
+            "best_score": round(self.best_score, 4) if self.best_prompt is not None else None,
+            "evaluations": self.evaluations,
+            "elapsed": round(time.monotonic() - self._started, 2),
+        })
+
+    def run(self, seeds: list, strategy) -> dict:
+        """Search from the seed candidates with a strategy and return the best full-eval candidate"""
+        self._started = time.monotonic()
+        self._deadline = self._started + self.time_budget if self.time_budget else None
+        strategy.search(self, self.unique(seeds))
+        return {
+            "best_prompt": self.best_prompt,
+            "best_score": self.best_score,
+            "evaluations": self.evaluations,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "elapsed": round(time.monotonic() - self._started, 2),
+            "history": self.history,
+            **({"schedule": self.schedule} if self.schedule is not None else {}),
+        }
+
+
+# Strategies
+
+class BeamSearch:
+    def __init__(self, width: int = 4, expansions: int = 4, rounds: int = 10):
+        """Keep the `width` best candidates; each round adds `expansions` mutations of every one"""
+        self.width = width
+        self.expansions = expansions
+        self.rounds = rounds
+
+    def search(self, engine: PromptSearch, seeds: list):
+        beam = seeds
+        scores = engine.evaluate(beam)
+        engine.log("beam", 0, len(beam), len(engine.items), scores)
+        for round_number in range(1, self.rounds + 1):
+            if engine.exhausted():
+                break
+            children = engine.unique([engine.mutate(prompt) for prompt in beam for _ in range(self.expansions)],
+                                     exclude=beam)
+            child_scores = engine.evaluate(children)
+            pool, pool_scores = beam + children, np.concatenate([scores, child_scores])
+            keep = np.argsort(-pool_scores, kind="stable")[:self.width]
+            beam, scores = [pool[i] for i in keep], pool_scores[keep]
+            engine.log("beam", round_number, len(children), len(engine.items), child_scores)
+
+
+class EvolutionarySearch:
+    def __init__(self, population: int = 16, generations: int = 10, elite: int = 2, tournament: int = 3,
+                 crossover_rate: float = 0.3):
+        """Tournament selection, crossover and mutation; the `elite` best survive unchanged"""
+        self.population = population
+        self.generations = generations
+        self.elite = elite
+        self.tournament = tournament
+        self.crossover_rate = crossover_rate
+
+    def search(self, engine: PromptSearch, seeds: list):
+        rng = engine.rng
+        population = engine.unique(seeds + [engine.mutate(rng.choice(seeds))
+                                            for _ in range(self.population - len(seeds))])
+        scores = engine.evaluate(population)
+        engine.log("evolutionary", 0, len(population), len(engine.items), scores)
+
+        def pick():
+            contenders = rng.sample(range(len(population)), min(self.tournament, len(population)))
+            return population[max(contenders, key=lambda i: scores[i])]
+
+        for generation in range(1, self.generations + 1):
+            if engine.exhausted():
+                break
+            elite = [population[i] for i in np.argsort(-scores, kind="stable")[:self.elite]]
+            children = []
+            for _ in range(self.population * 3):
+                if len(children) >= self.population - len(elite):
+                    break
+                parent = engine.crossover(pick(), pick()) if rng.random() < self.crossover_rate else pick()
+                children = engine.unique(children + [engine.mutate(parent)], exclude=elite)
+            population = elite + children
+            scores = engine.evaluate(population)
+            engine.log("evolutionary", generation, len(children), len(engine.items), scores)
+
+
+class SuccessiveHalving:
+    def __init__(self, candidates: int = 32, eta: int = 2, min_items: int = 1, floor: float = None):
+        """
+        Score a pool of mutated candidates with the SuccessiveHalvingScheduler: min_items eval
+        items first, then the best 1/eta on eta times as many, until survivors see every item
+        """
+        self.candidates = candidates
+        self.eta = eta
+        self.min_items = min_items
+        self.floor = floor
+
+    def search(self, engine: PromptSearch, seeds: list):
+        from evaluation_scheduler import SuccessiveHalvingScheduler
+
+        pool = list(seeds)
+        for _ in range(self.candidates * 3):
+            if len(pool) >= self.candidates:
+                break
+            pool = engine.unique(pool + [engine.mutate(engine.rng.choice(seeds))])
+
+        scheduler = SuccessiveHalvingScheduler(len(engine.items), self.min_items, self.eta, self.floor)
+        progress = []
+
+        def score_items(candidates, indices):
+            # A failed pair ranks its candidate last for this stage rather than counting as a real score
+            scores = engine.evaluate_items(candidates, indices)
+            scores[np.isnan(scores)] = -np.inf
+            progress.append((engine.evaluations, round(time.monotonic() - engine._started, 2)))
+            return scores
+
+        report = scheduler.run(pool, score_items, should_stop=engine.exhausted)
+        for stage, (evaluations, elapsed) in zip(report["stages"], progress):
+            engine.history.append({
+                "strategy": "successive_halving", "round": stage["stage"], "candidates": stage["candidates"],
+                "items": stage["items"], "round_best": stage["best_score"], "best_score": stage["best_score"],
+                "evaluations": evaluations, "elapsed": elapsed,
+            })
+        if report["fully_evaluated"]:
+            # Already scored on every item, so this only reads the cache
+            engine.evaluate(report["survivors"])
+        elif report["survivors"]:
+            engine.best_prompt, engine.best_score = report["best_candidate"], report["best_score"]
+        engine.schedule = {key: value for key, value in report.items() if key != "stages"}
+
+
+STRATEGIES = {
+    "beam": BeamSearch,
+    "evolutionary": EvolutionarySearch,
+    "halving": SuccessiveHalving,
+}
+
+
+def load_items(path: str) -> list:
+    """Eval items from a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for better prompts against an eval set")
+    parser.add_argument("--task", choices=sorted(TASKS), default="few_shot_sentiment")
+    parser.add_argument("--eval", help="JSONL eval items (default: the task's file in eval/)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="beam")
+    parser.add_argument("--candidates", type=int, default=32, help="pool size for successive halving")
+    parser.add_argument("--min-items", type=int, default=1, help="eval items in the first halving stage")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=8, help="(candidate, item) pairs per scoring call")
+    parser.add_argument("--time-budget", type=float, default=300, help="seconds")
+    parser.add_argument("--max-evaluations", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synonym-table", help="precomputed table from synonym_table.py instead of live WordNet")
+    parser.add_argument("--json", help="also write the result to this file")
+    args = parser.parse_args()
+
+    build_task, eval_file = TASKS[args.task]
+    scorer, seeds = build_task()
+    items = load_items(args.eval or os.path.join(EVAL_DIR, eval_file))
+    strategy = SuccessiveHalving(args.candidates, min_items=args.min_items) if args.strategy == "halving" else STRATEGIES[args.strategy]()
+    mutations = None
+    if args.synonym_table:
+        from synonym_table import SynonymTable
+
+        mutations = [SynonymMutation(SynonymTable(args.synonym_table).synonyms), drop_word, swap_words,
+                     PhraseMutation()]
+    engine = PromptSearch(scorer, items, mutations=mutations, workers=args.workers, batch_size=args.batch_size,
+                          time_budget=args.time_budget, max_evaluations=args.max_evaluations, seed=args.seed)
+    result = engine.run(seeds, strategy)
+
+    for row in result["history"]:
+        print(f"round {row['round']:>2}: {row['candidates']:>3} candidates on {row['items']:>3} items, "
+              f"round best {row['round_best']}, best so far {row['best_score']} "
+              f"({row['evaluations']} evaluations, {row['elapsed']}s)")
+    print(f"\nBest ({result['best_score']:.3f}): {result['best_prompt']}")
+    print(f"{result['evaluations']} evaluations, {result['cache_hits']} served from cache, {result['elapsed']}s")
+    if result["failures"]:
+        print(f"{result['failures']} (candidate, item) calls failed and were left unscored")
+    if "schedule" in result:
+        schedule = result["schedule"]
+        print(f"Successive halving: {schedule['calls']} calls instead of {schedule['full_calls']} "
+              f"({schedule['calls_saved']} saved, {schedule['saved_fraction']:.0%})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Synonym Table
+=============
+A precomputed replacement for the notebook's per-word wordnet.synsets()
+lookups in synonym_replacement.
+
+The table is built once from WordNet (or any candidates function) and saved
+as a directory of .npy files that are memory-mapped on load:
+    keys.npy / key_ids.npy      sorted 64-bit word hashes -> string id
+    offsets.npy / candidates.npy  CSR rows: candidate string ids for each word
+    strings.bin / string_offsets.npy  every word and candidate, UTF-8
+A word's candidates are the first lemma of each of its synsets, repeats
+included, so a uniform draw matches the notebook's
+random.choice(synsets).lemmas()[0].
+
+sample() rewrites a whole batch of prompts at once. Each distinct word is
+hashed once and all words are looked up with one searchsorted. Every
+replacement is drawn with a single vectorized pick from a seeded numpy
+Generator.
+
+Usage:
+    python synonym_table.py build --output synonym_table --extra-words prompts.txt
+    python synonym_table.py sample "Summarize the impact of climate change on biodiversity" -n 5
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+
+def word_key(word: str) -> int:
+    """Stable 64-bit key for a lowercased word"""
+    return int.from_bytes(hashlib.blake2b(word.lower().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def wordnet_candidates(word: str) -> list:
+    """The notebook's choices for a word: the first lemma name of each synset"""
+    from nltk.corpus import wordnet
+
+    return [synset.lemmas()[0].name() for synset in wordnet.synsets(word)]
+
+
+def single_word_synonyms(word: str, names) -> tuple:
+    """Distinct candidates without multiword lemmas (e.g. sum_up) or the word itself, sorted"""
+    return tuple(sorted({name for name in names if "_" not in name and name.lower() != word.lower()}))
+
+
+def wordnet_vocabulary() -> list:
+    """Every WordNet lemma name"""
+    try:
+        from nltk.corpus import wordnet
+    except ImportError:
+        raise ImportError("Building the table needs nltk with the wordnet corpus: pip install nltk") from None
+    return sorted(set(wordnet.all_lemma_names()))
+
+
+def build_table(path: str, words, candidates_of=wordnet_candidates) -> dict:
+    """Look up every word once and write the table; returns its meta data"""
+    strings, string_ids = [], {}
+
+    def intern(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    rows = {}
+    for word in dict.fromkeys(word.lower() for word in words):
+        candidates = candidates_of(word)
+        if candidates:
+            rows[intern(word)] = [intern(candidate) for candidate in candidates]
+
+    word_ids = np.array(sorted(rows), dtype=np.int32)
+    keys = np.array([word_key(strings[i]) for i in word_ids], dtype=np.uint64)
+    order = np.argsort(keys, kind="stable")
+    keys, word_ids = keys[order], word_ids[order]
+    if len(keys) > 1 and np.any(keys[1:] == keys[:-1]):
+        raise ValueError("Word hash collision; cannot build the table")
+
+    counts = np.zeros(len(strings), dtype=np.int64)
+    for string_id, candidates in rows.items():
+        counts[string_id] = len(candidates)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    candidates = np.empty(offsets[-1], dtype=np.int32)
+    for string_id, ids in rows.items():
+        candidates[offsets[string_id]:offsets[string_id + 1]] = ids
+
+    encoded = [text.encode("utf-8") for text in strings]
+    string_offsets = np.concatenate([[0], np.cumsum([len(text) for text in encoded])]).astype(np.int64)
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in (("keys", keys), ("key_ids", word_ids), ("offsets", offsets),
+                        ("candidates", candidates), ("string_offsets", string_offsets)):
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "strings.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    meta = {"words": len(keys), "strings": len(strings), "candidates": int(offsets[-1])}
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class SynonymTable:
+    def __init__(self, path: str):
+        """Memory-map a table written by build_table"""
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.keys = load("keys")
+        self.key_ids = load("key_ids")
+        self.offsets = load("offsets")
+        self.candidates = load("candidates")
+        self.string_offsets = load("string_offsets")
+        self.strings = np.memmap(os.path.join(path, "strings.bin"), dtype=np.uint8, mode="r") \
+            if self.string_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def string(self, string_id: int) -> str:
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return self.strings[start:end].tobytes().decode("utf-8")
+
+    def lookup(self, words: list) -> np.ndarray:
+        """String id of each word, or -1 for words without candidates"""
+        distinct = [word for word in dict.fromkeys(words) if word not in self._ids]
+        if distinct and len(self.keys):
+            keys = np.array([word_key(word) for word in distinct], dtype=np.uint64)
+            slots = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = self.keys[slots] == keys
+            ids = np.where(found, self.key_ids[slots], -1)
+            self._ids.update(zip(distinct, ids.tolist()))
+        return np.array([self._ids.get(word, -1) for word in words], dtype=np.int64)
+
+    def synonyms(self, word: str) -> tuple:
+        """Single-word candidates for one word, matching prompt_search.wordnet_synonyms"""
+        string_id = int(self.lookup([word])[0])
+        if string_id < 0:
+            return ()
+        names = (self.string(int(i)) for i in self.candidates[self.offsets[string_id]:self.offsets[string_id + 1]])
+        return single_word_synonyms(word, names)
+
+    def sample(self, prompts: list, rng: np.random.Generator = None, rate: float = 1.0) -> list:
+        """
+        synonym_replacement for a batch of prompts: each word with candidates is replaced, with
+        probability `rate`, by a uniformly drawn candidate
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        split = [prompt.split() for prompt in prompts]
+        words = [word for prompt_words in split for word in prompt_words]
+        ids = self.lookup(words)
+        replace = ids >= 0
+        if rate < 1.0:
+            replace &= rng.random(len(ids)) < rate
+        rows = ids[replace]
+        starts = self.offsets[rows]
+        picks = starts + (rng.random(len(rows)) * (self.offsets[rows + 1] - starts)).astype(np.int64)
+        chosen = iter(self.candidates[picks].tolist())
+        names = {}
+        result, position = [], 0
+        for prompt_words in split:
+            out = []
+            for word, swap in zip(prompt_words, replace[position:position + len(prompt_words)]):
+                if swap:
+                    string_id = next(chosen)
+                    if string_id not in names:
+                        names[string_id] = self.string(string_id)
+                    word = names[string_id]
+                out.append(word)
+            position += len(prompt_words)
+            result.append(" ".join(out))
+        return result
+
+    def synonym_replacement(self, prompt: str, rng: np.random.Generator = None) -> str:
+        """The notebook's synonym_replacement for one prompt"""
+        return self.sample([prompt], rng)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputed WordNet synonym table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the table from WordNet")
+    build.add_argument("--output", default="synonym_table")
+    build.add_argument("--extra-words", help="text file whose words are added to the WordNet lemma names "
+                                             "(inflected forms such as 'changes' are not lemma names)")
+    sample = commands.add_parser("sample", help="print synonym-replaced variants of a prompt")
+    sample.add_argument("prompt")
+    sample.add_argument("-n", type=int, default=5)
+    sample.add_argument("--table", default="synonym_table")
+    sample.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        words = wordnet_vocabulary()
+        if args.extra_words:
+            with open(args.extra_words, encoding="utf-8") as f:
+                words += f.read().split()
+        meta = build_table(args.output, words)
+        print(f"{meta['words']} words, {meta['candidates']} candidates -> {args.output}")
+    else:
+        table = SynonymTable(args.table)
+        for variant in table.sample([args.prompt] * args.n, np.random.default_rng(args.seed)):
+            print(variant)
+
+
+if __name__ == "__main__":
+    main()
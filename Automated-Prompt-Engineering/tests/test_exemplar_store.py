@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from exemplar_store import ExemplarStore
+
+
+class FakeEmbedder:
+    """Deterministic unit vectors derived from each text's length and first character"""
+
+    name = "fake"
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, normalize_embeddings=True):
+        vectors = np.array([[len(text), ord(text[0]), 1.0, 2.0] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_append_after_uncommitted_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / "store")
+    store = ExemplarStore(path, FakeEmbedder())
+    store.add(["first exemplar", "second one"])
+
+    # Crash after the data files were written but before meta.json committed the rows
+    def crash(name, data):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(store, "_write_json", crash)
+    with pytest.raises(RuntimeError):
+        store.add(["lost text that is quite long", "another lost text"])
+
+    reopened = ExemplarStore(path, FakeEmbedder())
+    assert len(reopened) == 2
+    ids = reopened.add(["third exemplar", "fourth"])
+    assert ids == [2, 3]
+
+    texts = ["first exemplar", "second one", "third exemplar", "fourth"]
+    assert ExemplarStore(path).texts(range(4)) == texts
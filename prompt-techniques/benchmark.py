@@ -0,0 +1,204 @@
+"""
+Offline Benchmark
+=================
+Runs every run_all_examples / run_all_workflows entry point, plus a large
+zero-shot batch, against the local mock Groq server and reports requests per
+second, p50/p95/p99 call latency and wall time for each.
+Needs no network access or API key, so it can run in CI; --max-wall and
+--max-p95 turn a regression into a non-zero exit code.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --latency 0.5 --error-rate 0.05 --server-rpm 300 --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from mock_groq_server import MockGroqServer
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def instrument(client, calls: list):
+    """Time every request the client sends, including scheduler waits and retries"""
+    def timed(method):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = await method(*args, **kwargs)
+                ok = True
+                return result
+            except asyncio.CancelledError:
+                # Cancelled on purpose (e.g. a decided self-consistency vote), not a failure
+                start = None
+                raise
+            finally:
+                if start is not None:
+                    calls.append((time.perf_counter() - start, ok))
+        return wrapper
+
+    client._complete = timed(client._complete)
+    client._stream = timed(client._stream)
+
+
+def scenarios(args) -> list:
+    """(name, runner) pairs; imports happen here, after the environment points at the mock"""
+    from zero_shot_prompting import ZeroShotPrompting
+    from few_shot_prompting import FewShotPrompting
+    from chain_of_thought_prompting import ChainOfThoughtPrompting
+    from prompt_chaining import PromptChaining
+
+    def chain_of_thought():
+        cot = ChainOfThoughtPrompting()
+        cot.samples = args.samples
+        cot.run_all_examples()
+
+    def zero_shot_batch():
+        zero_shot = ZeroShotPrompting()
+        reviews = [f"Review {i}: the product arrived on time and works as described." for i in range(args.batch_size)]
+        zero_shot.run_batch("sentiment_analysis", reviews, concurrency=args.concurrency)
+
+    return [
+        ("zero_shot", lambda: ZeroShotPrompting().run_all_examples()),
+        ("few_shot", lambda: FewShotPrompting().run_all_examples()),
+        ("chain_of_thought", chain_of_thought),
+        ("prompt_chaining", lambda: PromptChaining().run_all_workflows()),
+        ("zero_shot_batch", zero_shot_batch),
+    ]
+
+
+def run_scenario(name: str, runner, calls: list, metrics, verbose: bool) -> dict:
+    """Run one entry point and summarize the calls it made"""
+    del calls[:]
+    metrics.reset()
+    start = time.perf_counter()
+    if verbose:
+        runner()
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            runner()
+    wall = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in calls)
+    errors = sum(1 for _, ok in calls if not ok)
+    totals = metrics.summary()["totals"]
+    return {
+        "scenario": name,
+        "requests": len(calls),
+        "errors": errors,
+        "wall_time": round(wall, 3),
+        "requests_per_sec": round(len(calls) / wall, 2) if wall > 0 else None,
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "p99": round(percentile(latencies, 99), 4),
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "queue_time": totals["queue_time"],
+        "network_time": totals["network_time"],
+    }
+
+
+def print_report(rows: list, server: MockGroqServer, scheduler_stats: dict):
+    print(f"\n{'scenario':<18}{'requests':>9}{'errors':>8}{'wall s':>9}{'req/s':>9}"
+          f"{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'tokens':>9}")
+    print("-" * 89)
+    for row in rows:
+        print(f"{row['scenario']:<18}{row['requests']:>9}{row['errors']:>8}{row['wall_time']:>9.2f}"
+              f"{row['requests_per_sec'] or 0:>9.2f}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}"
+              f"{row['prompt_tokens'] + row['completion_tokens']:>9}")
+    print("-" * 89)
+    print(f"server: {server.stats}")
+    print(f"client retries: {scheduler_stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local mock Groq server")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=400)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500/503 responses")
+    parser.add_argument("--server-rpm", type=float, default=None, help="mock requests/min before 429s")
+    parser.add_argument("--client-rpm", type=float, default=100000, help="GROQ_RPM for the client scheduler")
+    parser.add_argument("--client-tpm", type=float, default=10 ** 9, help="GROQ_TPM for the client scheduler")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--samples", type=int, default=1, help="self-consistency samples for chain_of_thought")
+    parser.add_argument("--only", nargs="+", help="run only these scenarios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-wall", type=float, help="fail if total wall time exceeds this many seconds")
+    parser.add_argument("--max-p95", type=float, help="fail if any scenario's p95 latency exceeds this")
+    parser.add_argument("--verbose", action="store_true", help="show the examples' own output")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    server = MockGroqServer(port=0, latency=args.latency, jitter=args.jitter,
+                            tokens_per_sec=args.tokens_per_sec, completion_tokens=args.completion_tokens,
+                            error_rate=args.error_rate, rpm=args.server_rpm, seed=args.seed)
+    os.environ.update({
+        "GROQ_BASE_URL": server.start_in_thread(),
+        "GROQ_API_KEY": "mock-key",
+        "GROQ_RPM": str(args.client_rpm),
+        "GROQ_TPM": str(args.client_tpm),
+        "LLM_CACHE_DISABLED": "1",
+    })
+
+    # Result files and manifests go to a scratch directory, not the working tree
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="prompt-bench-")
+    os.chdir(workdir)
+
+    from llm_client import get_client
+    client = get_client()
+    calls = []
+    instrument(client, calls)
+
+    rows = []
+    total_start = time.perf_counter()
+    for name, runner in scenarios(args):
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name}...", flush=True)
+        rows.append(run_scenario(name, runner, calls, client.metrics, args.verbose))
+    total_wall = time.perf_counter() - total_start
+
+    print_report(rows, server, client.scheduler.stats())
+    print(f"total wall time: {total_wall:.2f}s   (outputs in {workdir})")
+    client.close()
+    server.stop()
+
+    if args.json:
+        report = {"total_wall_time": round(total_wall, 3), "scenarios": rows,
+                  "server": server.stats, "client": client.scheduler.stats(), "config": vars(args)}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_wall is not None and total_wall > args.max_wall:
+        failures.append(f"total wall time {total_wall:.2f}s > {args.max_wall}s")
+    if args.max_p95 is not None:
+        failures += [f"{row['scenario']} p95 {row['p95']}s > {args.max_p95}s"
+                     for row in rows if row["p95"] > args.max_p95]
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
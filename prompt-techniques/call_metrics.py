@@ -0,0 +1,183 @@
+"""
+Call Metrics
+============
+Per-call accounting for every model request: prompt and completion tokens,
+time spent queued behind the rate limiter, time on the network, retries and
+estimated cost. Calls are tagged with the technique, task and chain step that
+made them (set with tagged(...)), aggregated in memory, and exported as a
+summary dict for saved results or as Prometheus / OpenMetrics text.
+"""
+
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# USD per million (prompt, completion) tokens; unknown models are costed at zero
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LABELS = ("technique", "task", "step", "model")
+
+_call_tags = contextvars.ContextVar("llm_call_tags", default={})
+
+
+@contextmanager
+def tagged(**tags):
+    """Tag every model call made inside this block (and tasks it spawns) with these labels"""
+    token = _call_tags.set({**_call_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _call_tags.reset(token)
+
+
+def current_tags() -> dict:
+    """Labels in effect for a call made from the current context"""
+    return dict(_call_tags.get())
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class CallMetrics:
+    def __init__(self):
+        self.series = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collect):
+        """Register a callable returning extra (name, type, help, value) samples for export"""
+        self.collectors.append(collect)
+
+    def record(self, model: str, tags: dict, prompt_tokens: int = 0, completion_tokens: int = 0,
+               queue_time: float = 0.0, network_time: float = 0.0, retries: int = 0,
+               cached: bool = False, coalesced: bool = False, error: bool = False):
+        """Add one finished call to its (technique, task, step, model) series"""
+        key = tuple(str(tags.get(label, "")) for label in LABELS[:-1]) + (model,)
+        latency = queue_time + network_time
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    "calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0, "retries": 0,
+                    "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+                    "queue_time": 0.0, "network_time": 0.0, "max_latency": 0.0,
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                }
+            series["calls"] += 1
+            series["errors"] += int(error)
+            series["cache_hits"] += int(cached)
+            series["coalesced"] += int(coalesced)
+            series["retries"] += retries
+            series["prompt_tokens"] += prompt_tokens
+            series["completion_tokens"] += completion_tokens
+            series["cost_usd"] += call_cost(model, prompt_tokens, completion_tokens)
+            series["queue_time"] += queue_time
+            series["network_time"] += network_time
+            series["max_latency"] = max(series["max_latency"], latency)
+            for idx, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    series["buckets"][idx] += 1
+
+    def reset(self):
+        """Drop everything recorded so far"""
+        with self._lock:
+            self.series.clear()
+
+    def _snapshot(self, **filters) -> list:
+        """(labels, series) pairs matching the given label values"""
+        with self._lock:
+            items = [(dict(zip(LABELS, key)), dict(series, buckets=list(series["buckets"])))
+                     for key, series in self.series.items()]
+        return [(labels, series) for labels, series in items
+                if all(labels.get(k) == v for k, v in filters.items())]
+
+    def summary(self, **filters) -> dict:
+        """Totals plus one row per series, most expensive first; filter by any label"""
+        rows = []
+        totals = {"calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0, "retries": 0, "prompt_tokens": 0,
+                  "completion_tokens": 0, "cost_usd": 0.0, "queue_time": 0.0, "network_time": 0.0}
+        for labels, series in self._snapshot(**filters):
+            for name in totals:
+                totals[name] += series[name]
+            sent = series["calls"] - series["cache_hits"] - series["coalesced"]
+            rows.append({
+                **labels,
+                **{name: series[name] for name in totals},
+                "avg_latency": round((series["queue_time"] + series["network_time"]) / sent, 4) if sent else 0.0,
+                "max_latency": round(series["max_latency"], 4),
+            })
+        for row in rows + [totals]:
+            for name in ("cost_usd", "queue_time", "network_time"):
+                row[name] = round(row[name], 6 if name == "cost_usd" else 4)
+        rows.sort(key=lambda row: (row["cost_usd"], row["prompt_tokens"] + row["completion_tokens"]), reverse=True)
+        return {"totals": totals, "calls": rows}
+
+    def to_prometheus(self, openmetrics: bool = False) -> str:
+        """Render all series in the Prometheus text format (or OpenMetrics with `# EOF`)"""
+        counters = (
+            ("llm_calls", "calls", "Model calls made"),
+            ("llm_call_errors", "errors", "Model calls that failed after retries"),
+            ("llm_cache_hits", "cache_hits", "Calls answered from the response cache"),
+            ("llm_coalesced_calls", "coalesced", "Calls that shared an identical in-flight request"),
+            ("llm_call_retries", "retries", "Retried attempts"),
+            ("llm_prompt_tokens", "prompt_tokens", "Prompt tokens used"),
+            ("llm_completion_tokens", "completion_tokens", "Completion tokens generated"),
+            ("llm_cost_usd", "cost_usd", "Estimated cost in USD"),
+            ("llm_queue_seconds", "queue_time", "Seconds spent waiting on the rate limiter"),
+            ("llm_network_seconds", "network_time", "Seconds spent on the network"),
+        )
+        snapshot = self._snapshot()
+        lines = []
+
+        def labels_text(labels, extra=""):
+            pairs = [f'{k}="{_escape(v)}"' for k, v in labels.items()] + ([extra] if extra else [])
+            return "{" + ",".join(pairs) + "}"
+
+        for family, field, help_text in counters:
+            # OpenMetrics names the counter family without the _total sample suffix
+            name = family if openmetrics else family + "_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, series in snapshot:
+                lines.append(f"{family}_total{labels_text(labels)} {_number(series[field])}")
+
+        family = "llm_call_latency_seconds"
+        lines.append(f"# HELP {family} Queue plus network time per call")
+        lines.append(f"# TYPE {family} histogram")
+        for labels, series in snapshot:
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), series["buckets"] + [series["calls"]]):
+                le = 'le="%s"' % bound
+                lines.append(f"{family}_bucket{labels_text(labels, le)} {count}")
+            lines.append(f"{family}_count{labels_text(labels)} {series['calls']}")
+            lines.append(f"{family}_sum{labels_text(labels)} "
+                         f"{_number(series['queue_time'] + series['network_time'])}")
+        for collect in self.collectors:
+            for name, kind, help_text, value in collect():
+                family = name[:-len("_total")] if openmetrics and kind == "counter" else name
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, openmetrics: bool = False):
+        """Write the exposition text to a file (e.g. for the node_exporter textfile collector)"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(openmetrics))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
@@ -0,0 +1,259 @@
+"""
+Chain Executor
+==============
+Declarative prompt chains where each step names the inputs it needs.
+Steps run concurrently as soon as all of their inputs are available,
+so independent branches of a workflow overlap instead of queueing.
+"""
+
+import time
+import asyncio
+
+from call_metrics import tagged
+from context_budget import POLICIES, fit_context
+
+
+class ChainStep:
+    def __init__(self, name: str, prompt=None, inputs: list = None, temperature: float = 0.7,
+                 max_tokens: int = 2048, title: str = None, run=None, budget: int = None,
+                 context_policy: dict = None):
+        """
+        name: step id, also the key its output is stored under for later steps
+        prompt: str.format template over the inputs, or a callable(values) -> str
+        inputs: names of earlier steps or context values this step reads
+        run: optional coroutine function(values) -> str replacing the single model call
+        budget: prompt plus completion tokens for this step (default: the executor's context window);
+            max_tokens then caps the completion, which gets whatever the prompt leaves
+        context_policy: input name -> truncate | summarize | drop, applied to text inputs that
+            don't fit the budget (default truncate)
+        """
+        if prompt is None and run is None:
+            raise ValueError(f"Step '{name}' needs a prompt or a run function")
+        context_policy = dict(context_policy or {})
+        for input_name, policy in context_policy.items():
+            if policy not in POLICIES:
+                raise ValueError(f"Step '{name}': context policy for '{input_name}' must be one of {POLICIES}")
+        self.name = name
+        self.prompt = prompt
+        self.inputs = list(inputs or [])
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.title = title or name.replace("_", " ")
+        self.run = run
+        self.budget = budget
+        self.context_policy = context_policy
+
+    def render(self, values: dict) -> str:
+        """Build the prompt text from the resolved inputs"""
+        if callable(self.prompt):
+            return self.prompt(values)
+        return self.prompt.format(**values)
+
+
+class ChainExecutor:
+    def __init__(self, call_model, on_step_complete=None, stream_model=None, on_token=None,
+                 checkpoint=None, context_window: int = None):
+        """
+        call_model: coroutine function(prompt, temperature=..., max_tokens=...) -> str
+        on_step_complete: optional callback(step_number, step, output) fired as each step finishes
+        stream_model: optional async generator function with call_model's signature; when set,
+            prompt steps stream and on_token(step_number, step, delta) sees text as it arrives
+        checkpoint: optional RunManifest; completed steps are recorded there and steps whose
+            inputs are unchanged since a previous run are replayed instead of re-run
+        context_window: model token limit; prompt steps without their own budget are fitted to it
+        """
+        self.call_model = call_model
+        self.on_step_complete = on_step_complete
+        self.stream_model = stream_model
+        self.on_token = on_token
+        self.checkpoint = checkpoint
+        self.context_window = context_window
+
+    @staticmethod
+    def validate(steps: list, context: dict):
+        """Reject unknown inputs, duplicate names and dependency cycles"""
+        names = [step.name for step in steps]
+        if len(set(names)) != len(names):
+            raise ValueError("Chain step names must be unique")
+        known = set(names) | set(context)
+        for step in steps:
+            missing = [name for name in step.inputs if name not in known]
+            if missing:
+                raise ValueError(f"Step '{step.name}' has unknown inputs: {missing}")
+
+        remaining = {step.name: {name for name in step.inputs if name in names} for step in steps}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Chain has a dependency cycle among: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    async def arun(self, workflow: str, steps: list, context: dict = None) -> dict:
+        """Execute the chain and return a chain_record with per-step timing"""
+        context = dict(context or {})
+        self.validate(steps, context)
+
+        chain_start = time.perf_counter()
+        numbers = {step.name: idx for idx, step in enumerate(steps, 1)}
+        records = {}
+        tasks = {}
+
+        async def run_step(step):
+            with tagged(step=step.name):
+                return await execute_step(step)
+
+        async def execute_step(step):
+            values = dict(context)
+            for name in step.inputs:
+                if name in tasks:
+                    values[name] = await tasks[name]
+
+            started = time.perf_counter()
+            first_token = None
+            prompt = None
+            max_tokens = step.max_tokens
+            budget_report = None
+            budget = (step.budget or self.context_window) if step.run is None else None
+            output = None
+            if self.checkpoint is not None:
+                # Keyed on the inputs before fitting, so a resumed step skips any summarize call too
+                key = f"{workflow}/{step.name}"
+                inputs = step.render(values) if step.run is None else {name: values[name] for name in step.inputs}
+                input_hash = self.checkpoint.input_hash(inputs, step.temperature, step.max_tokens,
+                                                        budget, step.context_policy)
+                output = self.checkpoint.get(key, input_hash)
+            resumed = output is not None
+            if step.run is None and not resumed:
+                if budget:
+                    values, max_tokens, budget_report = await fit_context(step, values, budget, self.call_model)
+                prompt = step.render(values)
+
+            if resumed:
+                # Completed in an earlier run with identical inputs
+                pass
+            elif step.run is not None:
+                output = await step.run(values)
+            elif self.stream_model is not None:
+                chunks = []
+                async for delta in self.stream_model(
+                    prompt, temperature=step.temperature, max_tokens=max_tokens
+                ):
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    chunks.append(delta)
+                    if self.on_token:
+                        self.on_token(numbers[step.name], step, delta)
+                output = "".join(chunks)
+            else:
+                output = await self.call_model(
+                    prompt, temperature=step.temperature, max_tokens=max_tokens
+                )
+            finished = time.perf_counter()
+            if self.checkpoint is not None and not resumed:
+                self.checkpoint.record(key, input_hash, output)
+
+            records[step.name] = {
+                "step": numbers[step.name],
+                "action": step.name,
+                "inputs": step.inputs,
+                "output": output,
+                "started_at": round(started - chain_start, 3),
+                "duration": round(finished - started, 3),
+            }
+            if first_token is not None:
+                records[step.name]["time_to_first_token"] = round(first_token - started, 3)
+            if resumed:
+                records[step.name]["resumed"] = True
+            if budget_report is not None and (step.budget or "adjusted" in budget_report):
+                records[step.name]["context"] = budget_report
+            if self.on_step_complete:
+                self.on_step_complete(numbers[step.name], step, output)
+            return output
+
+        for step in steps:
+            tasks[step.name] = asyncio.ensure_future(run_step(step))
+        await asyncio.gather(*tasks.values())
+
+        return {
+            "workflow": workflow,
+            "steps": [records[step.name] for step in steps],
+            "wall_time": round(time.perf_counter() - chain_start, 3),
+        }
+
+    def run(self, workflow: str, steps: list, context: dict = None) -> dict:
+        """Blocking wrapper around arun"""
+        return asyncio.run(self.arun(workflow, steps, context))
+
+
+async def stream_map(call_model, items: list, build_prompt, concurrency: int = 8, **call_kwargs):
+    """Yield (index, output) pairs in completion order, at most `concurrency` calls in flight"""
+    queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker():
+        try:
+            for idx, item in pending:
+                await queue.put((idx, await call_model(build_prompt(item), **call_kwargs)))
+        except Exception as e:
+            await queue.put((None, e))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            idx, output = await queue.get()
+            if idx is None:
+                raise output
+            yield idx, output
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def tree_reduce(call_model, texts: list, reduce_prompt, max_chars: int,
+                      separator: str = "\n\n", concurrency: int = 8, **call_kwargs) -> str:
+    """Merge texts level by level until the joined result fits in max_chars"""
+    texts = list(texts)
+    while len(texts) > 1 and len(separator.join(texts)) > max_chars:
+        groups, group, size = [], [], 0
+        for text in texts:
+            added = len(text) + (len(separator) if group else 0)
+            if len(group) >= 2 and size + added > max_chars:
+                groups.append(group)
+                group, size = [], 0
+                added = len(text)
+            group.append(text)
+            size += added
+        groups.append(group)
+        if len(groups) == len(texts):
+            break
+
+        merged = [None] * len(groups)
+        async for idx, output in stream_map(
+            call_model, groups, lambda group: reduce_prompt(separator.join(group)),
+            concurrency=concurrency, **call_kwargs
+        ):
+            merged[idx] = output
+        texts = merged
+    return separator.join(texts)
+
+
+async def map_reduce(call_model, items: list, map_prompt, reduce_prompt, max_chars: int,
+                     concurrency: int = 8, on_result=None, map_kwargs: dict = None,
+                     reduce_kwargs: dict = None) -> str:
+    """
+    Map every item through map_prompt concurrently, then tree-reduce the outputs
+    (kept in input order) with reduce_prompt whenever they exceed max_chars.
+    on_result(index, output) fires for each mapped item as soon as it finishes.
+    """
+    outputs = [None] * len(items)
+    async for idx, output in stream_map(call_model, items, map_prompt, concurrency, **(map_kwargs or {})):
+        outputs[idx] = output
+        if on_result:
+            on_result(idx, output)
+    return await tree_reduce(
+        call_model, outputs, reduce_prompt, max_chars, concurrency=concurrency, **(reduce_kwargs or {})
+    )
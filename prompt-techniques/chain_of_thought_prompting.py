@@ -5,32 +5,80 @@ Encourages the model to break down complex problems into step-by-step reasoning.
 Best for: Math problems, logical reasoning, complex analysis, debugging.
 """
 
-import os
-from groq import Groq
-from dotenv import load_dotenv
 import json
+import asyncio
+import inspect
+import argparse
 from datetime import datetime
 
-load_dotenv()
+from llm_client import get_client
+from result_sink import JsonlResultWriter, write_summary
+from run_manifest import RunManifest
+from call_metrics import tagged
+import self_consistency
 
 class ChainOfThoughtPrompting:
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.client = get_client()
         self.model = "llama-3.1-8b-instant"
         self.results = []
+        self.sink = None
+        self.keep_results = True
+        self.compress_results = False
+        self.manifest = None
+        self._task_records = None
+        self.samples = 1
+        self.sample_temperature = 0.7
     
-    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048) -> str:
+    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                   use_cache: bool = True) -> str:
         """Make API call to Groq"""
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+        return self.client.call_model(prompt, model=self.model, temperature=temperature,
+                                      max_tokens=max_tokens, use_cache=use_cache)
+    
+    async def acall_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                          use_cache: bool = True) -> str:
+        """Make async API call to Groq"""
+        return await self.client.acall_model(prompt, model=self.model, temperature=temperature,
+                                             max_tokens=max_tokens, use_cache=use_cache)
+    
+    def stream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                     use_cache: bool = True):
+        """Stream response text from Groq as it is generated"""
+        return self.client.stream_model(prompt, model=self.model, temperature=temperature,
+                                        max_tokens=max_tokens, use_cache=use_cache)
+    
+    def astream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                      use_cache: bool = True):
+        """Async-stream response text from Groq as it is generated"""
+        return self.client.astream_model(prompt, model=self.model, temperature=temperature,
+                                         max_tokens=max_tokens, use_cache=use_cache)
+    
+    def stream_print(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048) -> str:
+        """Print the response as it streams in and return the full text"""
+        print()
+        chunks = []
+        for delta in self.stream_model(prompt, temperature=temperature, max_tokens=max_tokens):
+            print(delta, end="", flush=True)
+            chunks.append(delta)
+        print()
+        return "".join(chunks)
+    
+    def solve(self, prompt: str, temperature: float = 0.3) -> tuple:
+        """One reasoning sample, or a self-consistency majority vote when self.samples > 1"""
+        if self.samples <= 1:
+            return self.call_model(prompt, temperature=temperature), {}
+        
+        # Every sample must be a fresh draw, so bypass the response cache
+        vote = asyncio.run(self_consistency.vote(
+            self.acall_model, prompt, n=self.samples,
+            temperature=self.sample_temperature, use_cache=False,
+        ))
+        print(f"\nSelf-consistency: answer '{vote['answer']}' with votes {vote['votes']} "
+              f"({vote['samples_used']} of {self.samples} samples drawn)")
+        summary = {key: vote[key] for key in ("answer", "votes", "samples_used", "samples_cancelled",
+                                           "samples_failed", "sample_budget")}
+        return vote["output"], {"self_consistency": summary}
     
     def math_word_problem(self):
         """Example 1: Math Word Problems with Step-by-Step Solution"""
@@ -71,14 +119,15 @@ Solution:"""
             print(f"\n--- Problem {idx} ({item['difficulty']}) ---")
             print(f"Problem: {item['problem']}")
             print("\nSolving step by step...")
-            result = self.call_model(prompt, temperature=0.3)
+            result, consistency = self.solve(prompt, temperature=0.3)
             print(f"\n{result}")
             
-            self.results.append({
+            self.add_result({
                 "task": "math_problem",
                 "difficulty": item['difficulty'],
                 "problem": item['problem'],
-                "output": result
+                "output": result,
+                **consistency
             })
     
     def logical_reasoning(self):
@@ -115,13 +164,14 @@ Solution:"""
         
         print(f"\nPuzzle:\n{puzzle.strip()}")
         print("\nReasoning through the puzzle...")
-        result = self.call_model(prompt, temperature=0.3)
+        result, consistency = self.solve(prompt, temperature=0.3)
         print(f"\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "logical_reasoning",
             "puzzle_type": "arrangement",
-            "output": result
+            "output": result,
+            **consistency
         })
         
         # Second puzzle
@@ -147,13 +197,14 @@ Answer:"""
         
         print(f"\n\nLogical Riddle:\n{riddle.strip()}")
         print("\nApplying logical reasoning...")
-        result2 = self.call_model(prompt2, temperature=0.3)
+        result2, consistency2 = self.solve(prompt2, temperature=0.3)
         print(f"\n{result2}")
         
-        self.results.append({
+        self.add_result({
             "task": "logical_reasoning",
             "puzzle_type": "syllogism",
-            "output": result2
+            "output": result2,
+            **consistency2
         })
     
     def code_debugging(self):
@@ -200,7 +251,7 @@ Analysis:"""
         result = self.call_model(prompt, temperature=0.4)
         print(f"\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "code_debugging",
             "language": "python",
             "output": result
@@ -252,10 +303,9 @@ Analysis:"""
         
         print(f"\nScenario:\n{scenario.strip()}")
         print("\nAnalyzing decision step by step...")
-        result = self.call_model(prompt, temperature=0.5, max_tokens=2048)
-        print(f"\n{result}")
+        result = self.stream_print(prompt, temperature=0.5, max_tokens=2048)
         
-        self.results.append({
+        self.add_result({
             "task": "decision_making",
             "domain": "software_architecture",
             "output": result
@@ -296,7 +346,7 @@ Scientific Analysis:"""
         result = self.call_model(prompt, temperature=0.5)
         print(f"\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "scientific_reasoning",
             "domain": "botany",
             "output": result
@@ -346,10 +396,9 @@ Strategic Analysis:"""
         
         print(f"\nBusiness Situation:\n{situation.strip()}")
         print("\nAnalyzing strategy step by step...")
-        result = self.call_model(prompt, temperature=0.5, max_tokens=2048)
-        print(f"\n{result}")
+        result = self.stream_print(prompt, temperature=0.5, max_tokens=2048)
         
-        self.results.append({
+        self.add_result({
             "task": "business_strategy",
             "domain": "competitive_analysis",
             "output": result
@@ -394,33 +443,94 @@ Ethical Analysis:"""
         result = self.call_model(prompt, temperature=0.5, max_tokens=2048)
         print(f"\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "ethical_reasoning",
             "domain": "technology_ethics",
             "output": result
         })
     
-    def save_results(self):
-        """Save all results to a JSON file"""
+    def open_result_sink(self):
+        """Start streaming results to an append-only JSONL file as they complete"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"chain_of_thought_results_{timestamp}.json"
-        
-        output_data = {
+        filename = f"chain_of_thought_results_{timestamp}.jsonl" + (".gz" if self.compress_results else "")
+        self.sink = JsonlResultWriter(filename, {
             "technique": "Chain of Thought Prompting",
             "model": self.model,
             "timestamp": timestamp,
-            "total_tasks": len(self.results),
-            "results": self.results
-        }
+            "collection": "results",
+            "count_key": "total_tasks",
+        })
+        print(f"Streaming results to: {filename}")
+    
+    def add_result(self, result: dict):
+        """Record one result, writing it to the sink immediately when one is open"""
+        if self.sink is not None:
+            self.sink.write(result)
+        if self.keep_results:
+            self.results.append(result)
+        if self._task_records is not None:
+            self._task_records.append(result)
+    
+    def open_manifest(self, resume: bool = False):
+        """Checkpoint completed tasks so an interrupted run can pick up where it stopped"""
+        self.manifest = RunManifest("chain_of_thought_manifest.jsonl", salt=self.model, resume=resume)
+    
+    def run_task(self, method):
+        """Run one example, replaying its results instead if it completed in an earlier run"""
+        with tagged(technique="chain_of_thought", task=method.__name__):
+            if self.manifest is None:
+                return method()
+            key = method.__name__
+            input_hash = self.manifest.input_hash(inspect.getsource(method))
+            done = self.manifest.get(key, input_hash)
+            if done is not None:
+                print(f"\n[resume] {key} already completed, replaying {len(done)} result(s)")
+                for result in done:
+                    self.add_result(result)
+                return
+            self._task_records = []
+            try:
+                method()
+                self.manifest.record(key, input_hash, self._task_records)
+            finally:
+                self._task_records = None
+    
+    def save_results(self):
+        """Save all results to a JSON file, with token usage and a Prometheus metrics file"""
+        usage = self.client.metrics.summary(technique="chain_of_thought")
+        if self.sink is not None:
+            self.sink.close()
+            filename = self.sink.path.split(".jsonl")[0] + ".json"
+            write_summary(self.sink.path, filename, extra={"usage": usage})
+            self.sink = None
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"chain_of_thought_results_{timestamp}.json"
+            
+            output_data = {
+                "technique": "Chain of Thought Prompting",
+                "model": self.model,
+                "timestamp": timestamp,
+                "total_tasks": len(self.results),
+                "results": self.results,
+                "usage": usage
+            }
+            
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        metrics_file = filename.rsplit(".json", 1)[0] + ".prom"
+        self.client.metrics.write_prometheus(metrics_file)
+        totals = usage["totals"]
         
         print(f"\n{'='*70}")
         print(f"Results saved to: {filename}")
+        print(f"Metrics saved to: {metrics_file}")
+        print(f"Usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+              f"{totals['completion_tokens']} completion tokens, est. ${totals['cost_usd']:.4f}")
         print(f"{'='*70}")
     
-    def run_all_examples(self):
+    def run_all_examples(self, resume: bool = False):
         """Execute all chain of thought prompting examples"""
         print("\n" + "="*70)
         print("CHAIN OF THOUGHT PROMPTING DEMONSTRATION")
@@ -429,13 +539,15 @@ Ethical Analysis:"""
         print("="*70)
         
         try:
-            self.math_word_problem()
-            self.logical_reasoning()
-            self.code_debugging()
-            self.decision_making_analysis()
-            self.scientific_reasoning()
-            self.business_strategy_analysis()
-            self.ethical_dilemma_reasoning()
+            self.open_manifest(resume)
+            self.open_result_sink()
+            self.run_task(self.math_word_problem)
+            self.run_task(self.logical_reasoning)
+            self.run_task(self.code_debugging)
+            self.run_task(self.decision_making_analysis)
+            self.run_task(self.scientific_reasoning)
+            self.run_task(self.business_strategy_analysis)
+            self.run_task(self.ethical_dilemma_reasoning)
             
             self.save_results()
             
@@ -447,8 +559,16 @@ Ethical Analysis:"""
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Chain of thought prompting examples")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip tasks completed by a previous interrupted run")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="self-consistency samples per math/logic problem (majority vote)")
+    args = parser.parse_args()
+    
     cot = ChainOfThoughtPrompting()
-    cot.run_all_examples()
+    cot.samples = args.samples
+    cot.run_all_examples(resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+"""
+Context Budget
+==============
+Keep chain prompts inside a token budget. Token counts come from a local
+estimator: a compiled pre-tokenizer pattern close to the Llama 3 / tiktoken
+split, or the exact tokenizer when LLM_TOKENIZER points at a local
+tokenizer.json (needs the `tokenizers` package; nothing is downloaded).
+Counts are memoized because chain outputs are counted again by every
+downstream step.
+
+Before a step's prompt is rendered, fit_context measures the template and
+each upstream input. Inputs that don't fit are truncated, summarized or
+dropped, according to the step's context_policy. The completion gets
+whatever budget is left, capped at the step's max_tokens.
+"""
+
+import os
+import re
+import functools
+
+# Prompt plus completion tokens each model accepts
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+}
+
+POLICIES = ("truncate", "summarize", "drop")
+
+TRUNCATION_MARKER = "\n[...truncated]"
+
+# Words with their leading space, short digit groups, punctuation runs, whitespace
+_PIECES = re.compile(r" ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+")
+
+
+@functools.lru_cache(maxsize=None)
+def _load_tokenizer(path: str):
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        raise ImportError("LLM_TOKENIZER needs the tokenizers package: pip install tokenizers") from None
+    return Tokenizer.from_file(path)
+
+
+def count_tokens(text: str) -> int:
+    """Estimated token count of a text; exact when LLM_TOKENIZER names a tokenizer.json"""
+    return _count_tokens(text, os.environ.get("LLM_TOKENIZER") or None)
+
+
+@functools.lru_cache(maxsize=8192)
+def _count_tokens(text: str, path: str = None) -> int:
+    # The tokenizer path is part of the cache key, so changing LLM_TOKENIZER never returns stale counts
+    if path:
+        return len(_load_tokenizer(path).encode(text, add_special_tokens=False).ids)
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        # Common words are one token; long or rare words split roughly every 6 characters
+        tokens += 1 + (len(piece) - 1) // 6 if not piece.isspace() else 1
+    return tokens
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut text at a word boundary so it (with a truncation marker) fits in budget tokens"""
+    if count_tokens(text) <= budget:
+        return text
+    budget -= count_tokens(TRUNCATION_MARKER)
+    if budget <= 0:
+        return ""
+    end = len(text) * budget // count_tokens(text)
+    while end > 0 and count_tokens(text[:end]) > budget:
+        end = end * 9 // 10
+    cut = text.rfind(" ", 0, end)
+    return text[:cut if cut > end // 2 else end].rstrip() + TRUNCATION_MARKER
+
+
+def summary_prompt(text: str, budget: int) -> str:
+    """Ask for a summary short enough to fit in budget tokens"""
+    words = max(20, budget * 2 // 3)
+    return f"""Summarize the following in at most {words} words.
+Keep names, numbers, section headings and conclusions.
+
+{text}
+
+Summary:"""
+
+
+def allocate(sizes: dict, available: int) -> dict:
+    """Split available tokens across inputs: small inputs keep their size, large ones share the rest equally"""
+    shares = {}
+    remaining = dict(sizes)
+    while remaining:
+        share = max(0, available) // len(remaining)
+        small = {name: size for name, size in remaining.items() if size <= share}
+        if not small:
+            shares.update({name: share for name in remaining})
+            break
+        for name, size in small.items():
+            shares[name] = size
+            available -= size
+            del remaining[name]
+    return shares
+
+
+async def fit_context(step, values: dict, budget: int, call_model=None, min_completion: int = 256) -> tuple:
+    """
+    Shrink the step's text inputs so its prompt leaves at least min_completion tokens of the budget.
+    Returns (values, max_tokens, report); report records token counts and what was done to each input.
+    """
+    values = dict(values)
+    texts = {name: values[name] for name in step.inputs if isinstance(values.get(name), str)}
+    base = count_tokens(step.render({**values, **{name: "" for name in texts}}))
+    sizes = {name: count_tokens(text) for name, text in texts.items()}
+    available = budget - min(min_completion, step.max_tokens) - base
+    if available < 0:
+        raise ValueError(f"Step '{step.name}': the prompt template alone ({base} tokens) "
+                         f"exceeds its {budget}-token budget")
+
+    adjusted = {}
+    if sum(sizes.values()) > available:
+        shares = allocate(sizes, available)
+        for name, text in texts.items():
+            if sizes[name] <= shares[name]:
+                continue
+            policy = step.context_policy.get(name, "truncate")
+            if policy == "drop" or shares[name] < 16:
+                values[name] = ""
+                adjusted[name] = "dropped"
+            elif policy == "summarize" and call_model is not None:
+                summary = await call_model(summary_prompt(text, shares[name]), temperature=0.3,
+                                           max_tokens=shares[name])
+                values[name] = truncate_to_tokens(summary.strip(), shares[name])
+                adjusted[name] = "summarized"
+            else:
+                values[name] = truncate_to_tokens(text, shares[name])
+                adjusted[name] = "truncated"
+
+    prompt_tokens = count_tokens(step.render(values))
+    max_tokens = max(1, min(step.max_tokens, budget - prompt_tokens))
+    report = {"budget": budget, "prompt_tokens": prompt_tokens, "max_tokens": max_tokens,
+              "input_tokens": sizes}
+    if adjusted:
+        report["adjusted"] = adjusted
+    return values, max_tokens, report
@@ -5,32 +5,85 @@ Provides examples to guide the model's behavior and output format.
 Best for: Tasks requiring specific formats, styles, or pattern recognition.
 """
 
-import os
-from groq import Groq
-from dotenv import load_dotenv
 import json
+import inspect
+import asyncio
+import argparse
 from datetime import datetime
 
-load_dotenv()
+from llm_client import get_client
+from result_sink import JsonlResultWriter, write_summary
+from run_manifest import RunManifest
+from call_metrics import tagged
+from prompt_template import PromptTemplate
+from prompt_packing import classify_packed, number_items, answer_format
+
+SENTIMENT_TEMPLATE = PromptTemplate.few_shot(
+    instruction="Classify the sentiment of customer reviews as: Positive, Negative, or Neutral.",
+    examples_header="Examples:",
+    examples=[
+        {"review": "This laptop exceeded all my expectations! Fast, reliable, and great battery life.", "sentiment": "Positive"},
+        {"review": "Completely disappointed. The product stopped working after a week.", "sentiment": "Negative"},
+        {"review": "It's decent. Does the job but nothing impressive.", "sentiment": "Neutral"},
+        {"review": "Amazing customer service! They resolved my issue within minutes.", "sentiment": "Positive"},
+        {"review": "The quality is poor and it's overpriced. Not worth it at all.", "sentiment": "Negative"},
+    ],
+    example_format='Review: "{review}"\nSentiment: {sentiment}',
+    query_header="Now classify these new reviews:",
+    suffix='Review: "{review}"\nSentiment:',
+)
+
+SENTIMENT_LABELS = ["Positive", "Negative", "Neutral"]
+
+PRODUCT_DESCRIPTION_TEMPLATE = PromptTemplate.few_shot(
+    instruction="Write engaging product descriptions following this style:",
+    numbered=True,
+    examples=[
+        {"product": "Wireless Earbuds", "description": "Experience freedom like never before. These ultra-lightweight wireless earbuds deliver crystal-clear sound quality with deep bass that'll make your favorite songs come alive. With 24-hour battery life and IPX7 waterproof rating, they're perfect for your active lifestyle. Touch controls make switching songs effortless. Your soundtrack, untethered."},
+        {"product": "Smart Watch", "description": "Your health companion on your wrist. This sleek smartwatch tracks your heart rate, sleep patterns, and activity levels with precision. Stay connected with notifications, calls, and apps right from your wrist. The vibrant AMOLED display looks stunning, while the 7-day battery life keeps you going. Fitness meets fashion."},
+        {"product": "Portable Blender", "description": "Smoothies anywhere, anytime. This compact powerhouse blends fruits, vegetables, and ice into silky perfection in just 30 seconds. USB rechargeable design means no outlets needed. The BPA-free bottle doubles as your drinking cup. Healthy living just got easier. Blend, sip, conquer."},
+    ],
+    example_format='Product: {product}\nDescription: "{description}"',
+    query_header="Now write a description for this product:",
+    suffix="Product: {product}\nDescription:",
+)
 
 class FewShotPrompting:
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.client = get_client()
         self.model = "llama-3.1-8b-instant"
         self.results = []
+        self.sink = None
+        self.keep_results = True
+        self.compress_results = False
+        self.manifest = None
+        self._task_records = None
+        # Sentiment reviews labelled per request after the shared examples; 1 sends one request each
+        self.pack_size = 20
     
-    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024) -> str:
+    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                   use_cache: bool = True) -> str:
         """Make API call to Groq"""
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+        return self.client.call_model(prompt, model=self.model, temperature=temperature,
+                                      max_tokens=max_tokens, use_cache=use_cache)
+    
+    async def acall_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                          use_cache: bool = True) -> str:
+        """Make async API call to Groq"""
+        return await self.client.acall_model(prompt, model=self.model, temperature=temperature,
+                                             max_tokens=max_tokens, use_cache=use_cache)
+    
+    def stream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                     use_cache: bool = True):
+        """Stream response text from Groq as it is generated"""
+        return self.client.stream_model(prompt, model=self.model, temperature=temperature,
+                                        max_tokens=max_tokens, use_cache=use_cache)
+    
+    def astream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                      use_cache: bool = True):
+        """Async-stream response text from Groq as it is generated"""
+        return self.client.astream_model(prompt, model=self.model, temperature=temperature,
+                                         max_tokens=max_tokens, use_cache=use_cache)
     
     def sentiment_classification_with_examples(self):
         """Example 1: Sentiment Analysis with Few-Shot Learning"""
@@ -38,38 +91,18 @@ class FewShotPrompting:
         print("EXAMPLE 1: SENTIMENT CLASSIFICATION (FEW-SHOT)")
         print("="*70)
         
-        prompt = """Classify the sentiment of customer reviews as: Positive, Negative, or Neutral.
-
-Examples:
-
-Review: "This laptop exceeded all my expectations! Fast, reliable, and great battery life."
-Sentiment: Positive
-
-Review: "Completely disappointed. The product stopped working after a week."
-Sentiment: Negative
-
-Review: "It's decent. Does the job but nothing impressive."
-Sentiment: Neutral
-
-Review: "Amazing customer service! They resolved my issue within minutes."
-Sentiment: Positive
-
-Review: "The quality is poor and it's overpriced. Not worth it at all."
-Sentiment: Negative
-
-Now classify these new reviews:
-
-Review: "The design is sleek and modern. I'm very satisfied with this purchase."
-Sentiment:"""
+        prompt = SENTIMENT_TEMPLATE.render(
+            review="The design is sleek and modern. I'm very satisfied with this purchase."
+        )
         
-        print("\nPrompt structure: Provided 5 examples before asking for classification")
+        print(f"\nPrompt structure: Provided {SENTIMENT_TEMPLATE.num_examples} examples before asking for classification")
         print("\n--- Testing New Review ---")
         result = self.call_model(prompt, temperature=0.3)
         print(f"Result: {result}")
         
-        self.results.append({
+        self.add_result({
             "task": "sentiment_classification",
-            "examples_provided": 5,
+            "examples_provided": SENTIMENT_TEMPLATE.num_examples,
             "output": result
         })
         
@@ -80,19 +113,41 @@ Sentiment:"""
             "Best investment ever! Highly recommend to everyone!"
         ]
         
-        for idx, review in enumerate(test_reviews, 1):
-            test_prompt = prompt.rsplit("Review:", 1)[0] + f"\nReview: \"{review}\"\nSentiment:"
+        if self.pack_size > 1:
+            outputs = self.classify_reviews_packed(test_reviews)
+        else:
+            outputs = [self.call_model(SENTIMENT_TEMPLATE.render(review=review), temperature=0.3)
+                       for review in test_reviews]
+        
+        for idx, (review, result) in enumerate(zip(test_reviews, outputs), 1):
             print(f"\n--- Test Review {idx} ---")
             print(f"Input: {review}")
-            result = self.call_model(test_prompt, temperature=0.3)
             print(f"Output: {result}")
             
-            self.results.append({
+            self.add_result({
                 "task": "sentiment_classification",
                 "input": review,
                 "output": result
             })
     
+    def packed_sentiment_prompt(self, reviews: list) -> str:
+        """The few-shot examples once, followed by several numbered reviews"""
+        reviews_text = number_items([f'Review: "{review}"' for review in reviews])
+        return f"{SENTIMENT_TEMPLATE.prefix}{reviews_text}\n\n{answer_format(len(reviews), SENTIMENT_LABELS)}"
+    
+    def classify_reviews_packed(self, reviews: list) -> list:
+        """Label reviews several per request; unparsed answers are retried one review at a time"""
+        async def call_single(review):
+            return await self.acall_model(SENTIMENT_TEMPLATE.render(review=review), temperature=0.3)
+        
+        results, stats = asyncio.run(classify_packed(
+            self.acall_model, reviews, self.packed_sentiment_prompt, call_single, SENTIMENT_LABELS,
+            max_items=self.pack_size, temperature=0.3,
+        ))
+        print(f"\nPacked {stats['items']} reviews into {stats['packed_requests']} requests "
+              f"({stats['fallback_requests']} per-review fallbacks)")
+        return [result.get("output", f"[failed] {result.get('error')}") for result in results]
+    
     def email_response_generation(self):
         """Example 2: Professional Email Response Generation"""
         print("\n" + "="*70)
@@ -143,7 +198,7 @@ Response:"""
         result = self.call_model(prompt, temperature=0.6)
         print(f"\nGenerated Response:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "email_generation",
             "examples_provided": 3,
             "output": result
@@ -194,7 +249,7 @@ def fibonacci(n):
         result = self.call_model(prompt, temperature=0.4)
         print(f"\nGenerated Code:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "code_generation",
             "pattern": "function_completion",
             "output": result
@@ -206,30 +261,13 @@ def fibonacci(n):
         print("EXAMPLE 4: PRODUCT DESCRIPTION WRITING")
         print("="*70)
         
-        prompt = """Write engaging product descriptions following this style:
-
-Example 1:
-Product: Wireless Earbuds
-Description: "Experience freedom like never before. These ultra-lightweight wireless earbuds deliver crystal-clear sound quality with deep bass that'll make your favorite songs come alive. With 24-hour battery life and IPX7 waterproof rating, they're perfect for your active lifestyle. Touch controls make switching songs effortless. Your soundtrack, untethered."
-
-Example 2:
-Product: Smart Watch
-Description: "Your health companion on your wrist. This sleek smartwatch tracks your heart rate, sleep patterns, and activity levels with precision. Stay connected with notifications, calls, and apps right from your wrist. The vibrant AMOLED display looks stunning, while the 7-day battery life keeps you going. Fitness meets fashion."
-
-Example 3:
-Product: Portable Blender
-Description: "Smoothies anywhere, anytime. This compact powerhouse blends fruits, vegetables, and ice into silky perfection in just 30 seconds. USB rechargeable design means no outlets needed. The BPA-free bottle doubles as your drinking cup. Healthy living just got easier. Blend, sip, conquer."
-
-Now write a description for this product:
-
-Product: Laptop Stand
-Description:"""
+        prompt = PRODUCT_DESCRIPTION_TEMPLATE.render(product="Laptop Stand")
         
         print("\nLearning writing style from 3 examples...")
         result = self.call_model(prompt, temperature=0.7)
         print(f"\nGenerated Description:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "product_description",
             "style": "engaging_lifestyle",
             "output": result
@@ -243,12 +281,12 @@ Description:"""
         ]
         
         for product in products:
-            test_prompt = prompt.rsplit("Product:", 1)[0] + f"\nProduct: {product}\nDescription:"
+            test_prompt = PRODUCT_DESCRIPTION_TEMPLATE.render(product=product)
             print(f"\n--- Generating for {product} ---")
             result = self.call_model(test_prompt, temperature=0.7)
             print(f"Result: {result}")
             
-            self.results.append({
+            self.add_result({
                 "task": "product_description",
                 "product": product,
                 "output": result
@@ -307,7 +345,7 @@ Output:"""
         result = self.call_model(prompt, temperature=0.2)
         print(f"\nExtracted Data:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "data_extraction",
             "format": "json",
             "output": result
@@ -339,36 +377,98 @@ Beginning: "The forest path disappeared behind them."
 Continuation:"""
         
         print("\nLearning narrative style from examples...")
-        result = self.call_model(prompt, temperature=0.8)
+        # Creative sampling should vary between runs, so skip the response cache
+        result = self.call_model(prompt, temperature=0.8, use_cache=False)
         print(f"\nStory Continuation:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "creative_writing",
             "style": "narrative_continuation",
             "output": result
         })
     
-    def save_results(self):
-        """Save all results to a JSON file"""
+    def open_result_sink(self):
+        """Start streaming results to an append-only JSONL file as they complete"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"few_shot_results_{timestamp}.json"
-        
-        output_data = {
+        filename = f"few_shot_results_{timestamp}.jsonl" + (".gz" if self.compress_results else "")
+        self.sink = JsonlResultWriter(filename, {
             "technique": "Few-Shot Prompting",
             "model": self.model,
             "timestamp": timestamp,
-            "total_tasks": len(self.results),
-            "results": self.results
-        }
+            "collection": "results",
+            "count_key": "total_tasks",
+        })
+        print(f"Streaming results to: {filename}")
+    
+    def add_result(self, result: dict):
+        """Record one result, writing it to the sink immediately when one is open"""
+        if self.sink is not None:
+            self.sink.write(result)
+        if self.keep_results:
+            self.results.append(result)
+        if self._task_records is not None:
+            self._task_records.append(result)
+    
+    def open_manifest(self, resume: bool = False):
+        """Checkpoint completed tasks so an interrupted run can pick up where it stopped"""
+        self.manifest = RunManifest("few_shot_manifest.jsonl", salt=self.model, resume=resume)
+    
+    def run_task(self, method):
+        """Run one example, replaying its results instead if it completed in an earlier run"""
+        with tagged(technique="few_shot", task=method.__name__):
+            if self.manifest is None:
+                return method()
+            key = method.__name__
+            input_hash = self.manifest.input_hash(inspect.getsource(method))
+            done = self.manifest.get(key, input_hash)
+            if done is not None:
+                print(f"\n[resume] {key} already completed, replaying {len(done)} result(s)")
+                for result in done:
+                    self.add_result(result)
+                return
+            self._task_records = []
+            try:
+                method()
+                self.manifest.record(key, input_hash, self._task_records)
+            finally:
+                self._task_records = None
+    
+    def save_results(self):
+        """Save all results to a JSON file, with token usage and a Prometheus metrics file"""
+        usage = self.client.metrics.summary(technique="few_shot")
+        if self.sink is not None:
+            self.sink.close()
+            filename = self.sink.path.split(".jsonl")[0] + ".json"
+            write_summary(self.sink.path, filename, extra={"usage": usage})
+            self.sink = None
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"few_shot_results_{timestamp}.json"
+            
+            output_data = {
+                "technique": "Few-Shot Prompting",
+                "model": self.model,
+                "timestamp": timestamp,
+                "total_tasks": len(self.results),
+                "results": self.results,
+                "usage": usage
+            }
+            
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        metrics_file = filename.rsplit(".json", 1)[0] + ".prom"
+        self.client.metrics.write_prometheus(metrics_file)
+        totals = usage["totals"]
         
         print(f"\n{'='*70}")
         print(f"Results saved to: {filename}")
+        print(f"Metrics saved to: {metrics_file}")
+        print(f"Usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+              f"{totals['completion_tokens']} completion tokens, est. ${totals['cost_usd']:.4f}")
         print(f"{'='*70}")
     
-    def run_all_examples(self):
+    def run_all_examples(self, resume: bool = False):
         """Execute all few-shot prompting examples"""
         print("\n" + "="*70)
         print("FEW-SHOT PROMPTING DEMONSTRATION")
@@ -377,12 +477,14 @@ Continuation:"""
         print("="*70)
         
         try:
-            self.sentiment_classification_with_examples()
-            self.email_response_generation()
-            self.code_pattern_completion()
-            self.product_description_writing()
-            self.data_extraction_structured()
-            self.creative_story_continuation()
+            self.open_manifest(resume)
+            self.open_result_sink()
+            self.run_task(self.sentiment_classification_with_examples)
+            self.run_task(self.email_response_generation)
+            self.run_task(self.code_pattern_completion)
+            self.run_task(self.product_description_writing)
+            self.run_task(self.data_extraction_structured)
+            self.run_task(self.creative_story_continuation)
             
             self.save_results()
             
@@ -394,8 +496,16 @@ Continuation:"""
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Few-shot prompting examples")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip tasks completed by a previous interrupted run")
+    parser.add_argument("--pack-size", type=int, default=20,
+                        help="sentiment reviews per request (1 disables packing)")
+    args = parser.parse_args()
+    
     few_shot = FewShotPrompting()
-    few_shot.run_all_examples()
+    few_shot.pack_size = args.pack_size
+    few_shot.run_all_examples(resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,374 @@
+"""
+Shared LLM Client
+=================
+A single Groq client shared by every prompting technique.
+One HTTP connection pool, an asyncio-native acall_model for running many
+prompts concurrently, and a blocking call_model wrapper for the examples.
+groq, httpx and python-dotenv are imported on first use, so --help,
+cache-only replays and other short runs start without loading them.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import threading
+import functools
+from collections import deque
+
+from response_cache import ResponseCache, cache_from_env
+from call_metrics import CallMetrics, current_tags
+from rate_limiter import RateLimitScheduler, estimate_request_tokens, scheduler_from_env
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+
+class LLMError(Exception):
+    """A model call failed after the scheduler exhausted its retries"""
+
+
+@functools.lru_cache(maxsize=None)
+def load_env() -> bool:
+    """Read .env into os.environ once per process; True when a file was found"""
+    from dotenv import load_dotenv
+    return load_dotenv()
+
+
+class LLMClient:
+    def __init__(self, api_key: str = None, base_url: str = None, max_connections: int = 64,
+                 cache=None, scheduler: RateLimitScheduler = None, semantic_cache=None):
+        load_env()
+        self.api_key = api_key or os.environ.get("GROQ_API_KEY")
+        self.base_url = base_url or os.environ.get("GROQ_BASE_URL")
+        self.max_connections = max_connections
+        self.cache = cache
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.stream_metrics = deque(maxlen=1000)
+        self._inflight = {}
+        self.metrics = CallMetrics()
+        self.semantic_cache = semantic_cache
+        if semantic_cache is not None:
+            self.metrics.add_collector(semantic_cache.prometheus_samples)
+        self._client = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop that owns the connection pool"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="llm-client-loop", daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    def _get_client(self):
+        """Create the AsyncGroq client lazily, inside the background loop, on the first real request"""
+        if self._client is None:
+            import httpx
+            from groq import AsyncGroq
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=0,  # retries are paced by the scheduler instead
+            )
+        return self._client
+
+    async def _run(self, coro):
+        """Await a coroutine on the client's loop, whichever loop we are called from"""
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _complete(self, messages: list, model: str, temperature: float, max_tokens: int,
+                        tags: dict) -> str:
+        """Send one chat completion request through the rate-limit scheduler"""
+        estimated = estimate_request_tokens(messages, max_tokens)
+        timing = {}
+        try:
+            chat_completion = await self.scheduler.run(
+                lambda: self._get_client().chat.completions.create(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                ),
+                estimated,
+                timing,
+            )
+        except Exception:
+            self.metrics.record(model, tags, error=True, **timing)
+            raise
+        usage = chat_completion.usage
+        self.scheduler.reconcile(estimated, usage.total_tokens if usage else None)
+        self.metrics.record(
+            model, tags,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            **timing,
+        )
+        return chat_completion.choices[0].message.content
+
+    async def _lookup_complete(self, messages: list, model: str, temperature: float,
+                               max_tokens: int, key: str, tags: dict) -> str:
+        """Serve from the response cache when possible, otherwise call the API and store the result"""
+        if self.cache is None:
+            return await self._complete(messages, model, temperature, max_tokens, tags)
+
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            self.metrics.record(model, tags, cached=True)
+            return cached
+        response = await self._complete(messages, model, temperature, max_tokens, tags)
+        if response is not None:
+            await asyncio.to_thread(self.cache.put, key, response)
+        return response
+
+    def _release(self, key: str, task: asyncio.Task):
+        """Forget a finished in-flight request (and mark its error as seen if nobody awaited it)"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def _cached_complete(self, messages: list, model: str, temperature: float,
+                               max_tokens: int, use_cache: bool, tags: dict) -> str:
+        """
+        Cached call with single flight: concurrent identical requests share one network call.
+        use_cache=False callers want an independent sample, so they bypass both.
+        """
+        if not use_cache:
+            return await self._complete(messages, model, temperature, max_tokens, tags)
+
+        # Runs on the client loop only, so the in-flight table needs no lock
+        key = ResponseCache.make_key(model, messages, temperature, max_tokens)
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(
+                self._lookup_complete(messages, model, temperature, max_tokens, key, tags)
+            )
+            self._inflight[key] = shared
+            shared.add_done_callback(functools.partial(self._release, key))
+            # Shielded so one caller giving up does not cancel the request for the others
+            return await asyncio.shield(shared)
+
+        try:
+            response = await asyncio.shield(shared)
+        except Exception:
+            self.metrics.record(model, tags, coalesced=True, error=True)
+            raise
+        self.metrics.record(model, tags, coalesced=True)
+        return response
+
+    async def _semantic_complete(self, messages: list, model: str, temperature: float,
+                                 max_tokens: int, semantic_key: tuple, tags: dict) -> str:
+        """Answer from a near-duplicate earlier input when one is similar enough"""
+        settings = (model, temperature, max_tokens)
+        scope, text = semantic_key
+        cached, probe = await asyncio.to_thread(self.semantic_cache.get, settings, scope, text)
+        if cached is not None:
+            self.metrics.record(model, tags, cached=True)
+            return cached
+        response = await self._cached_complete(messages, model, temperature, max_tokens, True, tags)
+        if response is not None:
+            self.semantic_cache.put(settings, scope, probe, response)
+        return response
+
+    async def acall_model(self, prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                          max_tokens: int = 1024, use_cache: bool = True,
+                          semantic_key: tuple = None) -> str:
+        """
+        Make async API call to Groq.
+        semantic_key: (scope, text) - when a semantic cache is configured, reuse the answer to an
+            earlier call with the same scope and a near-duplicate text
+        """
+        messages = [{"role": "user", "content": prompt}]
+        tags = current_tags()
+        if semantic_key is not None and use_cache and self.semantic_cache is not None:
+            coro = self._semantic_complete(messages, model, temperature, max_tokens, semantic_key, tags)
+        else:
+            coro = self._cached_complete(messages, model, temperature, max_tokens, use_cache, tags)
+        try:
+            return await self._run(coro)
+        except Exception as e:
+            raise LLMError(str(e)) from e
+
+    def call_model(self, prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                   max_tokens: int = 1024, use_cache: bool = True, semantic_key: tuple = None) -> str:
+        """Make blocking API call to Groq"""
+        loop = self._ensure_loop()
+        coro = self.acall_model(prompt, model=model, temperature=temperature, max_tokens=max_tokens,
+                                use_cache=use_cache, semantic_key=semantic_key)
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def _stream(self, messages: list, model: str, temperature: float, max_tokens: int,
+                      use_cache: bool, tags: dict, emit):
+        """Stream one completion on the client loop, passing each text delta to emit()"""
+        start = time.perf_counter()
+        key = None
+        if self.cache is not None and use_cache:
+            key = self.cache.make_key(model, messages, temperature, max_tokens)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                self.metrics.record(model, tags, cached=True)
+                emit(cached)
+                return
+
+        first_token = None
+        chunks = []
+        prompt_tokens = None
+        completion_tokens = None
+        total_tokens = None
+        estimated = estimate_request_tokens(messages, max_tokens)
+        timing = {}
+        try:
+            stream = await self.scheduler.run(
+                lambda: self._get_client().chat.completions.create(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                ),
+                estimated,
+                timing,
+            )
+            body_start = time.perf_counter()
+            async for chunk in stream:
+                if chunk.x_groq is not None and chunk.x_groq.usage is not None:
+                    prompt_tokens = chunk.x_groq.usage.prompt_tokens
+                    completion_tokens = chunk.x_groq.usage.completion_tokens
+                    total_tokens = chunk.x_groq.usage.total_tokens
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                chunks.append(chunk.choices[0].delta.content)
+                emit(chunk.choices[0].delta.content)
+        except Exception:
+            self.metrics.record(model, tags, error=True, **timing)
+            raise
+        end = time.perf_counter()
+        self.scheduler.reconcile(estimated, total_tokens)
+
+        # Without a usage block, each content chunk is roughly one token
+        tokens = completion_tokens if completion_tokens is not None else len(chunks)
+        timing["network_time"] += end - body_start
+        self.metrics.record(
+            model, tags,
+            prompt_tokens=prompt_tokens if prompt_tokens is not None else estimated - max_tokens,
+            completion_tokens=tokens,
+            **timing,
+        )
+        generation_time = end - (first_token or end)
+        self.stream_metrics.append({
+            "model": model,
+            "time_to_first_token": round((first_token or end) - start, 4),
+            "total_time": round(end - start, 4),
+            "completion_tokens": tokens,
+            "tokens_per_sec": round(tokens / generation_time, 2) if generation_time > 0 else None,
+        })
+        if key is not None and chunks:
+            await asyncio.to_thread(self.cache.put, key, "".join(chunks))
+
+    async def _produce(self, messages: list, model: str, temperature: float, max_tokens: int,
+                       use_cache: bool, tags: dict, emit):
+        """Run _stream and signal completion or errors through emit() as ("done"/"error", value)"""
+        try:
+            await self._stream(messages, model, temperature, max_tokens, use_cache, tags,
+                               lambda delta: emit(("delta", delta)))
+            emit(("done", None))
+        except Exception as e:
+            emit(("error", e))
+
+    async def astream_model(self, prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                            max_tokens: int = 1024, use_cache: bool = True):
+        """Async generator yielding response text as it is generated"""
+        messages = [{"role": "user", "content": prompt}]
+        consumer_loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        emit = lambda item: consumer_loop.call_soon_threadsafe(items.put_nowait, item)
+        future = asyncio.run_coroutine_threadsafe(
+            self._produce(messages, model, temperature, max_tokens, use_cache, current_tags(), emit),
+            self._ensure_loop()
+        )
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise LLMError(str(value)) from value
+                yield value
+        finally:
+            future.cancel()
+
+    def stream_model(self, prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                     max_tokens: int = 1024, use_cache: bool = True):
+        """Blocking generator yielding response text as it is generated"""
+        messages = [{"role": "user", "content": prompt}]
+        items = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._produce(messages, model, temperature, max_tokens, use_cache, current_tags(), items.put),
+            self._ensure_loop()
+        )
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise LLMError(str(value)) from value
+                yield value
+        finally:
+            future.cancel()
+
+    def close(self):
+        """Close the connection pool and stop the background loop"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), loop).result()
+            self._client = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Return the process-wide client shared by all prompting classes"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            load_env()
+            semantic_cache = None
+            if os.environ.get("LLM_SEMANTIC_CACHE", "").lower() in ("1", "true", "yes"):
+                # Imported only when switched on: it loads numpy
+                from semantic_cache import semantic_cache_from_env
+                semantic_cache = semantic_cache_from_env()
+            _shared_client = LLMClient(cache=cache_from_env(), scheduler=scheduler_from_env(),
+                                       semantic_cache=semantic_cache)
+        return _shared_client
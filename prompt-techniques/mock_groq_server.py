@@ -0,0 +1,214 @@
+"""
+Mock Groq Server
+================
+A local stand-in for the Groq chat completions API, for benchmarks and CI
+runs without network access or API quota.
+Serves POST /openai/v1/chat/completions (plain and streaming) with
+configurable latency, token rate, error rate and a requests-per-minute
+limit that answers 429 with a Retry-After header, like the real service.
+Standard library only.
+
+Usage:
+    python mock_groq_server.py --port 8765 --latency 0.2 --tokens-per-sec 400 --rpm 600
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=mock python zero_shot_prompting.py
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+WORDS = ("the model considers each step of the problem carefully and explains "
+         "its reasoning before reaching a conclusion").split()
+
+
+class MockGroqServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, latency: float = 0.2,
+                 jitter: float = 0.05, tokens_per_sec: float = 400, completion_tokens: int = 64,
+                 error_rate: float = 0.0, rpm: float = None, seed: int = None):
+        """
+        latency: seconds before the first token (time to first byte for non-streaming calls)
+        jitter: uniform +/- noise added to latency
+        tokens_per_sec: generation speed once the first token is out
+        completion_tokens: tokens per response, capped by the request's max_tokens
+        error_rate: fraction of requests answered with a 500/503
+        rpm: requests per minute before answering 429 (None for unlimited)
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "completed": 0}
+        self._window = []
+        self._server = None
+        self._loop = None
+
+    def _rate_limited(self) -> float:
+        """Seconds until a slot frees up if this request is over the RPM limit, else 0"""
+        if not self.rpm:
+            return 0.0
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 60.0]
+        if len(self._window) >= self.rpm:
+            return 60.0 - (now - self._window[0])
+        self._window.append(now)
+        return 0.0
+
+    def _completion_text(self, n_tokens: int) -> list:
+        """Synthetic reply, one word per token, ending in a parseable final answer"""
+        words = [WORDS[i % len(WORDS)] for i in range(max(0, n_tokens - 3))]
+        return [w + " " for w in words] + ["Final ", "Answer: ", "42"]
+
+    async def _respond(self, writer, status: int, body: bytes, headers: dict = None):
+        reason = {200: "OK", 429: "Too Many Requests", 500: "Internal Server Error",
+                  503: "Service Unavailable", 404: "Not Found", 400: "Bad Request"}[status]
+        head = [f"HTTP/1.1 {status} {reason}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def _chat_completion(self, writer, request: dict):
+        self.stats["requests"] += 1
+        wait = self._rate_limited()
+        if wait:
+            self.stats["rate_limited"] += 1
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "tokens",
+                                         "code": "rate_limit_exceeded"}}).encode()
+            await self._respond(writer, 429, body, {"retry-after": f"{wait:.2f}"})
+            return
+        if self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            status = self.random.choice((500, 503))
+            await self._respond(writer, status, json.dumps({"error": {"message": "mock server error"}}).encode())
+            return
+
+        prompt_tokens = sum(len(m.get("content", "")) // 4 + 4 for m in request.get("messages", []))
+        n_tokens = max(1, min(self.completion_tokens, request.get("max_tokens") or self.completion_tokens))
+        pieces = self._completion_text(n_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                 "total_tokens": prompt_tokens + len(pieces)}
+        base = {"id": f"chatcmpl-mock-{self.stats['requests']}", "created": int(time.time()),
+                "model": request.get("model", "mock")}
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        if not request.get("stream"):
+            await asyncio.sleep(len(pieces) / self.tokens_per_sec)
+            body = json.dumps({**base, "object": "chat.completion", "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(pieces)}}], "usage": usage}).encode()
+            await self._respond(writer, 200, body)
+            self.stats["completed"] += 1
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def send_event(payload: str):
+            data = f"data: {payload}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+
+        for piece in pieces:
+            await send_event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [{
+                "index": 0, "delta": {"content": piece}, "finish_reason": None}]}))
+            await asyncio.sleep(1.0 / self.tokens_per_sec)
+        await send_event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [{
+            "index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"id": base["id"], "usage": usage}}))
+        await send_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.stats["completed"] += 1
+
+    async def _handle(self, reader, writer):
+        """Serve keep-alive HTTP/1.1 requests on one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    try:
+                        request = json.loads(body or b"{}")
+                    except json.JSONDecodeError:
+                        await self._respond(writer, 400, b'{"error": {"message": "invalid JSON"}}')
+                        continue
+                    await self._chat_completion(writer, request)
+                else:
+                    await self._respond(writer, 404, b'{"error": {"message": "not found"}}')
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Run the server on the current event loop until cancelled"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self) -> str:
+        """Start on a background thread and return the base URL to point GROQ_BASE_URL at"""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def run():
+            self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            await self._server.serve_forever()
+
+        threading.Thread(target=lambda: self._loop.run_until_complete(run()),
+                         name="mock-groq-server", daemon=True).start()
+        started.wait()
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self):
+        """Stop a server started with start_in_thread"""
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=400)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=float, default=None, help="requests/min before 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockGroqServer(args.host, args.port, args.latency, args.jitter, args.tokens_per_sec,
+                            args.completion_tokens, args.error_rate, args.rpm, args.seed)
+    print(f"Mock Groq server on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -5,34 +5,103 @@ Breaking complex tasks into sequential prompts where each output feeds into the
 Best for: Multi-stage workflows, complex analysis, content pipelines.
 """
 
-import os
-from groq import Groq
-from dotenv import load_dotenv
 import json
+import inspect
+import argparse
 from datetime import datetime
-import time
 
-load_dotenv()
+from llm_client import get_client
+from result_sink import JsonlResultWriter, write_summary
+from run_manifest import RunManifest
+from call_metrics import tagged
+from chain_executor import ChainStep, ChainExecutor, map_reduce
+from context_budget import MODEL_CONTEXT_WINDOWS
 
 class PromptChaining:
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.client = get_client()
         self.model = "llama-3.1-8b-instant"
         self.results = []
         self.chains = []
+        self.sink = None
+        self.keep_results = True
+        self.compress_results = False
+        self.manifest = None
+        self._task_records = None
+        self.concurrency = 8
+        self.max_context_chars = 24000
+        self.stream = True
+        self._streaming_step = None
+        self._deferred_steps = []
     
-    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048) -> str:
+    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                   use_cache: bool = True) -> str:
         """Make API call to Groq"""
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+        return self.client.call_model(prompt, model=self.model, temperature=temperature,
+                                      max_tokens=max_tokens, use_cache=use_cache)
+    
+    async def acall_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                          use_cache: bool = True) -> str:
+        """Make async API call to Groq"""
+        return await self.client.acall_model(prompt, model=self.model, temperature=temperature,
+                                             max_tokens=max_tokens, use_cache=use_cache)
+    
+    def stream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                     use_cache: bool = True):
+        """Stream response text from Groq as it is generated"""
+        return self.client.stream_model(prompt, model=self.model, temperature=temperature,
+                                        max_tokens=max_tokens, use_cache=use_cache)
+    
+    def astream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 2048,
+                      use_cache: bool = True):
+        """Async-stream response text from Groq as it is generated"""
+        return self.client.astream_model(prompt, model=self.model, temperature=temperature,
+                                         max_tokens=max_tokens, use_cache=use_cache)
+    
+    def print_token(self, number: int, step: ChainStep, delta: str):
+        """Echo streamed text live for one step at a time; parallel steps print on completion"""
+        if self._streaming_step is None:
+            self._streaming_step = number
+            print(f"\n\n STEP {number}: {step.title}...\n")
+        if self._streaming_step == number:
+            print(delta, end="", flush=True)
+    
+    def print_step(self, number: int, step: ChainStep, output: str):
+        """Print a chain step as soon as it completes, without breaking into a live stream"""
+        if self._streaming_step is not None and self._streaming_step != number:
+            self._deferred_steps.append((number, step, output))
+            return
+        if self._streaming_step == number:
+            self._streaming_step = None
+            print()
+        else:
+            print(f"\n\n STEP {number}: {step.title}...")
+            print(f"\n{output}")
+        deferred, self._deferred_steps = self._deferred_steps, []
+        for args in deferred:
+            self.print_step(*args)
+    
+    def run_chain(self, workflow: str, steps: list, context: dict) -> dict:
+        """Run a declarative chain, overlapping independent steps"""
+        executor = ChainExecutor(
+            self.acall_model,
+            on_step_complete=self.print_step,
+            stream_model=self.astream_model if self.stream else None,
+            on_token=self.print_token,
+            checkpoint=self.manifest,
+            context_window=MODEL_CONTEXT_WINDOWS.get(self.model),
+        )
+        chain_record = executor.run(workflow, steps, context)
+        self.add_result(chain_record)
+        for record in chain_record["steps"]:
+            if "context" in record:
+                budget = record["context"]
+                adjusted = ", ".join(f"{name} {how}" for name, how in budget.get("adjusted", {}).items())
+                print(f"\n[{record['action']}] {budget['prompt_tokens']} prompt tokens, "
+                      f"max_tokens {budget['max_tokens']} of a {budget['budget']}-token budget"
+                      + (f" ({adjusted})" if adjusted else ""))
+        print(f"\nWorkflow completed in {chain_record['wall_time']}s")
+        return chain_record
     
     def content_creation_pipeline(self):
         """Example 1: Blog Post Creation Pipeline"""
@@ -40,12 +109,14 @@ class PromptChaining:
         print("EXAMPLE 1: CONTENT CREATION PIPELINE")
         print("="*70)
         
-        topic = "The Future of Remote Work"
-        chain_record = {"workflow": "blog_post_creation", "steps": []}
+        context = {"topic": "The Future of Remote Work"}
         
-        # Step 1: Generate outline
-        print("\n STEP 1: Generating blog post outline...")
-        prompt1 = f"""Create a detailed outline for a blog post about: {topic}
+        steps = [
+            ChainStep(
+                "generate_outline",
+                inputs=["topic"],
+                title="Generating blog post outline",
+                prompt="""Create a detailed outline for a blog post about: {topic}
 
 Include:
 - A catchy title
@@ -54,85 +125,67 @@ Include:
 - Conclusion
 - Key takeaways
 
-Provide only the outline."""
-        
-        outline = self.call_model(prompt1, temperature=0.7)
-        print(f"\nOutline:\n{outline}")
-        chain_record["steps"].append({
-            "step": 1,
-            "action": "generate_outline",
-            "output": outline
-        })
-        
-        # Step 2: Write introduction
-        print("\n\n STEP 2: Writing introduction based on outline...")
-        prompt2 = f"""Based on this outline:
+Provide only the outline.""",
+            ),
+            ChainStep(
+                "write_introduction",
+                inputs=["generate_outline"],
+                max_tokens=500,
+                title="Writing introduction based on outline",
+                prompt="""Based on this outline:
 
-{outline}
+{generate_outline}
 
 Write an engaging introduction (150-200 words) that:
 - Hooks the reader
 - Introduces the topic
 - Previews what they'll learn
 
-Introduction:"""
-        
-        introduction = self.call_model(prompt2, temperature=0.7, max_tokens=500)
-        print(f"\nIntroduction:\n{introduction}")
-        chain_record["steps"].append({
-            "step": 2,
-            "action": "write_introduction",
-            "output": introduction
-        })
-        
-        # Step 3: Expand first main section
-        print("\n\n STEP 3: Expanding first main section...")
-        prompt3 = f"""Based on this outline:
+Introduction:""",
+            ),
+            ChainStep(
+                "write_first_section",
+                inputs=["generate_outline", "write_introduction"],
+                max_tokens=800,
+                budget=2400,
+                context_policy={"generate_outline": "summarize", "write_introduction": "truncate"},
+                title="Expanding first main section",
+                prompt="""Based on this outline:
 
-{outline}
+{generate_outline}
 
 And this introduction:
 
-{introduction}
+{write_introduction}
 
 Write the first main section (300-400 words) with:
 - Clear explanations
 - Examples or statistics
 - Smooth transitions
 
-First Section:"""
-        
-        first_section = self.call_model(prompt3, temperature=0.7, max_tokens=800)
-        print(f"\nFirst Section:\n{first_section}")
-        chain_record["steps"].append({
-            "step": 3,
-            "action": "write_first_section",
-            "output": first_section
-        })
-        
-        # Step 4: Generate meta description
-        print("\n\n STEP 4: Creating SEO meta description...")
-        prompt4 = f"""Based on this blog post content:
+First Section:""",
+            ),
+            ChainStep(
+                "generate_meta_description",
+                inputs=["write_introduction", "write_first_section"],
+                temperature=0.6,
+                max_tokens=200,
+                title="Creating SEO meta description",
+                prompt="""Based on this blog post content:
 
 Introduction:
-{introduction}
+{write_introduction}
 
 First Section:
-{first_section}
+{write_first_section}
 
 Write a compelling SEO meta description (150-160 characters) that summarizes the article.
 
-Meta Description:"""
-        
-        meta_desc = self.call_model(prompt4, temperature=0.6, max_tokens=200)
-        print(f"\nMeta Description:\n{meta_desc}")
-        chain_record["steps"].append({
-            "step": 4,
-            "action": "generate_meta_description",
-            "output": meta_desc
-        })
+Meta Description:""",
+            ),
+        ]
         
-        self.chains.append(chain_record)
+        self.run_chain("blog_post_creation", steps, context)
     
     def data_analysis_workflow(self):
         """Example 2: Data Analysis Workflow"""
@@ -152,11 +205,16 @@ Meta Description:"""
         Product C: 6.8, 7.2, 7.9, 8.4
         """
         
-        chain_record = {"workflow": "data_analysis", "steps": []}
+        context = {"raw_data": raw_data}
         
-        # Step 1: Extract and structure data
-        print("\n STEP 1: Extracting and structuring data...")
-        prompt1 = f"""Extract and structure this data clearly:
+        steps = [
+            ChainStep(
+                "structure_data",
+                inputs=["raw_data"],
+                temperature=0.3,
+                max_tokens=800,
+                title="Extracting and structuring data",
+                prompt="""Extract and structure this data clearly:
 
 {raw_data}
 
@@ -165,83 +223,65 @@ Format as:
 2. Customer satisfaction trends
 3. Key observations
 
-Structured Data:"""
-        
-        structured = self.call_model(prompt1, temperature=0.3, max_tokens=800)
-        print(f"\nStructured Data:\n{structured}")
-        chain_record["steps"].append({
-            "step": 1,
-            "action": "structure_data",
-            "output": structured
-        })
-        
-        # Step 2: Calculate metrics
-        print("\n\n STEP 2: Calculating key metrics...")
-        prompt2 = f"""Based on this structured data:
+Structured Data:""",
+            ),
+            ChainStep(
+                "calculate_metrics",
+                inputs=["structure_data"],
+                temperature=0.2,
+                max_tokens=600,
+                title="Calculating key metrics",
+                prompt="""Based on this structured data:
 
-{structured}
+{structure_data}
 
 Calculate:
 1. Growth rate for each product (Jan to Apr)
 2. Average customer satisfaction per product
 3. Best and worst performing products
 
-Metrics:"""
-        
-        metrics = self.call_model(prompt2, temperature=0.2, max_tokens=600)
-        print(f"\nCalculated Metrics:\n{metrics}")
-        chain_record["steps"].append({
-            "step": 2,
-            "action": "calculate_metrics",
-            "output": metrics
-        })
-        
-        # Step 3: Identify insights
-        print("\n\n STEP 3: Identifying insights and patterns...")
-        prompt3 = f"""Based on these metrics:
+Metrics:""",
+            ),
+            ChainStep(
+                "identify_insights",
+                inputs=["calculate_metrics"],
+                temperature=0.6,
+                max_tokens=800,
+                title="Identifying insights and patterns",
+                prompt="""Based on these metrics:
 
-{metrics}
+{calculate_metrics}
 
 Identify:
 1. Key insights (what's working, what's not)
 2. Patterns or correlations
 3. Surprising findings
 
-Insights:"""
-        
-        insights = self.call_model(prompt3, temperature=0.6, max_tokens=800)
-        print(f"\nInsights:\n{insights}")
-        chain_record["steps"].append({
-            "step": 3,
-            "action": "identify_insights",
-            "output": insights
-        })
-        
-        # Step 4: Generate recommendations
-        print("\n\n STEP 4: Generating actionable recommendations...")
-        prompt4 = f"""Based on these insights:
+Insights:""",
+            ),
+            ChainStep(
+                "generate_recommendations",
+                inputs=["identify_insights", "calculate_metrics"],
+                temperature=0.5,
+                max_tokens=800,
+                title="Generating actionable recommendations",
+                prompt="""Based on these insights:
 
-{insights}
+{identify_insights}
 
 And the original metrics:
-{metrics}
+{calculate_metrics}
 
 Provide:
 1. Top 3 actionable recommendations
 2. Expected impact for each
 3. Priority level (High/Medium/Low)
 
-Recommendations:"""
-        
-        recommendations = self.call_model(prompt4, temperature=0.5, max_tokens=800)
-        print(f"\nRecommendations:\n{recommendations}")
-        chain_record["steps"].append({
-            "step": 4,
-            "action": "generate_recommendations",
-            "output": recommendations
-        })
+Recommendations:""",
+            ),
+        ]
         
-        self.chains.append(chain_record)
+        self.run_chain("data_analysis", steps, context)
     
     def customer_support_workflow(self):
         """Example 3: Customer Support Ticket Resolution"""
@@ -256,11 +296,17 @@ Recommendations:"""
         charged twice on my credit card. This is very frustrating!"
         """
         
-        chain_record = {"workflow": "support_ticket", "steps": []}
+        context = {"ticket": ticket}
         
-        # Step 1: Categorize and prioritize
-        print("\n STEP 1: Categorizing and prioritizing ticket...")
-        prompt1 = f"""Analyze this support ticket:
+        # Internal notes only need the ticket, its classification and the action
+        # items, so they are written while the customer response is drafted.
+        steps = [
+            ChainStep(
+                "classify_ticket",
+                inputs=["ticket"],
+                temperature=0.3,
+                title="Categorizing and prioritizing ticket",
+                prompt="""Analyze this support ticket:
 
 {ticket}
 
@@ -270,49 +316,40 @@ Classify:
 3. Sentiment (Positive/Neutral/Negative/Angry)
 4. Urgency indicators
 
-Classification:"""
-        
-        classification = self.call_model(prompt1, temperature=0.3)
-        print(f"\nClassification:\n{classification}")
-        chain_record["steps"].append({
-            "step": 1,
-            "action": "classify_ticket",
-            "output": classification
-        })
-        
-        # Step 2: Extract action items
-        print("\n\n STEP 2: Extracting required actions...")
-        prompt2 = f"""Based on this ticket:
+Classification:""",
+            ),
+            ChainStep(
+                "extract_actions",
+                inputs=["ticket", "classify_ticket"],
+                temperature=0.4,
+                title="Extracting required actions",
+                prompt="""Based on this ticket:
 
 {ticket}
 
 And this classification:
-{classification}
+{classify_ticket}
 
 List all required actions to resolve this completely:
 1. Immediate actions
 2. Follow-up actions
 3. Systems to check (orders, payments, inventory)
 
-Action Items:"""
-        
-        actions = self.call_model(prompt2, temperature=0.4)
-        print(f"\nAction Items:\n{actions}")
-        chain_record["steps"].append({
-            "step": 2,
-            "action": "extract_actions",
-            "output": actions
-        })
-        
-        # Step 3: Draft response
-        print("\n\n STEP 3: Drafting customer response...")
-        prompt3 = f"""Based on:
+Action Items:""",
+            ),
+            ChainStep(
+                "draft_response",
+                inputs=["ticket", "extract_actions"],
+                temperature=0.6,
+                max_tokens=800,
+                title="Drafting customer response",
+                prompt="""Based on:
 
 Original ticket:
 {ticket}
 
 Required actions:
-{actions}
+{extract_actions}
 
 Draft a professional, empathetic email response that:
 1. Acknowledges all issues
@@ -321,23 +358,18 @@ Draft a professional, empathetic email response that:
 4. Provides timeline
 5. Offers compensation if appropriate
 
-Email Response:"""
-        
-        response = self.call_model(prompt3, temperature=0.6, max_tokens=800)
-        print(f"\nDraft Response:\n{response}")
-        chain_record["steps"].append({
-            "step": 3,
-            "action": "draft_response",
-            "output": response
-        })
-        
-        # Step 4: Create internal notes
-        print("\n\n STEP 4: Creating internal tracking notes...")
-        prompt4 = f"""Create internal notes for this ticket:
+Email Response:""",
+            ),
+            ChainStep(
+                "create_notes",
+                inputs=["ticket", "classify_ticket", "extract_actions"],
+                temperature=0.4,
+                title="Creating internal tracking notes",
+                prompt="""Create internal notes for this ticket:
 
 Ticket: {ticket}
-Actions: {actions}
-Response sent: {response}
+Classification: {classify_ticket}
+Actions: {extract_actions}
 
 Format:
 - Summary (1 line)
@@ -345,17 +377,11 @@ Format:
 - Follow-up required
 - Escalation (Yes/No)
 
-Internal Notes:"""
-        
-        notes = self.call_model(prompt4, temperature=0.4)
-        print(f"\nInternal Notes:\n{notes}")
-        chain_record["steps"].append({
-            "step": 4,
-            "action": "create_notes",
-            "output": notes
-        })
+Internal Notes:""",
+            ),
+        ]
         
-        self.chains.append(chain_record)
+        self.run_chain("support_ticket", steps, context)
     
     def research_synthesis_workflow(self):
         """Example 4: Research Synthesis Pipeline"""
@@ -369,13 +395,10 @@ Internal Notes:"""
             "Study 3: Exercise linked to better sleep quality in 85% of participants (Institute C, 2024)"
         ]
         
-        chain_record = {"workflow": "research_synthesis", "steps": []}
+        context = {"sources": sources, "sources_text": "\n".join(sources)}
         
-        # Step 1: Summarize each source
-        print("\n STEP 1: Summarizing individual sources...")
-        summaries = []
-        for idx, source in enumerate(sources, 1):
-            prompt = f"""Summarize the key findings from this research:
+        def summary_prompt(source):
+            return f"""Summarize the key findings from this research:
 
 {source}
 
@@ -385,81 +408,92 @@ Include:
 - Year and source
 
 Summary:"""
-            
-            summary = self.call_model(prompt, temperature=0.4, max_tokens=200)
-            summaries.append(summary)
-            print(f"\nSource {idx} Summary:\n{summary}")
         
-        all_summaries = "\n\n".join(summaries)
-        chain_record["steps"].append({
-            "step": 1,
-            "action": "summarize_sources",
-            "output": all_summaries
-        })
-        
-        # Step 2: Identify common themes
-        print("\n\n STEP 2: Identifying common themes...")
-        prompt2 = f"""Based on these research summaries:
+        def merge_prompt(summaries):
+            return f"""Combine these research summaries into one summary.
+Keep every distinct finding together with its sample/methodology hint, year and source.
 
-{all_summaries}
+{summaries}
+
+Combined Summary:"""
+        
+        def print_summary(idx, summary):
+            print(f"\nSource {idx + 1} Summary:\n{summary}")
+        
+        async def summarize_sources(values):
+            return await map_reduce(
+                self.acall_model,
+                values["sources"],
+                summary_prompt,
+                merge_prompt,
+                max_chars=self.max_context_chars,
+                concurrency=self.concurrency,
+                on_result=print_summary,
+                map_kwargs={"temperature": 0.4, "max_tokens": 200},
+                reduce_kwargs={"temperature": 0.4, "max_tokens": 800},
+            )
+        
+        steps = [
+            ChainStep(
+                "summarize_sources",
+                inputs=["sources"],
+                title="Summarizing individual sources",
+                run=summarize_sources,
+            ),
+            ChainStep(
+                "identify_themes",
+                inputs=["summarize_sources"],
+                temperature=0.5,
+                title="Identifying common themes",
+                prompt="""Based on these research summaries:
+
+{summarize_sources}
 
 Identify:
 1. Common themes across studies
 2. Converging findings
 3. Areas of agreement
 
-Themes:"""
-        
-        themes = self.call_model(prompt2, temperature=0.5)
-        print(f"\nCommon Themes:\n{themes}")
-        chain_record["steps"].append({
-            "step": 2,
-            "action": "identify_themes",
-            "output": themes
-        })
-        
-        # Step 3: Synthesize conclusions
-        print("\n\n STEP 3: Synthesizing overall conclusions...")
-        prompt3 = f"""Based on:
+Themes:""",
+            ),
+            ChainStep(
+                "synthesize_conclusions",
+                inputs=["sources_text", "identify_themes"],
+                temperature=0.5,
+                max_tokens=800,
+                budget=2400,
+                context_policy={"sources_text": "truncate", "identify_themes": "summarize"},
+                title="Synthesizing overall conclusions",
+                prompt="""Based on:
 
 Original sources:
-{chr(10).join(sources)}
+{sources_text}
 
 Common themes:
-{themes}
+{identify_themes}
 
 Synthesize:
 1. Overall conclusions
 2. Strength of evidence
 3. Practical implications
 
-Synthesis:"""
-        
-        synthesis = self.call_model(prompt3, temperature=0.5, max_tokens=800)
-        print(f"\nSynthesis:\n{synthesis}")
-        chain_record["steps"].append({
-            "step": 3,
-            "action": "synthesize_conclusions",
-            "output": synthesis
-        })
-        
-        # Step 4: Generate executive summary
-        print("\n\n STEP 4: Creating executive summary...")
-        prompt4 = f"""Create a brief executive summary (100 words) based on:
+Synthesis:""",
+            ),
+            ChainStep(
+                "executive_summary",
+                inputs=["synthesize_conclusions"],
+                temperature=0.5,
+                max_tokens=300,
+                title="Creating executive summary",
+                prompt="""Create a brief executive summary (100 words) based on:
 
-{synthesis}
+{synthesize_conclusions}
 
-Executive Summary:"""
-        
-        exec_summary = self.call_model(prompt4, temperature=0.5, max_tokens=300)
-        print(f"\nExecutive Summary:\n{exec_summary}")
-        chain_record["steps"].append({
-            "step": 4,
-            "action": "executive_summary",
-            "output": exec_summary
-        })
+Executive Summary:""",
+            ),
+        ]
         
-        self.chains.append(chain_record)
+        self.run_chain("research_synthesis", steps, context)
     
     def code_review_workflow(self):
         """Example 5: Code Review Pipeline"""
@@ -486,11 +520,16 @@ users = [
 output = process_user_data(users)
 '''
         
-        chain_record = {"workflow": "code_review", "steps": []}
+        context = {"code": code}
         
-        # Step 1: Analyze code structure
-        print("\n STEP 1: Analyzing code structure...")
-        prompt1 = f"""Analyze this code's structure:
+        # Structure and bug analysis both read only the original code and run together.
+        steps = [
+            ChainStep(
+                "analyze_structure",
+                inputs=["code"],
+                temperature=0.4,
+                title="Analyzing code structure",
+                prompt="""Analyze this code's structure:
 
 {code}
 
@@ -499,19 +538,14 @@ Evaluate:
 2. Code organization
 3. Readability
 
-Structure Analysis:"""
-        
-        structure = self.call_model(prompt1, temperature=0.4)
-        print(f"\nStructure Analysis:\n{structure}")
-        chain_record["steps"].append({
-            "step": 1,
-            "action": "analyze_structure",
-            "output": structure
-        })
-        
-        # Step 2: Identify potential bugs
-        print("\n\n STEP 2: Identifying potential bugs and edge cases...")
-        prompt2 = f"""Review this code for bugs:
+Structure Analysis:""",
+            ),
+            ChainStep(
+                "identify_bugs",
+                inputs=["code"],
+                temperature=0.4,
+                title="Identifying potential bugs and edge cases",
+                prompt="""Review this code for bugs:
 
 {code}
 
@@ -520,87 +554,133 @@ Identify:
 2. Edge cases not handled
 3. Logic issues
 
-Bug Analysis:"""
-        
-        bugs = self.call_model(prompt2, temperature=0.4)
-        print(f"\nBug Analysis:\n{bugs}")
-        chain_record["steps"].append({
-            "step": 2,
-            "action": "identify_bugs",
-            "output": bugs
-        })
-        
-        # Step 3: Suggest improvements
-        print("\n\n STEP 3: Suggesting improvements...")
-        prompt3 = f"""Based on:
+Bug Analysis:""",
+            ),
+            ChainStep(
+                "suggest_improvements",
+                inputs=["code", "analyze_structure", "identify_bugs"],
+                temperature=0.5,
+                title="Suggesting improvements",
+                prompt="""Based on:
 
 Original code:
 {code}
 
 Structure analysis:
-{structure}
+{analyze_structure}
 
 Bug analysis:
-{bugs}
+{identify_bugs}
 
 Suggest:
 1. Performance improvements
 2. Better error handling
 3. Code style improvements
 
-Improvements:"""
-        
-        improvements = self.call_model(prompt3, temperature=0.5)
-        print(f"\nSuggested Improvements:\n{improvements}")
-        chain_record["steps"].append({
-            "step": 3,
-            "action": "suggest_improvements",
-            "output": improvements
-        })
-        
-        # Step 4: Generate refactored code
-        print("\n\n STEP 4: Generating refactored version...")
-        prompt4 = f"""Refactor this code based on:
+Improvements:""",
+            ),
+            ChainStep(
+                "refactor_code",
+                inputs=["code", "suggest_improvements"],
+                temperature=0.4,
+                max_tokens=1000,
+                title="Generating refactored version",
+                prompt="""Refactor this code based on:
 
 Original:
 {code}
 
 Improvements needed:
-{improvements}
+{suggest_improvements}
 
-Provide the refactored code with comments explaining changes:"""
-        
-        refactored = self.call_model(prompt4, temperature=0.4, max_tokens=1000)
-        print(f"\nRefactored Code:\n{refactored}")
-        chain_record["steps"].append({
-            "step": 4,
-            "action": "refactor_code",
-            "output": refactored
-        })
+Provide the refactored code with comments explaining changes:""",
+            ),
+        ]
         
-        self.chains.append(chain_record)
+        self.run_chain("code_review", steps, context)
     
-    def save_results(self):
-        """Save all chain results to a JSON file"""
+    def open_result_sink(self):
+        """Start streaming results to an append-only JSONL file as they complete"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"prompt_chaining_results_{timestamp}.json"
-        
-        output_data = {
+        filename = f"prompt_chaining_results_{timestamp}.jsonl" + (".gz" if self.compress_results else "")
+        self.sink = JsonlResultWriter(filename, {
             "technique": "Prompt Chaining",
             "model": self.model,
             "timestamp": timestamp,
-            "total_workflows": len(self.chains),
-            "workflows": self.chains
-        }
+            "collection": "workflows",
+            "count_key": "total_workflows",
+        })
+        print(f"Streaming results to: {filename}")
+    
+    def add_result(self, result: dict):
+        """Record one result, writing it to the sink immediately when one is open"""
+        if self.sink is not None:
+            self.sink.write(result)
+        if self.keep_results:
+            self.chains.append(result)
+        if self._task_records is not None:
+            self._task_records.append(result)
+    
+    def open_manifest(self, resume: bool = False):
+        """Checkpoint completed tasks so an interrupted run can pick up where it stopped"""
+        self.manifest = RunManifest("prompt_chaining_manifest.jsonl", salt=self.model, resume=resume)
+    
+    def run_task(self, method):
+        """Run one example, replaying its results instead if it completed in an earlier run"""
+        with tagged(technique="prompt_chaining", task=method.__name__):
+            if self.manifest is None:
+                return method()
+            key = method.__name__
+            input_hash = self.manifest.input_hash(inspect.getsource(method))
+            done = self.manifest.get(key, input_hash)
+            if done is not None:
+                print(f"\n[resume] {key} already completed, replaying {len(done)} result(s)")
+                for result in done:
+                    self.add_result(result)
+                return
+            self._task_records = []
+            try:
+                method()
+                self.manifest.record(key, input_hash, self._task_records)
+            finally:
+                self._task_records = None
+    
+    def save_results(self):
+        """Save all results to a JSON file, with token usage and a Prometheus metrics file"""
+        usage = self.client.metrics.summary(technique="prompt_chaining")
+        if self.sink is not None:
+            self.sink.close()
+            filename = self.sink.path.split(".jsonl")[0] + ".json"
+            write_summary(self.sink.path, filename, extra={"usage": usage})
+            self.sink = None
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"prompt_chaining_results_{timestamp}.json"
+            
+            output_data = {
+                "technique": "Prompt Chaining",
+                "model": self.model,
+                "timestamp": timestamp,
+                "total_workflows": len(self.chains),
+                "workflows": self.chains,
+                "usage": usage
+            }
+            
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        metrics_file = filename.rsplit(".json", 1)[0] + ".prom"
+        self.client.metrics.write_prometheus(metrics_file)
+        totals = usage["totals"]
         
         print(f"\n{'='*70}")
         print(f"Results saved to: {filename}")
+        print(f"Metrics saved to: {metrics_file}")
+        print(f"Usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+              f"{totals['completion_tokens']} completion tokens, est. ${totals['cost_usd']:.4f}")
         print(f"{'='*70}")
     
-    def run_all_workflows(self):
+    def run_all_workflows(self, resume: bool = False):
         """Execute all prompt chaining workflows"""
         print("\n" + "="*70)
         print("PROMPT CHAINING DEMONSTRATION")
@@ -609,11 +689,13 @@ Provide the refactored code with comments explaining changes:"""
         print("="*70)
         
         try:
-            self.content_creation_pipeline()
-            self.data_analysis_workflow()
-            self.customer_support_workflow()
-            self.research_synthesis_workflow()
-            self.code_review_workflow()
+            self.open_manifest(resume)
+            self.open_result_sink()
+            self.run_task(self.content_creation_pipeline)
+            self.run_task(self.data_analysis_workflow)
+            self.run_task(self.customer_support_workflow)
+            self.run_task(self.research_synthesis_workflow)
+            self.run_task(self.code_review_workflow)
             
             self.save_results()
             
@@ -625,8 +707,13 @@ Provide the refactored code with comments explaining changes:"""
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Prompt chaining workflows")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip tasks completed by a previous interrupted run")
+    args = parser.parse_args()
+    
     chaining = PromptChaining()
-    chaining.run_all_workflows()
+    chaining.run_all_workflows(resume=args.resume)
 
 
 if __name__ == "__main__":
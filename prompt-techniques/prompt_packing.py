@@ -0,0 +1,137 @@
+"""
+Prompt Packing
+==============
+Classify many short items per request. Up to K items are numbered inside
+one prompt that carries the shared instructions and few-shot examples only
+once, and the model answers with one numbered line per item. K adapts to
+the prompt and completion token budgets. Items whose answer is missing or
+is not one of the allowed labels fall back to an individual call.
+"""
+
+import re
+import asyncio
+
+from rate_limiter import estimate_tokens
+
+_NUMBERED = re.compile(r"^\s*(?:item\s*)?[(\[]?(\d+)[)\].:\-]\s*(.+?)\s*$", re.IGNORECASE)
+
+
+def number_items(texts: list) -> str:
+    """Render items as a numbered list, one per line"""
+    return "\n".join(f"{n}. {text}" for n, text in enumerate(texts, 1))
+
+
+def answer_format(count: int, labels: list) -> str:
+    """Instruction asking for exactly one numbered label per item"""
+    return (f"Answer with exactly {count} lines, one per item in order, formatted as "
+            f"'<number>. <label>' where <label> is one of: {', '.join(labels)}. "
+            f"Do not add explanations.")
+
+
+def match_label(answer: str, labels: list):
+    """The allowed label an answer names, or None"""
+    text = answer.lower()
+    for label in sorted(labels, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(label.lower())}\b", text):
+            return label
+    return None
+
+
+def parse_numbered(text: str, count: int, labels: list) -> dict:
+    """Map item number (1-based) to its label for every well-formed answer line"""
+    answers = {}
+    for line in text.splitlines():
+        match = _NUMBERED.match(line)
+        if not match:
+            continue
+        number = int(match.group(1))
+        if 1 <= number <= count and number not in answers:
+            label = match_label(match.group(2), labels)
+            if label is not None:
+                answers[number] = label
+    return answers
+
+
+def plan_packs(item_tokens: list, base_tokens: int, max_items: int, max_prompt_tokens: int,
+               answer_tokens: int, max_completion_tokens: int) -> list:
+    """Group item indexes into packs that respect the item, prompt and completion budgets"""
+    packs, current, used = [], [], base_tokens
+    for idx, tokens in enumerate(item_tokens):
+        full = current and (
+            len(current) >= max_items
+            or used + tokens > max_prompt_tokens
+            or (len(current) + 1) * answer_tokens > max_completion_tokens
+        )
+        if full:
+            packs.append(current)
+            current, used = [], base_tokens
+        current.append(idx)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def classify_packed(call_model, items: list, render_pack, call_single, labels: list,
+                          item_text=str, max_items: int = 20, max_prompt_tokens: int = 2000,
+                          answer_tokens: int = 8, max_completion_tokens: int = 512,
+                          concurrency: int = 8, temperature: float = 0.2, on_result=None) -> tuple:
+    """
+    Label items with packed requests.
+    render_pack(items) -> prompt listing the items (see number_items / answer_format)
+    call_single(item) -> coroutine giving the answer text for one item, used as the fallback
+    item_text(item) -> the text of an item, for token estimates
+    on_result(index, result) -> called as soon as each item's result is final
+    Returns (results, stats): one dict per item, in input order, and request/fallback counts.
+    Every result's "output" is the label (or a fallback answer that names none), with
+    "packed" telling how it was obtained; fallbacks also keep the full "response".
+    Failed fallbacks give {"error"}.
+    """
+    base_tokens = estimate_tokens(render_pack([]))
+    packs = plan_packs([estimate_tokens(item_text(item)) + 4 for item in items], base_tokens,
+                       max_items, max_prompt_tokens, answer_tokens, max_completion_tokens)
+    results = [None] * len(items)
+    fallback = []
+    stats = {"items": len(items), "packed_requests": len(packs), "fallback_requests": 0}
+
+    def finish(idx, result):
+        results[idx] = result
+        if on_result is not None:
+            on_result(idx, result)
+
+    async def run_pack(indexes):
+        pack = [items[idx] for idx in indexes]
+        try:
+            text = await call_model(render_pack(pack), temperature=temperature,
+                                    max_tokens=len(pack) * answer_tokens + 16)
+            answers = parse_numbered(text, len(pack), labels)
+        except Exception:
+            answers = {}
+        for number, idx in enumerate(indexes, 1):
+            if number in answers:
+                finish(idx, {"output": answers[number], "packed": True})
+            else:
+                fallback.append(idx)
+
+    async def run_single(idx):
+        try:
+            response = await call_single(items[idx])
+        except Exception as e:
+            finish(idx, {"error": str(e)})
+            return
+        finish(idx, {"output": match_label(response, labels) or response.strip(), "response": response,
+                     "packed": False})
+
+    async def drain(jobs, run):
+        jobs = iter(jobs)
+
+        async def worker():
+            for job in jobs:
+                await run(job)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    await drain(packs, run_pack)
+    stats["fallback_requests"] = len(fallback)
+    await drain(sorted(fallback), run_single)
+    return results, stats
@@ -0,0 +1,46 @@
+"""
+Prompt Templates
+================
+Few-shot prompts whose instruction and examples never change between inputs.
+The static prefix is rendered once; each call only formats the short per-item
+suffix. Because the prefix is byte-for-byte identical on every request,
+provider-side prefix caching can reuse it.
+"""
+
+import string
+import hashlib
+
+
+class PromptTemplate:
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        self.fields = [name for _, name, _, _ in string.Formatter().parse(suffix) if name]
+        self.num_examples = 0
+
+    @classmethod
+    def few_shot(cls, instruction: str, examples: list, example_format: str, suffix: str,
+                 query_header: str, examples_header: str = None, numbered: bool = False):
+        """
+        Build a template from an instruction and a list of example dicts.
+        example_format is a str.format pattern applied to each example; numbered
+        examples get an "Example N:" header line.
+        """
+        parts = [instruction]
+        if examples_header:
+            parts.append(examples_header)
+        for n, example in enumerate(examples, 1):
+            text = example_format.format(**example)
+            parts.append(f"Example {n}:\n{text}" if numbered else text)
+        parts.append(query_header)
+        template = cls("\n\n".join(parts) + "\n\n", suffix)
+        template.num_examples = len(examples)
+        return template
+
+    def render(self, **fields) -> str:
+        """Append the formatted per-item suffix to the pre-rendered prefix"""
+        return self.prefix + self.suffix.format(**fields)
+
+    def __repr__(self):
+        return f"PromptTemplate(prefix={len(self.prefix)} chars #{self.prefix_hash}, fields={self.fields})"
@@ -0,0 +1,153 @@
+"""
+Rate Limit Scheduler
+====================
+Paces every request from this process against Groq's requests-per-minute and
+tokens-per-minute budgets using two token buckets. Prompt tokens are estimated
+before sending and the reservation is corrected from the reported usage.
+Requests wait in FIFO order for budget; 429 and 5xx responses are retried with
+jittered exponential backoff, and a Retry-After header pauses the whole queue.
+"""
+
+import os
+import time
+import random
+import asyncio
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting: about four characters per token"""
+    return len(text) // 4 + 1
+
+
+def estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    """Tokens a request may consume: prompt estimate, per-message overhead and the completion cap"""
+    prompt = sum(estimate_tokens(message["content"]) + 4 for message in messages)
+    return prompt + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """Add tokens for the time elapsed since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (never longer than one full refill)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        """Remove tokens; the balance may go negative for oversized requests"""
+        self._refill()
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        """Return unused tokens to the bucket"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimitScheduler:
+    def __init__(self, requests_per_minute: float = 30, tokens_per_minute: float = 6000,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.rate_limited = 0
+        self._blocked_until = 0.0
+        self._lock = None
+
+    async def acquire(self, estimated_tokens: int):
+        """Wait in FIFO order until both budgets allow the request, then reserve it"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                wait = max(
+                    self._blocked_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens),
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Refund the difference between the reservation and the tokens actually used"""
+        if actual_tokens is not None and actual_tokens < estimated_tokens:
+            self.tokens.give_back(estimated_tokens - actual_tokens)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Retry-After when the server sends one, otherwise full-jitter exponential backoff"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, self.base_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, send, estimated_tokens: int, timing: dict = None):
+        """
+        Pace and send a request, retrying rate-limit and server errors.
+        timing, when given, is filled with queue_time (waiting for budget or
+        backing off), network_time (inside send) and retries.
+        """
+        timing = {} if timing is None else timing
+        timing.update(queue_time=0.0, network_time=0.0, retries=0)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            await self.acquire(estimated_tokens)
+            sent = time.perf_counter()
+            timing["queue_time"] += sent - queued
+            try:
+                return await send()
+            except Exception as e:
+                # groq is imported here rather than at startup; the client that raised has loaded it
+                import groq
+                if not isinstance(e, (groq.RateLimitError, groq.InternalServerError,
+                                      groq.APIConnectionError, groq.APITimeoutError)):
+                    raise
+                error = e
+            finally:
+                timing["network_time"] += time.perf_counter() - sent
+            if attempt == self.max_retries:
+                raise error
+            delay = self._backoff(attempt, error)
+            self.retries += 1
+            timing["retries"] += 1
+            if isinstance(error, groq.RateLimitError):
+                # The server says we are over budget: hold every queued request
+                self.rate_limited += 1
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            await asyncio.sleep(delay)
+            timing["queue_time"] += delay
+
+    def stats(self) -> dict:
+        """Retry counters for this process"""
+        return {"retries": self.retries, "rate_limited": self.rate_limited}
+
+
+def scheduler_from_env() -> RateLimitScheduler:
+    """Build the scheduler from GROQ_RPM / GROQ_TPM / GROQ_MAX_RETRIES"""
+    return RateLimitScheduler(
+        requests_per_minute=float(os.environ.get("GROQ_RPM", 30)),
+        tokens_per_minute=float(os.environ.get("GROQ_TPM", 6000)),
+        max_retries=int(os.environ.get("GROQ_MAX_RETRIES", 5)),
+    )
@@ -0,0 +1,132 @@
+"""
+Response Cache
+==============
+Persistent, content-addressed cache for model responses.
+Entries are keyed by a hash of model, messages, temperature and max_tokens,
+expire after a TTL, and are evicted least-recently-used once the cache grows
+past its size limit. Backed by SQLite in WAL mode so several processes on one
+host can share the same cache file.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResponseCache:
+    def __init__(self, path: str = ".llm_cache/responses.db", ttl: float = 7 * 24 * 3600,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+        """Content hash identifying one request"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached response, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response and evict the least recently used entries if over the size limit"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            # Size accounting scans the table, so only check it every few inserts
+            self._puts += 1
+            if self._puts % 50 == 1:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the oldest-accessed ones until under max_bytes"""
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so that eviction does not run on every following insert
+        target = int(self.max_bytes * 0.9)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                if total <= target:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and the current cache size"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+def cache_from_env():
+    """Build the default cache from LLM_CACHE_* environment variables, or None if disabled"""
+    if os.environ.get("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    return ResponseCache(
+        path=os.environ.get("LLM_CACHE_PATH", ".llm_cache/responses.db"),
+        ttl=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+        max_bytes=int(float(os.environ.get("LLM_CACHE_MAX_MB", 256)) * 1024 * 1024),
+    )
@@ -0,0 +1,138 @@
+"""
+Result Sink
+===========
+Append-only JSONL result files written one record at a time.
+Each record is flushed as soon as it is produced, so a crash loses at most
+the record being written and memory stays flat for any run length. Files
+ending in .gz are gzip-compressed with a sync flush per record.
+The reader tolerates a truncated tail and can rebuild the JSON summary
+that save_results has always produced.
+"""
+
+import os
+import gzip
+import json
+import zlib
+
+
+def _open(path: str, mode: str):
+    """Open a text file, transparently gzip-compressed for .gz paths"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class JsonlResultWriter:
+    def __init__(self, path: str, header: dict, fsync: bool = False):
+        """
+        path: output file; a .gz suffix enables compression
+        header: run metadata (technique, model, timestamp, collection, count_key)
+        fsync: also force each record to disk, not just to the OS
+        """
+        self.path = path
+        self.fsync = fsync
+        self.count = 0
+        resume = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = _open(path, "a")
+        if not resume:
+            self._write_line({"type": "header", **header})
+
+    def _write_line(self, payload: dict):
+        """Write one JSON line and push it out of Python's buffers"""
+        self._file.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        # For gzip this is a Z_SYNC_FLUSH, so every record is decodable on its own
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def write(self, record: dict):
+        """Append one result and flush it"""
+        self._write_line({"type": "result", "data": record})
+        self.count += 1
+
+    def close(self):
+        """Close the file; everything written is already flushed"""
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_lines(path: str):
+    """Yield decoded JSON lines, stopping quietly at a truncated or corrupt tail"""
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    return
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            return
+
+
+def read_header(path: str) -> dict:
+    """Run metadata from the first line of a result file"""
+    for payload in _iter_lines(path):
+        if payload.get("type") == "header":
+            return {k: v for k, v in payload.items() if k != "type"}
+        break
+    raise ValueError(f"{path} has no result header")
+
+
+def iter_records(path: str):
+    """Stream the result records of a JSONL file"""
+    for payload in _iter_lines(path):
+        if payload.get("type") == "result":
+            yield payload["data"]
+
+
+def _summary_fields(header: dict, count: int) -> dict:
+    """Top-level summary fields in save_results order"""
+    return {
+        "technique": header["technique"],
+        "model": header["model"],
+        "timestamp": header["timestamp"],
+        header.get("count_key", "total_tasks"): count,
+    }
+
+
+def rebuild_summary(path: str, extra: dict = None) -> dict:
+    """Load a JSONL result file into the JSON summary format used by save_results"""
+    header = read_header(path)
+    records = list(iter_records(path))
+    summary = _summary_fields(header, len(records))
+    summary[header.get("collection", "results")] = records
+    summary.update(extra or {})
+    return summary
+
+
+def write_summary(path: str, json_path: str, extra: dict = None):
+    """
+    Write the JSON summary for a JSONL result file without holding all records in memory.
+    extra: additional top-level fields written after the records (e.g. usage)
+    """
+    header = read_header(path)
+    count = sum(1 for _ in iter_records(path))
+    fields = _summary_fields(header, count)
+    collection = header.get("collection", "results")
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for key, value in fields.items():
+            f.write(f"  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+        f.write(f"  {json.dumps(collection)}: [")
+        for idx, record in enumerate(iter_records(path)):
+            body = json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n    ")
+            f.write(("," if idx else "") + "\n    " + body)
+        f.write("\n  ]" if count else "]")
+        for key, value in (extra or {}).items():
+            body = json.dumps(value, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            f.write(f",\n  {json.dumps(key)}: {body}")
+        f.write("\n}")
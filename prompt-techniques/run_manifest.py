@@ -0,0 +1,75 @@
+"""
+Run Manifest
+============
+Checkpoints for resumable runs. Every completed task or chain step is
+appended to a JSONL manifest together with a hash of its inputs and its
+output. A resumed run replays matching entries instead of calling the model
+again; an entry whose input hash no longer matches is treated as not done.
+"""
+
+import os
+import json
+import hashlib
+
+
+def hash_inputs(*parts) -> str:
+    """Stable hash of any JSON-serializable inputs"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RunManifest:
+    def __init__(self, path: str, salt: str = "", resume: bool = False):
+        """
+        path: manifest file, kept at a fixed name so a later run can resume it
+        salt: mixed into every input hash (e.g. the model name)
+        resume: load existing entries; otherwise the manifest starts empty
+        """
+        self.path = path
+        self.salt = salt
+        self.entries = {}
+        self.replayed = 0
+        if resume and os.path.exists(path):
+            # Cut off a line left half-written by a crash, so new entries start on a fresh line
+            with open(path, "r+b") as f:
+                f.truncate(self._load())
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> int:
+        """Read completed entries, ignoring a partially written last line; returns the bytes they span"""
+        end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                self.entries[entry["key"]] = entry
+                end += len(line)
+        return end
+
+    def input_hash(self, *parts) -> str:
+        """Hash of a task's inputs, salted for this manifest"""
+        return hash_inputs(self.salt, *parts)
+
+    def get(self, key: str, input_hash: str):
+        """Output of a completed entry with the same inputs, or None"""
+        entry = self.entries.get(key)
+        if entry is None or entry["input_hash"] != input_hash:
+            return None
+        self.replayed += 1
+        return entry["output"]
+
+    def record(self, key: str, input_hash: str, output):
+        """Mark a task or step complete; flushed immediately"""
+        entry = {"key": key, "input_hash": input_hash, "output": output}
+        self.entries[key] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """Close the manifest file"""
+        if not self._file.closed:
+            self._file.close()
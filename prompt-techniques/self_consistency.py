@@ -0,0 +1,117 @@
+"""
+Self-Consistency Sampling
+=========================
+Draw several chain-of-thought samples for the same prompt, extract each
+sample's final answer and take the majority vote.
+Samples are launched concurrently, but only as many as could still change
+the outcome: once the leading answer cannot be overtaken by the samples
+left in the budget, in-flight samples are cancelled and no more are sent.
+A sample whose call fails abstains; the vote only fails when every sample does.
+"""
+
+import re
+import asyncio
+from collections import Counter
+
+from llm_client import LLMError
+
+ANSWER_INSTRUCTION = "\n\nFinish with a final line of the form: Final Answer: <answer>"
+
+_FINAL_ANSWER = re.compile(r"final answer\s*[:\-]\s*(.+)", re.IGNORECASE)
+_ANSWER_IS = re.compile(r"answer is\s*[:\-]?\s*(.+)", re.IGNORECASE)
+_NUMBER = re.compile(r"-?\$?\d[\d,]*(?:\.\d+)?")
+
+
+def normalize_answer(answer: str) -> str:
+    """Canonical form for voting: numbers without $ or commas, text lowercased without punctuation"""
+    answer = answer.strip().strip("*").strip()
+    numbers = _NUMBER.findall(answer)
+    if len(numbers) == 1 and len(answer) <= len(numbers[0]) + 15:
+        value = numbers[0].replace("$", "").replace(",", "")
+        return value.rstrip("0").rstrip(".") if "." in value else value
+    return re.sub(r"[^a-z0-9]+", " ", answer.lower()).strip()
+
+
+def extract_answer(text: str):
+    """Pull the final answer out of a reasoning trace, or None if there is none"""
+    for pattern in (_FINAL_ANSWER, _ANSWER_IS):
+        matches = pattern.findall(text)
+        if matches:
+            return normalize_answer(matches[-1].splitlines()[0])
+    numbers = _NUMBER.findall(text)
+    if numbers:
+        return normalize_answer(numbers[-1])
+    return None
+
+
+def _samples_needed(counts: Counter, done: int, n: int) -> int:
+    """Fewest extra samples that could decide the vote if they all agreed with the leader"""
+    top = counts.most_common(2) + [(None, 0), (None, 0)]
+    leader, runner_up = top[0][1], top[1][1]
+    return min(n - done, (runner_up + n - done - leader) // 2 + 1)
+
+
+async def vote(call_model, prompt: str, n: int = 10, temperature: float = 0.7,
+               max_tokens: int = 2048, extract=extract_answer, **call_kwargs) -> dict:
+    """
+    Majority vote over up to n samples of call_model(prompt).
+    Returns the winning answer, one reasoning trace that reached it, the vote
+    counts and how many samples were actually drawn. Failed samples abstain;
+    the first failure is raised only when no sample succeeded.
+    """
+    prompt = prompt + ANSWER_INSTRUCTION
+    counts = Counter()
+    traces = {}
+    errors = []
+    done = 0
+    launched = 0
+    in_flight = set()
+
+    def launch(count):
+        nonlocal launched
+        for _ in range(count):
+            in_flight.add(asyncio.ensure_future(
+                call_model(prompt, temperature=temperature, max_tokens=max_tokens, **call_kwargs)
+            ))
+            launched += 1
+
+    launch(_samples_needed(counts, 0, n))
+    try:
+        while in_flight:
+            finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                in_flight.discard(task)
+                done += 1
+                try:
+                    text = task.result()
+                except LLMError as e:
+                    errors.append(e)
+                    continue
+                answer = extract(text)
+                if answer is not None:
+                    counts[answer] += 1
+                    traces.setdefault(answer, text)
+
+            top = counts.most_common(2) + [(None, 0), (None, 0)]
+            if top[0][1] > top[1][1] + (n - done):
+                break
+            missing = _samples_needed(counts, done, n) - len(in_flight)
+            if missing > 0 and launched < n:
+                launch(min(missing, n - launched))
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    if errors and len(errors) == done:
+        raise errors[0]
+
+    answer = counts.most_common(1)[0][0] if counts else None
+    return {
+        "answer": answer,
+        "output": traces.get(answer, ""),
+        "votes": dict(counts),
+        "samples_used": done,
+        "samples_cancelled": launched - done,
+        "samples_failed": len(errors),
+        "sample_budget": n,
+    }
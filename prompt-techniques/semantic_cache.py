@@ -0,0 +1,234 @@
+"""
+Semantic Cache
+==============
+Response cache for near-duplicate prompts. Each lookup has a scope that must
+match exactly after normalization (e.g. the QA context or the category list)
+and a text that may vary (e.g. the question or the article). The text is
+normalized, embedded with a local CPU model and compared against an
+in-process vector index; a cached answer is returned when the closest earlier
+text in the same scope, model and sampling settings is at least `threshold`
+cosine-similar. Embedding only the varying part keeps a long shared template
+from making unrelated inputs look alike.
+
+The default embedder is a local sentence-transformers model. A similar
+vector alone is not a hit: the two texts must also agree on their guard
+tokens. For the model these are the numbers and negations, which sentence
+embeddings barely register ("great" vs "not great"). The dependency-free
+HashingEmbedder ('hashing') is purely lexical and rates "...in Europe?" and
+"...in Asia?" as near-identical, so its guard is the whole word set and its
+threshold is stricter: it only merges whitespace, casing and punctuation
+variants.
+
+Enabled with LLM_SEMANTIC_CACHE=1. Needs the optional numpy and
+sentence-transformers packages (see requirements.txt); LLM_SEMANTIC_MODEL=hashing
+needs numpy only.
+"""
+
+import os
+import re
+import time
+import zlib
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("The semantic cache needs numpy: pip install numpy sentence-transformers") from None
+
+NEGATIONS = frozenset({"no", "not", "never", "none", "nor", "neither", "nothing", "nobody", "nowhere",
+                       "without", "cannot", "t"})
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so formatting-only differences vanish"""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def meaning_tokens(text: str) -> frozenset:
+    """Numbers and negations ("n't" splits off a "t"), which must match for two texts to share an answer"""
+    return frozenset(word for word in re.findall(r"\w+", text) if word in NEGATIONS or any(c.isdigit() for c in word))
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams, word bigrams and character trigrams"""
+
+    # Lexical similarity cannot tell "Europe" from "Asia", so a hit needs the same words
+    threshold = 0.95
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def guard(self, text: str) -> frozenset:
+        return frozenset(re.findall(r"\w+", text))
+
+    def _features(self, text: str):
+        words = re.findall(r"\w+", text)
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+        yield from (text[i:i + 3] for i in range(len(text) - 2))
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model run on the CPU"""
+
+    threshold = 0.9
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("The semantic cache needs sentence-transformers: pip install sentence-transformers "
+                              "(or LLM_SEMANTIC_MODEL=hashing for exact-wording matches only)") from None
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+
+    def guard(self, text: str) -> frozenset:
+        return meaning_tokens(text)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def make_embedder(name: str = DEFAULT_MODEL):
+    """A sentence-transformers model name, or 'hashing' for the dependency-free embedder"""
+    if name == "hashing":
+        return HashingEmbedder()
+    return SentenceTransformerEmbedder(name)
+
+
+class _Index:
+    """Unit vectors in a preallocated matrix; full indexes overwrite their oldest entry"""
+
+    def __init__(self, dim: int, max_entries: int):
+        self.vectors = np.zeros((min(16, max_entries), dim), dtype=np.float32)
+        self.responses = []
+        self.guards = []
+        self.max_entries = max_entries
+        self.added = 0
+
+    def __len__(self):
+        return len(self.responses)
+
+    def search(self, vector: np.ndarray, guard: frozenset, threshold: float):
+        """(similarity, response) of the closest entry with the same guard, or (None, None) below threshold"""
+        if not self.responses:
+            return None, None
+        scores = self.vectors[:len(self.responses)] @ vector
+        close = np.flatnonzero(scores >= threshold)
+        for i in close[np.argsort(-scores[close], kind="stable")]:
+            if self.guards[i] == guard:
+                return float(scores[i]), self.responses[i]
+        return None, None
+
+    def add(self, vector: np.ndarray, guard: frozenset, response: str):
+        if len(self.responses) < self.max_entries:
+            if len(self.responses) == len(self.vectors):
+                grown = np.zeros((min(len(self.vectors) * 2, self.max_entries), self.vectors.shape[1]),
+                                 dtype=np.float32)
+                grown[:len(self.vectors)] = self.vectors
+                self.vectors = grown
+            slot = len(self.responses)
+            self.responses.append(response)
+            self.guards.append(guard)
+        else:
+            slot = self.added % self.max_entries
+            self.responses[slot] = response
+            self.guards[slot] = guard
+        self.vectors[slot] = vector
+        self.added += 1
+
+
+class SemanticCache:
+    def __init__(self, embedder=None, threshold: float = None, max_entries: int = 50000):
+        """
+        embedder: object with embed(text) -> unit vector and guard(text) -> tokens that must match
+                  (default: SentenceTransformerEmbedder)
+        threshold: minimum cosine similarity for a hit (default: the embedder's own)
+        max_entries: per model/settings index; the oldest entries are overwritten beyond it
+        """
+        self.embedder = embedder or SentenceTransformerEmbedder()
+        self.threshold = threshold if threshold is not None else getattr(self.embedder, "threshold", 0.9)
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_time = 0.0
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, settings: tuple, scope: str, text: str) -> tuple:
+        """
+        Look up the nearest cached text for these settings (model, temperature, max_tokens) and scope.
+        Returns (response or None, probe); pass the probe to put() on a miss.
+        """
+        start = time.perf_counter()
+        namespace = settings + (normalize_text(scope),)
+        text = normalize_text(text)
+        probe = (self.embedder.embed(text), self.embedder.guard(text))
+        with self._lock:
+            index = self._indexes.get(namespace)
+            score, response = index.search(*probe, self.threshold) if index is not None else (None, None)
+            hit = score is not None
+            self.lookups += 1
+            self.hits += int(hit)
+            self.lookup_time += time.perf_counter() - start
+        return response, probe
+
+    def put(self, settings: tuple, scope: str, probe: tuple, response: str):
+        """Index a fresh response under the probe returned by get()"""
+        namespace = settings + (normalize_text(scope),)
+        vector, guard = probe
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = _Index(len(vector), self.max_entries)
+            index.add(vector, guard, response)
+
+    def stats(self) -> dict:
+        """Hit rate, mean lookup latency and index size"""
+        with self._lock:
+            entries = sum(len(index) for index in self._indexes.values())
+            index_bytes = sum(index.vectors.nbytes for index in self._indexes.values())
+            return {
+                "embedder": self.embedder.name,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "avg_lookup_ms": round(1000 * self.lookup_time / self.lookups, 3) if self.lookups else 0.0,
+                "entries": entries,
+                "index_bytes": index_bytes,
+            }
+
+    def prometheus_samples(self) -> list:
+        """(name, type, help, value) samples for CallMetrics.to_prometheus"""
+        stats = self.stats()
+        return [
+            ("llm_semantic_cache_lookups_total", "counter", "Semantic cache lookups", stats["lookups"]),
+            ("llm_semantic_cache_hits_total", "counter", "Semantic cache hits", stats["hits"]),
+            ("llm_semantic_cache_lookup_seconds_total", "counter", "Time spent embedding and searching",
+             round(self.lookup_time, 6)),
+            ("llm_semantic_cache_entries", "gauge", "Prompts in the semantic index", stats["entries"]),
+            ("llm_semantic_cache_index_bytes", "gauge", "Memory held by index vectors", stats["index_bytes"]),
+        ]
+
+
+def semantic_cache_from_env():
+    """Build the semantic cache when LLM_SEMANTIC_CACHE=1 (LLM_SEMANTIC_MODEL, LLM_SEMANTIC_THRESHOLD)"""
+    if os.environ.get("LLM_SEMANTIC_CACHE", "").lower() not in ("1", "true", "yes"):
+        return None
+    threshold = os.environ.get("LLM_SEMANTIC_THRESHOLD")
+    return SemanticCache(
+        embedder=make_embedder(os.environ.get("LLM_SEMANTIC_MODEL", DEFAULT_MODEL)),
+        threshold=float(threshold) if threshold else None,
+        max_entries=int(os.environ.get("LLM_SEMANTIC_MAX_ENTRIES", 50000)),
+    )
@@ -0,0 +1,188 @@
+"""
+Sharded Runner
+==============
+Multi-process batch runs for input corpora too large for one event loop.
+The input JSONL is split into byte ranges on line boundaries without being
+read by the coordinator. A pool of worker processes picks up shards; each
+worker has its own client, connection pool and event loop and runs the task
+spec over its shard with the TaskRunner, writing results in input order.
+Every record carries the byte offset of its input line; the coordinator
+streams the shard outputs through a merge on that offset, numbers them with a
+global index and tallies calls, tokens and cost.
+A spec's limit is applied once, by ending the last shard after that many
+rows.
+
+Each worker gets an equal slice of the GROQ_RPM / GROQ_TPM budgets, so the
+processes together stay within the account limits.
+
+Usage:
+    python sharded_runner.py tasks/word_problems.yaml --processes 8 --concurrency 16
+"""
+
+import os
+import time
+import heapq
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from result_sink import JsonlResultWriter, iter_records
+
+
+def limit_end(path: str, limit: int) -> int:
+    """Byte offset just past the first `limit` non-blank lines of a JSONL file"""
+    count = 0
+    with open(path, "rb") as f:
+        while count < limit:
+            line = f.readline()
+            if not line:
+                break
+            count += bool(line.strip())
+        return f.tell()
+
+
+def shard_ranges(path: str, shards: int, size: int = None) -> list:
+    """Split the first `size` bytes of a file (default all) into roughly equal (start, end) ranges"""
+    size = os.path.getsize(path) if size is None else size
+    shards = max(1, min(shards, size))
+    bounds = [size * i // shards for i in range(shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(shards) if bounds[i] < bounds[i + 1]]
+
+
+def _init_worker(budget: dict):
+    """Give each worker process its share of the rate-limit budget before a client exists"""
+    os.environ.update(budget)
+
+
+def run_shard(spec_path: str, task: str, shard: int, byte_range: tuple, output: str,
+              concurrency: int) -> dict:
+    """Worker entry point: run one task over one byte range of its input"""
+    from task_runner import TaskRunner, load_specs
+
+    spec = next(spec for spec in load_specs(spec_path) if spec.name == task)
+    spec.byte_range = byte_range
+    # The coordinator already cut the ranges off after `limit` rows
+    spec.limit = None
+    spec.output = output
+    runner = TaskRunner([spec], concurrency, ordered=True)
+    # The client (and its connection pool) is reused by later shards in this process,
+    # so count only this shard's calls
+    runner.client.metrics.reset()
+    stats = runner.run()[0]
+    totals = runner.client.metrics.summary()["totals"]
+    return {**stats, "shard": shard, "pid": os.getpid(), "calls": totals["calls"],
+            "retries": totals["retries"]}
+
+
+def merge_shards(shard_paths: list, output: str, header: dict) -> int:
+    """
+    Stream shard results into one JSONL file in input order, then remove the shards. Each shard
+    is already in offset order, so a heap merge on the offset never holds more than one record
+    per shard; the merged index counts rows across the whole input.
+    """
+    def tagged_records(shard, path):
+        for record in iter_records(path):
+            yield {"shard": shard, **record}
+
+    count = 0
+    streams = [tagged_records(shard, path) for shard, path in enumerate(shard_paths)]
+    with JsonlResultWriter(output, header) as writer:
+        for record in heapq.merge(*streams, key=lambda record: record["offset"]):
+            writer.write({**record, "index": count})
+            count += 1
+    for path in shard_paths:
+        os.remove(path)
+    return count
+
+
+def run_sharded(spec_path: str, task: str = None, processes: int = None, shards: int = None,
+                concurrency: int = 16, output: str = None) -> dict:
+    """Shard one task's input across a process pool and merge the results"""
+    from task_runner import load_specs
+
+    specs = load_specs(spec_path)
+    spec = specs[0] if task is None else next(spec for spec in specs if spec.name == task)
+    if not spec.input.endswith((".jsonl", ".ndjson")):
+        raise ValueError(f"Sharded runs need an uncompressed JSONL input, got {spec.input}")
+
+    processes = processes or os.cpu_count() or 1
+    # Several shards per process keep every worker busy when rows vary in cost
+    size = limit_end(spec.input, spec.limit) if spec.limit is not None else None
+    ranges = shard_ranges(spec.input, shards or processes * 4, size)
+    output = output or spec.output
+    shard_dir = output + ".shards"
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_paths = [os.path.join(shard_dir, f"shard_{i:05d}.jsonl") for i in range(len(ranges))]
+
+    budget = {
+        "GROQ_RPM": str(float(os.environ.get("GROQ_RPM", 30)) / processes),
+        "GROQ_TPM": str(float(os.environ.get("GROQ_TPM", 6000)) / processes),
+    }
+    # spawn, not fork: a forked child would inherit the parent's client thread state
+    context = multiprocessing.get_context("spawn")
+
+    start = time.perf_counter()
+    shard_stats = []
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker,
+                             initargs=(budget,)) as pool:
+        futures = [
+            pool.submit(run_shard, os.path.abspath(spec_path), spec.name, i, byte_range,
+                        os.path.abspath(shard_paths[i]), concurrency)
+            for i, byte_range in enumerate(ranges)
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            shard_stats.append(stats)
+            print(f"  shard {stats['shard'] + 1}/{len(ranges)} done: {stats['items']} items "
+                  f"({stats['errors']} failed) in {stats['wall_time']}s [pid {stats['pid']}]", flush=True)
+    wall_time = time.perf_counter() - start
+
+    items = merge_shards(shard_paths, output, {
+        "technique": spec.technique,
+        "model": spec.model,
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "collection": "results",
+        "count_key": "total_tasks",
+        "task": spec.name,
+        "input": spec.input,
+        "shards": len(ranges),
+    })
+    os.rmdir(shard_dir)
+
+    totals = {key: sum(stats[key] for stats in shard_stats)
+              for key in ("items", "errors", "calls", "retries", "prompt_tokens", "completion_tokens")}
+    totals["cost_usd"] = round(sum(stats["cost_usd"] for stats in shard_stats), 6)
+    return {
+        "task": spec.name,
+        "output": output,
+        "processes": processes,
+        "shards": len(ranges),
+        "merged": items,
+        "wall_time": round(wall_time, 3),
+        "items_per_sec": round(totals["items"] / wall_time, 2) if wall_time > 0 else None,
+        **totals,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a task spec over a JSONL corpus with a process pool")
+    parser.add_argument("spec", help="YAML or JSON task spec with a JSONL input")
+    parser.add_argument("--task", help="task name when the spec file holds several")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--shards", type=int, default=None, help="input shards (default: 4 per process)")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight calls per process")
+    parser.add_argument("--output", help="merged result file")
+    args = parser.parse_args()
+
+    result = run_sharded(args.spec, args.task, args.processes, args.shards, args.concurrency, args.output)
+    print(f"\n{result['task']}: {result['items']} items ({result['errors']} failed) from "
+          f"{result['shards']} shards on {result['processes']} processes -> {result['output']}")
+    print(f"  {result['wall_time']}s wall, {result['items_per_sec']} items/s, {result['calls']} calls, "
+          f"{result['retries']} retries")
+    print(f"  {result['prompt_tokens']} prompt + {result['completion_tokens']} completion tokens, "
+          f"est. ${result['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
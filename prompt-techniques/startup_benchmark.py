@@ -0,0 +1,95 @@
+"""
+Startup Benchmark
+=================
+Measures how long each CLI entry point takes to start: importing the module,
+and running it with --help. Each measurement is a fresh interpreter, repeated
+and reported as the median with the bare interpreter's startup subtracted. It
+also lists which heavy dependencies (groq, httpx, dotenv, numpy) were loaded
+by the import alone; none should be, since they are needed only for real
+requests. --max-import-ms turns a regression into a non-zero exit code.
+
+Usage:
+    python startup_benchmark.py
+    python startup_benchmark.py --runs 20 --max-import-ms 150 --json startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ENTRY_POINTS = (
+    "zero_shot_prompting",
+    "few_shot_prompting",
+    "chain_of_thought_prompting",
+    "prompt_chaining",
+    "task_runner",
+    "sharded_runner",
+)
+
+HEAVY_MODULES = ("groq", "httpx", "dotenv", "numpy")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_command(args: list, runs: int) -> float:
+    """Median wall time in milliseconds of a fresh interpreter running args"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=HERE, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def heavy_imports(module: str) -> list:
+    """Heavy dependencies loaded as a side effect of importing module"""
+    probe = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", probe], cwd=HERE, check=True,
+                            capture_output=True, text=True).stdout
+    return output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI startup and import time")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters per measurement")
+    parser.add_argument("--only", nargs="+", help="measure only these entry points")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-import-ms", type=float, help="fail if any import takes longer than this")
+    args = parser.parse_args()
+
+    baseline = time_command(["-c", "pass"], args.runs)
+    rows = []
+    for module in ENTRY_POINTS:
+        if args.only and module not in args.only:
+            continue
+        import_ms = time_command(["-c", f"import {module}"], args.runs) - baseline
+        help_ms = time_command([f"{module}.py", "--help"], args.runs) - baseline
+        rows.append({"entry_point": module, "import_ms": round(import_ms, 1),
+                     "help_ms": round(help_ms, 1), "heavy_imports": heavy_imports(module)})
+
+    print(f"\ninterpreter startup: {baseline:.1f} ms (subtracted below, median of {args.runs} runs)\n")
+    print(f"{'entry point':<28}{'import ms':>10}{'--help ms':>11}  heavy modules loaded")
+    for row in rows:
+        print(f"{row['entry_point']:<28}{row['import_ms']:>10.1f}{row['help_ms']:>11.1f}  "
+              f"{', '.join(row['heavy_imports']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"interpreter_ms": round(baseline, 1), "runs": args.runs, "entry_points": rows}, f, indent=2)
+
+    failures = []
+    if args.max_import_ms is not None:
+        failures = [f"{row['entry_point']} imports in {row['import_ms']} ms > {args.max_import_ms} ms"
+                    for row in rows if row["import_ms"] > args.max_import_ms]
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Task Runner
+===========
+Run any of the four prompting techniques over your own datasets.
+A task spec (YAML or JSON) names the technique, its prompt and an input
+file. Inputs are streamed row by row from CSV or JSONL (optionally .gz), so
+files far larger than memory are fine. Every spec in one run shares a single
+pool of workers, and each result is appended to the spec's JSONL output as
+soon as it completes.
+
+Spec fields:
+    name           task name, used for metrics tags and the default output file
+    technique      zero_shot | few_shot | chain_of_thought | prompt_chaining
+    input          .csv or .jsonl file (optionally .gz), relative to the spec file
+    output         result file (default: <name>_results_<timestamp>.jsonl)
+    model, temperature, max_tokens, limit
+    zero_shot:         prompt - str.format template over the input columns
+    few_shot:          instruction, examples, example_format, query_header, suffix
+                       (and optionally examples_header, numbered)
+    chain_of_thought:  prompt, samples (self-consistency vote when > 1), sample_temperature
+    prompt_chaining:   steps - list of {name, prompt, inputs, temperature, max_tokens}
+                       (and optionally budget, context_policy)
+
+A spec file holds one spec, a list of specs, or {"tasks": [...]}.
+
+Usage:
+    python task_runner.py tasks/sentiment.yaml tasks/product_descriptions.json --concurrency 16
+"""
+
+import os
+import csv
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import functools
+from datetime import datetime
+
+from llm_client import get_client, DEFAULT_MODEL, LLMError
+from result_sink import JsonlResultWriter
+from call_metrics import tagged
+from prompt_template import PromptTemplate
+from chain_executor import ChainStep, ChainExecutor
+import self_consistency
+
+TECHNIQUES = ("zero_shot", "few_shot", "chain_of_thought", "prompt_chaining")
+
+COT_TRIGGER = "\n\nLet's solve this step by step:"
+
+
+def load_specs(path: str) -> list:
+    """Read the task specs from a YAML or JSON file"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML task specs need PyYAML: pip install pyyaml") from None
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("tasks", [data])
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [TaskSpec(spec, base_dir) for spec in data]
+
+
+def decode_row(raw) -> dict:
+    """Turn a raw input row (JSONL line bytes, CSV dict or CSV error) into a dict; ValueError if unusable"""
+    if isinstance(raw, csv.Error):
+        raise ValueError(f"Malformed CSV row: {raw}")
+    row = json.loads(raw) if isinstance(raw, bytes) else raw
+    if not isinstance(row, dict):
+        raise ValueError(f"Expected a JSON object per line, got {type(row).__name__}")
+    if None in row:
+        raise ValueError("CSV row has more fields than the header")
+    return row
+
+
+def raw_input_text(raw):
+    """What to record as the input of a row, before it is decoded"""
+    if isinstance(raw, bytes):
+        return raw.decode("utf-8", "replace").rstrip("\r\n")
+    return None if isinstance(raw, csv.Error) else raw
+
+
+def iter_jsonl_range(path: str, start: int, end: int):
+    """Yield (byte offset, raw line) for the lines of an uncompressed JSONL file that start in bytes [start, end)"""
+    with open(path, "rb") as f:
+        if start > 0:
+            # Step back one byte so a line beginning exactly at `start` is kept
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield offset, line
+
+
+def _iter_rows(path: str):
+    """
+    Yield every raw row of a CSV or JSONL file, gzipped or not: JSONL line bytes, CSV dicts, or
+    the csv.Error for a row the reader rejected. Rows are decoded by decode_row, per row.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    row = e
+                yield row
+    elif name.endswith((".jsonl", ".ndjson")):
+        with opener(path, "rb") as f:
+            yield from (line for line in f if line.strip())
+    else:
+        raise ValueError(f"Unsupported input format: {path} (expected .csv or .jsonl)")
+
+
+def iter_inputs(path: str, limit: int = None, byte_range: tuple = None):
+    """
+    Lazily yield (byte offset, raw row) from a CSV or JSONL file, or a (start, end) byte range of a
+    JSONL file. Offsets are only known for byte ranges and are None otherwise.
+    """
+    if byte_range is None:
+        rows = ((None, row) for row in _iter_rows(path))
+    elif path.endswith((".jsonl", ".ndjson")):
+        rows = iter_jsonl_range(path, *byte_range)
+    else:
+        raise ValueError(f"Only uncompressed JSONL inputs can be read by byte range: {path}")
+    for count, item in enumerate(rows):
+        if limit is not None and count >= limit:
+            return
+        yield item
+
+
+class TaskSpec:
+    def __init__(self, spec: dict, base_dir: str = "."):
+        """Validate one spec and build its prompt template or chain"""
+        self.spec = spec
+        self.name = spec.get("name")
+        self.technique = spec.get("technique")
+        if not self.name:
+            raise ValueError("Task spec needs a name")
+        if self.technique not in TECHNIQUES:
+            raise ValueError(f"Task '{self.name}': technique must be one of {TECHNIQUES}")
+        if "input" not in spec:
+            raise ValueError(f"Task '{self.name}' needs an input file")
+
+        self.input = os.path.join(base_dir, spec["input"])
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.output = spec.get("output") or f"{self.name}_results_{timestamp}.jsonl"
+        self.model = spec.get("model", DEFAULT_MODEL)
+        self.temperature = spec.get("temperature", 0.7)
+        self.max_tokens = spec.get("max_tokens", 2048 if self.technique in ("chain_of_thought", "prompt_chaining") else 1024)
+        self.limit = spec.get("limit")
+        self.samples = spec.get("samples", 1)
+        self.sample_temperature = spec.get("sample_temperature", 0.7)
+        self.byte_range = None
+
+        self.template = None
+        self.steps = None
+        if self.technique == "few_shot":
+            self.template = PromptTemplate.few_shot(
+                instruction=self._require("instruction"),
+                examples=self._require("examples"),
+                example_format=self._require("example_format"),
+                suffix=self._require("suffix"),
+                query_header=spec.get("query_header", "Now complete this one:"),
+                examples_header=spec.get("examples_header"),
+                numbered=spec.get("numbered", False),
+            )
+        elif self.technique == "prompt_chaining":
+            self.steps = [ChainStep(**step) for step in self._require("steps")]
+        else:
+            prompt = self._require("prompt")
+            if self.technique == "chain_of_thought" and "step by step" not in prompt.lower():
+                prompt += COT_TRIGGER
+            self.template = PromptTemplate("", prompt)
+
+    def _require(self, field: str):
+        if field not in self.spec:
+            raise ValueError(f"Task '{self.name}' ({self.technique}) needs '{field}'")
+        return self.spec[field]
+
+    def rows(self):
+        """Lazily stream this task's (byte offset, raw row) inputs; decode each with decode_row"""
+        return iter_inputs(self.input, self.limit, self.byte_range)
+
+    async def run(self, client, row: dict) -> dict:
+        """Run the technique on one input row and return its result record"""
+        call_model = functools.partial(client.acall_model, model=self.model)
+        if self.steps is not None:
+            executor = ChainExecutor(call_model)
+            chain_record = await executor.arun(self.name, self.steps, row)
+            return {"output": chain_record["steps"][-1]["output"], "chain": chain_record}
+
+        prompt = self.template.render(**row)
+        if self.technique == "chain_of_thought" and self.samples > 1:
+            # Every sample must be a fresh draw, so bypass the response cache
+            vote = await self_consistency.vote(
+                call_model, prompt, n=self.samples, temperature=self.sample_temperature,
+                max_tokens=self.max_tokens, use_cache=False,
+            )
+            summary = {key: vote[key] for key in ("answer", "votes", "samples_used", "samples_cancelled",
+                                                  "samples_failed", "sample_budget")}
+            return {"output": vote["output"], "self_consistency": summary}
+        output = await call_model(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        return {"output": output}
+
+
+class TaskRunner:
+    def __init__(self, specs: list, concurrency: int = 16, client=None, compress: bool = False,
+                 ordered: bool = False):
+        """
+        specs: TaskSpec objects; all of them share one pool of `concurrency` workers
+        compress: gzip the JSONL outputs
+        ordered: write results in input order, holding back only the records that finish
+            before an earlier row (default: completion order)
+        """
+        self.specs = specs
+        self.concurrency = concurrency
+        self.client = client or get_client()
+        self.compress = compress
+        self.ordered = ordered
+
+    def _items(self):
+        """(spec, index, offset, raw row) for every row of every spec, read only as workers ask for them"""
+        for spec in self.specs:
+            for idx, (offset, raw) in enumerate(spec.rows()):
+                yield spec, idx, offset, raw
+
+    async def arun(self) -> list:
+        """Run every spec over its inputs and return per-task stats"""
+        writers = {}
+        stats = {}
+        for spec in self.specs:
+            path = spec.output + (".gz" if self.compress and not spec.output.endswith(".gz") else "")
+            writers[spec.name] = JsonlResultWriter(path, {
+                "technique": spec.technique,
+                "model": spec.model,
+                "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+                "collection": "results",
+                "count_key": "total_tasks",
+                "task": spec.name,
+                "input": spec.input,
+            })
+            stats[spec.name] = {"task": spec.name, "output": path, "items": 0, "errors": 0}
+
+        start = time.perf_counter()
+        pending = self._items()
+        # Per task: the next index to write and the finished records waiting for it
+        next_index = {spec.name: 0 for spec in self.specs}
+        held = {spec.name: {} for spec in self.specs}
+
+        def write(spec, record):
+            if not self.ordered:
+                writers[spec.name].write(record)
+                return
+            held[spec.name][record["index"]] = record
+            while next_index[spec.name] in held[spec.name]:
+                writers[spec.name].write(held[spec.name].pop(next_index[spec.name]))
+                next_index[spec.name] += 1
+
+        async def worker():
+            for spec, idx, offset, raw in pending:
+                record = {"index": idx, "input": raw_input_text(raw)}
+                if offset is not None:
+                    record["offset"] = offset
+                with tagged(technique=spec.technique, task=spec.name):
+                    try:
+                        record["input"] = row = decode_row(raw)
+                        record.update(await spec.run(self.client, row))
+                    except (LLMError, KeyError, ValueError) as e:
+                        record["error"] = f"{type(e).__name__}: {e}"
+                        stats[spec.name]["errors"] += 1
+                write(spec, record)
+                stats[spec.name]["items"] += 1
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        wall_time = time.perf_counter() - start
+        for spec in self.specs:
+            usage = self.client.metrics.summary(task=spec.name)["totals"]
+            stats[spec.name].update(prompt_tokens=usage["prompt_tokens"],
+                                    completion_tokens=usage["completion_tokens"],
+                                    cost_usd=usage["cost_usd"])
+        return [dict(stats[spec.name], wall_time=round(wall_time, 3)) for spec in self.specs]
+
+    def run(self) -> list:
+        """Blocking wrapper around arun"""
+        return asyncio.run(self.arun())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run prompting techniques over task specs and input files")
+    parser.add_argument("specs", nargs="+", help="YAML or JSON task spec files")
+    parser.add_argument("--concurrency", type=int, default=16, help="workers shared by all tasks")
+    parser.add_argument("--limit", type=int, help="only the first N rows of each input")
+    parser.add_argument("--compress", action="store_true", help="gzip the JSONL outputs")
+    args = parser.parse_args()
+
+    specs = [spec for path in args.specs for spec in load_specs(path)]
+    if args.limit is not None:
+        for spec in specs:
+            spec.limit = args.limit
+
+    print(f"Running {len(specs)} task(s) with {args.concurrency} shared workers")
+    for stat in TaskRunner(specs, args.concurrency, compress=args.compress).run():
+        print(f"\n{stat['task']}: {stat['items']} items ({stat['errors']} failed) -> {stat['output']}")
+        print(f"  {stat['prompt_tokens']} prompt + {stat['completion_tokens']} completion tokens, "
+              f"est. ${stat['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from run_manifest import RunManifest
+
+
+def test_resume_after_truncated_line(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = RunManifest(path)
+    manifest.record("a", "h", 1)
+    manifest.record("b", "h", 2)
+    manifest.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "c", "input_ha')
+
+    manifest = RunManifest(path, resume=True)
+    assert set(manifest.entries) == {"a", "b"}
+    manifest.record("c", "h", 3)
+    manifest.record("d", "h", 4)
+    manifest.close()
+
+    resumed = RunManifest(path, resume=True)
+    assert [resumed.get(key, "h") for key in "abcd"] == [1, 2, 3, 4]
+    resumed.close()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from semantic_cache import HashingEmbedder, SemanticCache, meaning_tokens
+
+SETTINGS = ("model", 0.7, 256)
+
+NEAR_MISSES = [
+    ("How many employees does the company have in Europe?", "How many employees does the company have in Asia?"),
+    ("The battery life is great", "The battery life is not great"),
+    ("The battery life is great", "The battery life isn't great"),
+    ("What was revenue in 2022?", "What was revenue in 2023?"),
+    ("Ship 5 units to the warehouse", "Ship 50 units to the warehouse"),
+]
+
+
+class FakeModelEmbedder:
+    """Maps every text to the same vector, like a sentence model that ignores small differences"""
+
+    threshold = 0.9
+    name = "fake"
+
+    def embed(self, text):
+        return np.ones(4, dtype=np.float32) / 2
+
+    def guard(self, text):
+        return meaning_tokens(text)
+
+
+def cache_with(embedder, text, response="cached"):
+    cache = SemanticCache(embedder=embedder)
+    _, probe = cache.get(SETTINGS, "scope", text)
+    cache.put(SETTINGS, "scope", probe, response)
+    return cache
+
+
+@pytest.mark.parametrize("first, second", NEAR_MISSES)
+def test_hashing_near_misses_miss(first, second):
+    cache = cache_with(HashingEmbedder(), first)
+    assert cache.get(SETTINGS, "scope", second)[0] is None
+
+
+@pytest.mark.parametrize("first, second", NEAR_MISSES[1:])
+def test_model_guard_rejects_numbers_and_negations(first, second):
+    cache = cache_with(FakeModelEmbedder(), first)
+    assert cache.get(SETTINGS, "scope", second)[0] is None
+
+
+def test_formatting_variants_hit():
+    cache = cache_with(HashingEmbedder(), "How many employees does the company have in Europe?")
+    response, _ = cache.get(SETTINGS, "scope", "  how many employees does the company have in EUROPE ")
+    assert response == "cached"
+    assert cache.stats()["hits"] == 1
+
+
+def test_scope_and_settings_must_match():
+    cache = cache_with(HashingEmbedder(), "The battery life is great")
+    assert cache.get(SETTINGS, "other scope", "The battery life is great")[0] is None
+    assert cache.get(("model", 0.0, 256), "scope", "The battery life is great")[0] is None
+
+
+def test_threshold_defaults_to_embedder():
+    assert SemanticCache(embedder=HashingEmbedder()).threshold == HashingEmbedder.threshold
+    assert SemanticCache(embedder=HashingEmbedder(), threshold=0.99).threshold == 0.99
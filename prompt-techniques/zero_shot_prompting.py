@@ -5,32 +5,209 @@ Direct task execution without providing examples to the model.
 Best for: Simple, well-defined tasks where the instruction is clear.
 """
 
-import os
-from groq import Groq
-from dotenv import load_dotenv
 import json
+import inspect
+import argparse
+import asyncio
 from datetime import datetime
 
-load_dotenv()
+from llm_client import get_client, LLMError
+from result_sink import JsonlResultWriter, write_summary
+from run_manifest import RunManifest
+from call_metrics import tagged
+from prompt_packing import classify_packed, number_items, answer_format, match_label
 
 class ZeroShotPrompting:
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.client = get_client()
         self.model = "llama-3.1-8b-instant"
         self.results = []
+        self.sink = None
+        self.keep_results = True
+        self.compress_results = False
+        self.manifest = None
+        self._task_records = None
+        self.concurrency = 8
+        # Batch tasks whose near-duplicate inputs may share answers via the semantic cache:
+        # task -> item -> (scope that must match, text that may vary)
+        self.semantic_keys = {
+            "question_answering": lambda item: (item[0], item[1]),
+            "classification": lambda item: (item[1], item[0]),
+        }
+        # Classification items sharing a category list are labelled up to this many per request.
+        # Off (1) by default: packed requests bypass the per-item semantic cache
+        self.pack_size = 1
     
-    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024) -> str:
+    def call_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                   use_cache: bool = True, semantic_key: tuple = None) -> str:
         """Make API call to Groq"""
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=temperature,
-                max_tokens=max_tokens,
+        return self.client.call_model(prompt, model=self.model, temperature=temperature,
+                                      max_tokens=max_tokens, use_cache=use_cache, semantic_key=semantic_key)
+    
+    async def acall_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                          use_cache: bool = True, semantic_key: tuple = None) -> str:
+        """Make async API call to Groq"""
+        return await self.client.acall_model(prompt, model=self.model, temperature=temperature,
+                                             max_tokens=max_tokens, use_cache=use_cache,
+                                             semantic_key=semantic_key)
+    
+    def stream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                     use_cache: bool = True):
+        """Stream response text from Groq as it is generated"""
+        return self.client.stream_model(prompt, model=self.model, temperature=temperature,
+                                        max_tokens=max_tokens, use_cache=use_cache)
+    
+    def astream_model(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1024,
+                      use_cache: bool = True):
+        """Async-stream response text from Groq as it is generated"""
+        return self.client.astream_model(prompt, model=self.model, temperature=temperature,
+                                         max_tokens=max_tokens, use_cache=use_cache)
+    
+    def sentiment_prompt(self, review: str) -> str:
+        """Build the sentiment analysis prompt for one review"""
+        return f"""Analyze the sentiment of the following review and classify it as: Positive, Negative, or Neutral.
+Also provide a confidence score (0-100) and a brief explanation.
+
+Review: "{review}"
+
+Provide your answer in this format:
+Sentiment: [Your classification]
+Confidence: [Score]
+Explanation: [Brief explanation]"""
+    
+    def translation_prompt(self, item: tuple) -> str:
+        """Build the translation prompt for one (text, target_lang) pair"""
+        text, target_lang = item
+        return f"""Translate the following English text to {target_lang}.
+Provide only the translation, nothing else.
+
+English: "{text}"
+
+{target_lang}:"""
+    
+    def question_answering_prompt(self, item: tuple) -> str:
+        """Build the question answering prompt for one (context, question) pair"""
+        context, question = item
+        return f"""Based on the following context, answer the question concisely and accurately.
+
+Context:
+{context.strip()}
+
+Question: {question}
+
+Answer:"""
+    
+    def classification_prompt(self, item: tuple) -> str:
+        """Build the topic classification prompt for one (article, categories) pair"""
+        article, categories = item
+        return f"""Classify the following article into one of these categories: {categories}
+
+Article: "{article}"
+
+Category:"""
+    
+    def packed_classification_prompt(self, articles: list, categories: str) -> str:
+        """Build one prompt classifying several articles into the same categories"""
+        labels = [c.strip() for c in categories.split(",")]
+        return f"""Classify each of the following articles into one of these categories: {categories}
+
+Articles:
+{number_items([f'"{article}"' for article in articles])}
+
+{answer_format(len(articles), labels)}"""
+    
+    def batch_tasks(self) -> dict:
+        """Batchable tasks: name -> (prompt builder, input label, temperature)"""
+        return {
+            "sentiment_analysis": (self.sentiment_prompt, lambda review: review, 0.3),
+            "language_translation": (self.translation_prompt, lambda item: f"{item[0]} -> {item[1]}", 0.3),
+            "question_answering": (self.question_answering_prompt, lambda item: item[1], 0.2),
+            "classification": (self.classification_prompt, lambda item: item[0], 0.2),
+        }
+    
+    async def arun_batch(self, task: str, inputs: list, concurrency: int = None) -> list:
+        """
+        Run one task over many inputs concurrently. Each record goes to add_result as soon as its
+        call finishes (in completion order, tagged with its input index); the records are also
+        returned in input order while keep_results is on.
+        """
+        build_prompt, describe, temperature = self.batch_tasks()[task]
+        concurrency = concurrency or self.concurrency
+        if task == "classification" and self.pack_size > 1:
+            records, _ = await self.arun_packed_classification(inputs, concurrency)
+            return records
+        semantic_key = self.semantic_keys.get(task)
+        records = [None] * len(inputs) if self.keep_results else None
+        pending = iter(enumerate(inputs))
+        
+        async def worker():
+            for idx, item in pending:
+                record = {"task": task, "index": idx, "input": describe(item), "output": None}
+                try:
+                    key = semantic_key(item) if semantic_key else None
+                    record["output"] = await self.acall_model(build_prompt(item), temperature=temperature,
+                                                              semantic_key=key)
+                    if task == "classification":
+                        # Same shape as packed records: the label, with the full answer kept beside it
+                        labels = [c.strip() for c in item[1].split(",")]
+                        record["response"] = record["output"]
+                        record["output"] = match_label(record["output"], labels) or record["output"].strip()
+                except LLMError as e:
+                    record["error"] = str(e)
+                self.add_result(record)
+                if records is not None:
+                    records[idx] = record
+        
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(inputs)))))
+        return records if records is not None else []
+    
+    async def arun_packed_classification(self, inputs: list, concurrency: int = None) -> tuple:
+        """
+        Classify (article, categories) pairs several per request, falling back per item.
+        Each record goes to add_result as soon as its pack (or fallback call) resolves.
+        Returns (records in input order while keep_results is on, request/fallback counts).
+        """
+        concurrency = concurrency or self.concurrency
+        groups = {}
+        for idx, (article, categories) in enumerate(inputs):
+            groups.setdefault(categories, []).append(idx)
+        
+        records = [None] * len(inputs) if self.keep_results else None
+        totals = {"items": 0, "packed_requests": 0, "fallback_requests": 0}
+        for categories, indexes in groups.items():
+            labels = [c.strip() for c in categories.split(",")]
+            
+            async def call_single(article, categories=categories):
+                item = (article, categories)
+                return await self.acall_model(self.classification_prompt(item), temperature=0.2,
+                                              semantic_key=self.semantic_keys["classification"](item))
+            
+            def emit(position, result, indexes=indexes):
+                idx = indexes[position]
+                record = {"task": "classification", "index": idx, "input": inputs[idx][0], "output": None, **result}
+                self.add_result(record)
+                if records is not None:
+                    records[idx] = record
+            
+            _, stats = await classify_packed(
+                self.acall_model, [inputs[idx][0] for idx in indexes],
+                lambda articles, categories=categories: self.packed_classification_prompt(articles, categories),
+                call_single, labels, max_items=self.pack_size, concurrency=concurrency, on_result=emit,
             )
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+            for key in totals:
+                totals[key] += stats[key]
+        return (records if records is not None else []), totals
+    
+    @staticmethod
+    def display(record: dict) -> str:
+        """Output text for printing, flagging items whose call failed"""
+        if "error" in record:
+            return f"[failed] {record['error']}"
+        return record["output"]
+    
+    def run_batch(self, task: str, inputs: list, concurrency: int = None) -> list:
+        """Blocking wrapper around arun_batch"""
+        return asyncio.run(self.arun_batch(task, inputs, concurrency))
     
     def sentiment_analysis(self):
         """Example 1: Sentiment Analysis"""
@@ -45,27 +222,12 @@ class ZeroShotPrompting:
             "The customer service was outstanding, but the product itself was mediocre.",
         ]
         
-        for idx, review in enumerate(reviews, 1):
-            prompt = f"""Analyze the sentiment of the following review and classify it as: Positive, Negative, or Neutral.
-Also provide a confidence score (0-100) and a brief explanation.
-
-Review: "{review}"
-
-Provide your answer in this format:
-Sentiment: [Your classification]
-Confidence: [Score]
-Explanation: [Brief explanation]"""
-            
+        records = self.run_batch("sentiment_analysis", reviews)
+        
+        for idx, record in enumerate(records, 1):
             print(f"\n--- Review {idx} ---")
-            print(f"Text: {review}")
-            result = self.call_model(prompt, temperature=0.3)
-            print(f"\nAnalysis:\n{result}")
-            
-            self.results.append({
-                "task": "sentiment_analysis",
-                "input": review,
-                "output": result
-            })
+            print(f"Text: {record['input']}")
+            print(f"\nAnalysis:\n{self.display(record)}")
     
     def text_summarization(self):
         """Example 2: Text Summarization"""
@@ -100,7 +262,7 @@ Summary:"""
         result = self.call_model(prompt, temperature=0.5)
         print(f"\nSummary:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "text_summarization",
             "input": article.strip(),
             "output": result
@@ -118,25 +280,13 @@ Summary:"""
             ("Technology is changing the world.", "German"),
         ]
         
-        for idx, (text, target_lang) in enumerate(texts, 1):
-            prompt = f"""Translate the following English text to {target_lang}.
-Provide only the translation, nothing else.
-
-English: "{text}"
-
-{target_lang}:"""
-            
+        records = self.run_batch("language_translation", texts)
+        
+        for idx, ((text, target_lang), record) in enumerate(zip(texts, records), 1):
             print(f"\n--- Translation {idx} ---")
             print(f"English: {text}")
             print(f"Target: {target_lang}")
-            result = self.call_model(prompt, temperature=0.3)
-            print(f"Translation: {result}")
-            
-            self.results.append({
-                "task": "language_translation",
-                "input": f"{text} -> {target_lang}",
-                "output": result
-            })
+            print(f"Translation: {self.display(record)}")
     
     def entity_extraction(self):
         """Example 4: Named Entity Recognition"""
@@ -171,7 +321,7 @@ Provide your answer in a structured format listing each category with the extrac
         result = self.call_model(prompt, temperature=0.2)
         print(f"\nExtracted Entities:\n{result}")
         
-        self.results.append({
+        self.add_result({
             "task": "entity_extraction",
             "input": text.strip(),
             "output": result
@@ -202,26 +352,12 @@ Provide your answer in a structured format listing each category with the extrac
         print(f"\nContext:")
         print(context.strip())
         
-        for idx, question in enumerate(questions, 1):
-            prompt = f"""Based on the following context, answer the question concisely and accurately.
-
-Context:
-{context.strip()}
-
-Question: {question}
-
-Answer:"""
-            
+        records = self.run_batch("question_answering", [(context, question) for question in questions])
+        
+        for idx, record in enumerate(records, 1):
             print(f"\n--- Question {idx} ---")
-            print(f"Q: {question}")
-            result = self.call_model(prompt, temperature=0.2)
-            print(f"A: {result}")
-            
-            self.results.append({
-                "task": "question_answering",
-                "input": question,
-                "output": result
-            })
+            print(f"Q: {record['input']}")
+            print(f"A: {self.display(record)}")
     
     def classification_task(self):
         """Example 6: Multi-class Classification"""
@@ -238,45 +374,103 @@ Answer:"""
         
         categories = "Finance, Science, Sports, Health, Technology, Politics"
         
-        for idx, article in enumerate(articles, 1):
-            prompt = f"""Classify the following article into one of these categories: {categories}
-
-Article: "{article}"
-
-Category:"""
-            
+        items = [(article, categories) for article in articles]
+        if self.pack_size > 1:
+            records, stats = asyncio.run(self.arun_packed_classification(items))
+            print(f"  packed {stats['items']} items into {stats['packed_requests']} requests "
+                  f"({stats['fallback_requests']} per-item fallbacks)")
+        else:
+            records = self.run_batch("classification", items)
+        
+        for idx, record in enumerate(records, 1):
             print(f"\n--- Article {idx} ---")
-            print(f"Text: {article}")
-            result = self.call_model(prompt, temperature=0.2)
-            print(f"Category: {result}")
-            
-            self.results.append({
-                "task": "classification",
-                "input": article,
-                "output": result
-            })
+            print(f"Text: {record['input']}")
+            print(f"Category: {self.display(record)}")
     
-    def save_results(self):
-        """Save all results to a JSON file"""
+    def open_result_sink(self):
+        """Start streaming results to an append-only JSONL file as they complete"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"zero_shot_results_{timestamp}.json"
-        
-        output_data = {
+        filename = f"zero_shot_results_{timestamp}.jsonl" + (".gz" if self.compress_results else "")
+        self.sink = JsonlResultWriter(filename, {
             "technique": "Zero-Shot Prompting",
             "model": self.model,
             "timestamp": timestamp,
-            "total_tasks": len(self.results),
-            "results": self.results
-        }
+            "collection": "results",
+            "count_key": "total_tasks",
+        })
+        print(f"Streaming results to: {filename}")
+    
+    def add_result(self, result: dict):
+        """Record one result, writing it to the sink immediately when one is open"""
+        if self.sink is not None:
+            self.sink.write(result)
+        if self.keep_results:
+            self.results.append(result)
+        if self._task_records is not None:
+            self._task_records.append(result)
+    
+    def open_manifest(self, resume: bool = False):
+        """Checkpoint completed tasks so an interrupted run can pick up where it stopped"""
+        self.manifest = RunManifest("zero_shot_manifest.jsonl", salt=self.model, resume=resume)
+    
+    def run_task(self, method):
+        """Run one example, replaying its results instead if it completed in an earlier run"""
+        with tagged(technique="zero_shot", task=method.__name__):
+            if self.manifest is None:
+                return method()
+            key = method.__name__
+            input_hash = self.manifest.input_hash(inspect.getsource(method))
+            done = self.manifest.get(key, input_hash)
+            if done is not None:
+                print(f"\n[resume] {key} already completed, replaying {len(done)} result(s)")
+                for result in done:
+                    self.add_result(result)
+                return
+            self._task_records = []
+            try:
+                method()
+                self.manifest.record(key, input_hash, self._task_records)
+            finally:
+                self._task_records = None
+    
+    def save_results(self):
+        """Save all results to a JSON file, with token usage and a Prometheus metrics file"""
+        usage = self.client.metrics.summary(technique="zero_shot")
+        if self.client.semantic_cache is not None:
+            usage["semantic_cache"] = self.client.semantic_cache.stats()
+        if self.sink is not None:
+            self.sink.close()
+            filename = self.sink.path.split(".jsonl")[0] + ".json"
+            write_summary(self.sink.path, filename, extra={"usage": usage})
+            self.sink = None
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"zero_shot_results_{timestamp}.json"
+            
+            output_data = {
+                "technique": "Zero-Shot Prompting",
+                "model": self.model,
+                "timestamp": timestamp,
+                "total_tasks": len(self.results),
+                "results": self.results,
+                "usage": usage
+            }
+            
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        metrics_file = filename.rsplit(".json", 1)[0] + ".prom"
+        self.client.metrics.write_prometheus(metrics_file)
+        totals = usage["totals"]
         
         print(f"\n{'='*70}")
         print(f"Results saved to: {filename}")
+        print(f"Metrics saved to: {metrics_file}")
+        print(f"Usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+              f"{totals['completion_tokens']} completion tokens, est. ${totals['cost_usd']:.4f}")
         print(f"{'='*70}")
     
-    def run_all_examples(self):
+    def run_all_examples(self, resume: bool = False):
         """Execute all zero-shot prompting examples"""
         print("\n" + "="*70)
         print("ZERO-SHOT PROMPTING DEMONSTRATION")
@@ -285,12 +479,14 @@ Category:"""
         print("="*70)
         
         try:
-            self.sentiment_analysis()
-            self.text_summarization()
-            self.language_translation()
-            self.entity_extraction()
-            self.question_answering()
-            self.classification_task()
+            self.open_manifest(resume)
+            self.open_result_sink()
+            self.run_task(self.sentiment_analysis)
+            self.run_task(self.text_summarization)
+            self.run_task(self.language_translation)
+            self.run_task(self.entity_extraction)
+            self.run_task(self.question_answering)
+            self.run_task(self.classification_task)
             
             self.save_results()
             
@@ -304,8 +500,16 @@ Category:"""
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Zero-shot prompting examples")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip tasks completed by a previous interrupted run")
+    parser.add_argument("--pack-size", type=int, default=1,
+                        help="classification items per request, e.g. 20 (default 1: no packing)")
+    args = parser.parse_args()
+    
     zero_shot = ZeroShotPrompting()
-    zero_shot.run_all_examples()
+    zero_shot.pack_size = args.pack_size
+    zero_shot.run_all_examples(resume=args.resume)
 
 
 if __name__ == "__main__":